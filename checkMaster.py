@@ -5,7 +5,7 @@
 A script to check the goodness of health of a master PMI file
 
 SYNOPSIS
-$ python checkMaster.py masterDirectory [-e masterExtractDirectory|--masterExtractDir=masterExtractDirectory] [-E|--Extensive] [-m masterDebugKey|--masterDebugKey=masterDebugKey] [-n masterDebugCount|--masterDebugCount=masterDebugCount] [-q|--quick] [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
+$ python checkMaster.py masterDirectory [-e masterExtractDirectory|--masterExtractDir=masterExtractDirectory] [-E|--Extensive] [-S|--SortedNeighbourhood] [-V|--Vectorised] [-W workers|--workers=workers] [-m masterDebugKey|--masterDebugKey=masterDebugKey] [-n masterDebugCount|--masterDebugCount=masterDebugCount] [-k checkpointCount|--checkpointCount=checkpointCount] [-r|--resume] [-x|--estimate] [-N sample|--sample=sample] [-R seed|--seed=seed] [-F|--features] [-U|--rescore] [-q|--quick] [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
 
 
 OPTIONS
@@ -20,12 +20,64 @@ The optional extract sub-directory, of the master directory, containing the extr
 Invoke extensive checking for possible duplicates. Extensive checking can invoke various function on the core data elements (FamilyName, GivenName, Birthdate, Sex)
 plus simple checks of equality for any other field in the master PMI extract file.
 
+-S|--SortedNeighbourhood
+Use the sorted neighbourhood passes, configured in the [ExtensiveNeighbourhood] section of master.cfg, for extensive checking (implies -E)
+Only records that fall within the sliding window, for at least one pass, are compared, rather than comparing every pair of records.
+
+-V|--Vectorised
+Use the vectorised (NumPy) Extensive checking engine, which scores each master record against all the following master records at once (implies -E)
+The vectorised engine computes the same confidences as the standard Extensive checking routines. Requires NumPy.
+If Numba is installed, then the birthdate and exact match checks are run as compiled loops over the integer encoded columns (giving the same confidences).
+
+-W workers|--workers=workers
+The number of worker processes used for extensive checking. Default is 1
+The pairs of master records to be checked are split into tiles, which are handed out to the worker processes as they become free.
+The possible duplicates are reported in the same order as for a single process. Requires an operating system that supports fork.
+
 -m masterDebugKey|--masterDebugKey=masterDebugKey
 The key for triggering logging of information about a specific master record. Default is None
 
 -n masterDebugCount|--masterDebugCount=masterDebugCount
 A counter to trigger progress logging; a progress message is created every masterDebugCount(th) master record. Default is 50000
 
+-k checkpointCount|--checkpointCount=checkpointCount
+Save a checkpoint of the Extensive checking every checkpointCount(th) master record, and when the Extensive checking is finished. Default is 0 (no checkpoints)
+With worker processes a checkpoint is saved as each tile of records is finished (once checkpointCount is not 0).
+The checkpoint ({masterShortName}_checkMaster.checkpoint) is saved next to master.csv and is removed when checkMaster.py finishes.
+
+-r|--resume
+Resume the Extensive checking from the last checkpoint, skipping the records already checked.
+The master PMI extract is read in again, but the checkpoint is only used if the raw master PMI extract, master.csv, the configuration
+and the cleanMaster.py and linkMaster.py routines are unchanged, and the -S and -V options are the same.
+
+-x|--estimate
+Estimate the cost of the Extensive checking, then exit without checking all the pairs of records, creating master.csv or producing any workbooks (requires -E, -S or -V)
+The master PMI extract is read in, any sorted neighbourhood passes are made and the pairs of records to be compared are counted.
+An evenly spaced sample of the records is checked, and timed, to estimate the Extensive checking time, the possible duplicates and the peak memory.
+The estimate, and the largest runs of records with the same sorting key (for -S), are reported in {masterShortName}_checkMaster_Estimate.txt
+
+-N sample|--sample=sample
+Extensively check a random sample of 'sample' master records, each against every other master record, then exit without creating master.csv or the other workbooks (requires -E, -S or -V)
+This is a quick way to tune the [ExtensiveCore] and [ExtensiveFields] weights and the Check Confidence Value. No pair of records is abandoned,
+so the confidence of every pair is counted in the confidence histogram in {masterShortName}_checkMaster_Sample.txt
+The possible duplicates of the sampled records are saved in {masterShortName}_Sample_PossibleDuplicates.xlsx
+
+-R seed|--seed=seed
+The random seed for choosing the sample (-N), so that the same sample can be checked again after changing the configuration. Default is a different sample every run
+
+-F|--features
+Save the features of every pair of records compared in the pair feature cache ({masterShortName}_checkMaster.features, next to master.csv) (requires -E or -S, and not -V, -W, -r, -x or -N)
+The feature of each configured [ExtensiveCore] routine and [ExtensiveFields] field is its confidence, and whether it applied. No pair of records is abandoned,
+and pairs already linked at 100.0 confidence are still compared, so that every pair can be re-scored (-U). The cache takes 24 bytes, plus 9 bytes per feature, for each pair.
+Without sorted neighbourhood checking (-S) every record is compared with every other record, so the cache grows with the square of the number of records
+(10,000 records make almost 50,000,000 pairs of records), and the cache is refused if that would be more than 10,000,000 pairs of records.
+
+-U|--rescore
+Re-score the pair feature cache (-F) with the current [ExtensiveCore] and [ExtensiveFields] weights and Check Confidence Value, using NumPy,
+and regenerate {masterShortName}_PossibleDuplicates.xlsx, without reading the master PMI extract or computing any confidences, then exit.
+The re-scoring, and a confidence histogram of every pair, is reported in {masterShortName}_checkMaster_Rescore.txt
+Weights can be changed, or set to 0, but any other change to the [ExtensiveCore] or [ExtensiveFields] sections requires the cache to be saved again (-F).
+
 -q|--quick
 Just performa a basic check of the master CSV file. Do not check alias or meged links. Do not create the cleaned up master CSV file.
 
@@ -38,6 +90,7 @@ The name of a log file where you want all messages captured.
 
 THE MAIN CODE
 Start by parsing the command line arguements and setting up logging.
+The phonetic codes (NYSIIS, Double Metaphone and Soundex) of each distinct name are saved in phoneticCodes.csv, next to master.csv, and reused by later runs.
 
 Then read in the master PMI extract file and save it as a CSV file and make sure that there are no errors in the master PMI extract.
 Many of the checks are contained in masterDirectory/cleanMaster.py
@@ -47,6 +100,18 @@ merged records have a matching master record and probable duplicates.
 This is based up cleaned up family name and cleaned up given name so there is no guaranttees that they are duplicates.
 No checks of address, medicare number, next of kin or any other secondary identifiers are attempted unless the Extensive option is invoked
 If the Extensive options is involked then a further check is conducted for possible duplicates.
+Records with the same Extensive checking data (names, birthdate, sex, middle names and other fields) are only checked once, and share the possible duplicates found.
+The possible duplicates are grouped into clusters of linked patients (using union-find) and each cluster is reported once, in PossibleDuplicates.xlsx,
+with each patient in the cluster shown against the patient they are most confidently linked to.
+Pairs of records already linked by a chain of 100.0 confidence links are not compared again (by the standard Extensive checking routines,
+as the vectorised engine compares each record against all the following records at once), so a patient with more than one 100.0 confidence link
+may be shown against a different, equally confident, patient when using worker processes or the vectorised engine.
+If worker processes are requested, then the pairs of records are split into tiles and each tile is checked by the next free worker process.
+If an estimate is requested, then the pairs of records are counted and a timed sample of the records is checked, before reporting the estimate and exiting.
+If a sample is requested, then a random sample of the records is checked, before reporting the confidence histogram and the sample's possible duplicates and exiting.
+If the pair feature cache is requested, then the features of every pair of records compared are saved, so that PossibleDuplicates.xlsx can be regenerated with new weights.
+If a re-score is requested, then the pairs in the pair feature cache are re-scored, PossibleDuplicates.xlsx is regenerated and the re-score is reported, before exiting.
+If checkpoints are requested, then the possible duplicates found so far are saved periodically, so that a failed run can be resumed without repeating the Extensive checking.
 
 The function in masterDirectory/cleanMaster.py associated with cleaning up family names, given names, birthdates and gender
 may need editing to reflect any specific anomolies in the PMI extract.
@@ -62,11 +127,13 @@ import argparse
 import logging
 import re
 import datetime
+import multiprocessing
 from importlib.machinery import SourceFileLoader
 from importlib.util import spec_from_loader, module_from_spec
 from openpyxl.styles import NamedStyle
 import data as d
 import functions as f
+import vectors as v
 
 # This next section is plagurised from /usr/include/sysexits.h
 EX_OK = 0        # successful termination
@@ -106,8 +173,18 @@ Then read in the master file and save it as a CSV file, making sure that there a
     parser.add_argument ('masterDir', metavar='masterDirectory', help='The name of directory containg the master configuration and cleanMaster.py routines')
     parser.add_argument ('-e', '--masterExtractDir', dest='masterExtractDir', metavar='masterExtractDirectory', default=None, help='The name of the master directory sub-directory that contains the extract master CSV file and configuration specific to the extract')
     parser.add_argument ('-E', '--Extensive', dest='Extensive', action='store_true', help='Invoke Extensive checking to look for possible duplicates')
+    parser.add_argument ('-S', '--SortedNeighbourhood', dest='SortedNeighbourhood', action='store_true', help='Use sorted neighbourhood passes for Extensive checking (implies -E)')
+    parser.add_argument ('-V', '--Vectorised', dest='Vectorised', action='store_true', help='Use the vectorised (NumPy) Extensive checking engine (implies -E)')
+    parser.add_argument ('-W', '--workers', dest='workers', metavar='workers', type=int, default=1, help='The number of worker processes used for Extensive checking')
     parser.add_argument ('-m', '--masterDebugKey', dest='masterDebugKey', metavar='masterDebugKey', default=None, help='The key for triggering logging of information about a specific master record')
     parser.add_argument ('-n', '--masterDebugCount', dest='masterDebugCount', metavar='masterDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every masterDebugCount(th) master record')
+    parser.add_argument ('-k', '--checkpointCount', dest='checkpointCount', metavar='checkpointCount', type=int, default=0, help='Save a checkpoint every checkpointCount(th) master record extensively checked')
+    parser.add_argument ('-r', '--resume', dest='resume', action='store_true', help='Resume Extensive checking from the last checkpoint')
+    parser.add_argument ('-x', '--estimate', dest='estimate', action='store_true', help='Estimate the cost of the Extensive checking, then exit')
+    parser.add_argument ('-N', '--sample', dest='sample', metavar='sample', type=int, default=0, help='Extensively check a random sample of sample master records, then exit')
+    parser.add_argument ('-R', '--seed', dest='seed', metavar='seed', type=int, default=None, help='The random seed for choosing the sample')
+    parser.add_argument ('-F', '--features', dest='features', action='store_true', help='Save the features of every pair of records compared in the pair feature cache (grows with the square of the number of records without -S)')
+    parser.add_argument ('-U', '--rescore', dest='rescore', action='store_true', help='Re-score the pair feature cache with the current weights, regenerate PossibleDuplicates.xlsx, then exit')
     parser.add_argument ('-q', '--quick', dest='quick', action='store_true', help='Quick check only of the master CSV file')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-o', '--logfile', dest='logfile', metavar='logfile', default=None, help='The name of a logging file')
@@ -130,10 +207,85 @@ Then read in the master file and save it as a CSV file, making sure that there a
 
     d.masterDir = args.masterDir
     d.masterExtractDir = args.masterExtractDir
-    d.Extensive = args.Extensive
+    d.Extensive = args.Extensive or args.SortedNeighbourhood or args.Vectorised
+    d.SortedNeighbourhood = args.SortedNeighbourhood
+    d.Vectorised = args.Vectorised
+    if d.Vectorised and not v.Available():
+        logging.fatal('Vectorised Extensive checking invoked, but NumPy is not installed')
+        sys.exit(EX_UNAVAILABLE)
+    if d.Vectorised:
+        v.SelectKernels()
+    d.workers = args.workers
+    if d.workers < 1:
+        logging.fatal('The number of workers must be at least 1')
+        sys.exit(EX_USAGE)
+    if (d.workers > 1) and ('fork' not in multiprocessing.get_all_start_methods()):
+        logging.fatal('Worker processes requested, but this operating system does not support fork')
+        sys.exit(EX_UNAVAILABLE)
     d.masterDebugKey = args.masterDebugKey
     d.masterDebugCount = args.masterDebugCount
+    d.CheckpointCount = args.checkpointCount
+    if d.CheckpointCount < 0:
+        logging.fatal('The checkpoint count cannot be negative')
+        sys.exit(EX_USAGE)
+    d.resume = args.resume
     d.quick = args.quick
+    d.estimate = args.estimate
+    if d.estimate and (d.quick or not d.Extensive):
+        logging.fatal('Estimating the cost of the Extensive checking requires the -E, -S or -V option (and not -q)')
+        sys.exit(EX_USAGE)
+    d.sample = args.sample
+    d.sampleSeed = args.seed
+    if d.sample < 0:
+        logging.fatal('The sample size cannot be negative')
+        sys.exit(EX_USAGE)
+    if (d.sample > 0) and (d.quick or d.estimate or not d.Extensive):
+        logging.fatal('Sampling the Extensive checking requires the -E, -S or -V option (and not -q or -x)')
+        sys.exit(EX_USAGE)
+    d.features = args.features
+    if d.features:
+        if not d.Extensive:
+            logging.fatal('Saving the pair feature cache requires the -E or -S option')
+            sys.exit(EX_USAGE)
+        if d.Vectorised:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -V option')
+            sys.exit(EX_USAGE)
+        if d.workers > 1:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -W option')
+            sys.exit(EX_USAGE)
+        if d.resume:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -r option')
+            sys.exit(EX_USAGE)
+        if d.quick:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -q option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+    d.rescore = args.rescore
+    if d.rescore:
+        if d.features:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -F option')
+            sys.exit(EX_USAGE)
+        if d.resume:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -r option')
+            sys.exit(EX_USAGE)
+        if d.quick:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -q option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+        if not v.Available():
+            logging.fatal('Re-scoring the pair feature cache invoked, but NumPy is not installed')
+            sys.exit(EX_UNAVAILABLE)
+        d.Extensive = True            # The new weights and Check Confidence Value are in the Extensive checking configuration
 
     # Read in the master configuration file
     f.getMasterConfig(False)
@@ -142,6 +294,9 @@ Then read in the master file and save it as a CSV file, making sure that there a
     if d.masterExtractDir:
         # Read in the extract configuration file
         f.getMasterConfig(True)
+    if d.SortedNeighbourhood and not d.ExtensiveNeighbourhood:
+        logging.fatal('Sorted neighbourhood checking invoked, but no passes configured in the [ExtensiveNeighbourhood] section of ./%s/master.cfg', d.masterDir)
+        sys.exit(EX_CONFIG)
 
     # Assemble the reporting columns
     d.reportingColumns = ['Date of Birth']
@@ -173,6 +328,25 @@ Then read in the master file and save it as a CSV file, making sure that there a
         logging.fatal('importing ./%s/linkMaster.py failed', d.masterDir)
         sys.exit(EX_SOFTWARE)
 
+    # The pair feature cache is saved next to master.csv
+    if d.masterExtractDir:
+        featureFile = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_{d.progName}.features'
+    else:
+        featureFile = f'./{d.masterDir}/{d.masterShortName}_{d.progName}.features'
+
+    # If re-scoring, then regenerate the possible duplicates from the pair feature cache, with the current weights and Check Confidence Value, and exit
+    if d.rescore:
+        d.date_style = NamedStyle(name='Date', number_format='dd-mmm-yyyy')
+        pairs = f.FeatureRead(featureFile)
+        duplicates = f.ExtensiveFanOut(f.FeatureDuplicates(f.FeatureMatches(pairs, True)))
+        if d.masterExtractDir:
+            fileName = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_PossibleDuplicates.xlsx'
+        else:
+            fileName = f'./{d.masterDir}/{d.masterShortName}_PossibleDuplicates.xlsx'
+        (possDuplicateClusters, possDuplicatePatients) = f.PrintDuplicateClusters(duplicates, fileName)
+        f.FeatureReport([f'{possDuplicateClusters}\tGroups of possible duplicate patients [{possDuplicatePatients} patients] (file {d.masterShortName}_PossibleDuplicates.xlsx)'])
+        sys.exit(EX_OK)
+
 
 
     # Open Error file
@@ -189,7 +363,7 @@ Then read in the master file and save it as a CSV file, making sure that there a
     f.openNameCheck('GivenName')
 
     # Open the master.csv output file if we are saving it
-    if not d.quick:
+    if not (d.quick or d.estimate or d.sample):
         try:
             if d.masterExtractDir:
                 d.mfc = open(f'./{d.masterDir}/{d.masterExtractDir}/master.csv', 'wt', newline='')
@@ -204,13 +378,23 @@ Then read in the master file and save it as a CSV file, making sure that there a
         d.mfcCSV = csv.writer(d.mfc, dialect='excel')
         d.mfcCSV.writerow(d.masterSaveTitles)
 
+    # Load the phonetic codes saved by earlier runs
+    if d.masterExtractDir:
+        f.LoadNameCodes(f'{d.masterDir}/{d.masterExtractDir}')
+    else:
+        f.LoadNameCodes(d.masterDir)
+
+    # Create the table for vectorised Extensive checking
+    if d.Vectorised:
+        d.ExtensiveMasterTable = v.ExtensiveTable()
+
     # Process each raw PMI record (after cleaning up things link unprintables etc.)
     familyNamesChecked = 0
     familyNameErrors = 0
     givenNamesChecked = 0
     givenNameErrors = 0
     while d.mc.masterReadRawPMI():
-        if not d.quick:
+        if not (d.quick or d.estimate or d.sample):
             d.mfcCSV.writerow(d.csvfields)
             ocount += 1
 
@@ -311,20 +495,13 @@ Then read in the master file and save it as a CSV file, making sure that there a
 
         # Collect Extensive checking data if required
         if d.Extensive:
-            d.ExtensiveMasterRecKey[d.masterRecNo] = thisUR + '~' + thisKey + '~' + f.Sounds(Mf, Mg)
-            if Mdob == '':
-                d.ExtensiveMasterBirthdate[d.masterRecNo] = d.futureBirthdate
-            else:
-                d.ExtensiveMasterBirthdate[d.masterRecNo] = f.Birthdate(Mdob)
+            d.ExtensiveMasterRecKey[d.masterRecNo] = thisUR + '~' + thisKey
+            Mmn = None
             if d.useMiddleNames:
-                d.ExtensiveMasterMiddleNames[d.masterRecNo] = f.masterField('MiddleNames').upper()
-            thisHash = {}
-            for field in (sorted(d.ExtensiveFields.keys())):
-                if f.masterField(field) == '':
-                    thisHash[field] = None
-                else:
-                    thisHash[field] = hash(f.masterField(field))
-            d.ExtensiveOtherMasterFields[d.masterRecNo] = thisHash
+                Mmn = f.masterField('MiddleNames').upper()
+            d.ExtensiveMasterRecords[d.masterRecNo] = f.ExtensiveRecord(Mf, Mg, Mdob, Msex, Mmn, f.ExtensiveOtherFields(f.masterField))
+            if f.ExtensiveDistinct(d.masterRecNo, d.ExtensiveMasterRecords[d.masterRecNo]) and d.Vectorised:        # Only the distinct records are checked
+                d.ExtensiveMasterTable.append(d.masterRecNo, v.VectorRow(d.ExtensiveMasterRecords[d.masterRecNo]))
 
         # Report progress
         if (d.masterRecNo % d.masterDebugCount) == 0:
@@ -334,6 +511,39 @@ Then read in the master file and save it as a CSV file, making sure that there a
     # Close the raw master PMI file
     d.mc.masterCloseRawPMI()
 
+    # If estimating, then report the estimated cost of the Extensive checking and exit
+    if d.estimate:
+        distinctKeys = f.DistinctRecKeys(d.ExtensiveMasterRecKey)
+        neighbours = None
+        if d.SortedNeighbourhood:
+            neighbours = f.SortedNeighbourhood(distinctKeys, d.ExtensiveMasterRecords)
+        if d.Vectorised:
+            d.ExtensiveMasterTable.finish()
+        f.BuildNameGraph()
+        f.EstimateDuplicates(distinctKeys, d.ExtensiveMasterRecords, d.ExtensiveMasterTable, neighbours)
+        if d.SortedNeighbourhood:
+            f.EstimateReport(f'Pairs of records to be compared using sorted neighbourhood passes [{", ".join(d.ExtensiveNeighbourhood)}] with a window size of {d.ExtensiveWindow}', 'runs of records with the same sorting key', 'records')
+        else:
+            f.EstimateReport('Pairs of records to be compared [every record with every other record]', '', '')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
+    # If sampling, then check the sampled records, report the confidence histogram and exit
+    if d.sample > 0:
+        if d.Vectorised:
+            d.ExtensiveMasterTable.finish()
+        f.BuildNameGraph()
+        if d.masterExtractDir:
+            fileName = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_Sample_PossibleDuplicates.xlsx'
+        else:
+            fileName = f'./{d.masterDir}/{d.masterShortName}_Sample_PossibleDuplicates.xlsx'
+        f.SampleDuplicates(d.ExtensiveMasterRecKey, d.ExtensiveMasterRecords, d.ExtensiveMasterTable, f.DistinctRecKeys(d.ExtensiveMasterRecKey), fileName)
+        f.SampleReport('Master records', 'Pairs of records scored [each sampled record with every other record]', f'{d.masterShortName}_Sample_PossibleDuplicates.xlsx')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
     # If not quick then close the newly created secondary.csv file so that we can re-read it. If quick, then just exit
     if not d.quick:
         d.mfc.close()
@@ -420,127 +630,45 @@ Then read in the master file and save it as a CSV file, making sure that there a
         fileName = f'./{d.masterDir}/{d.masterShortName}_ProbableDuplicates.xlsx'
     f.PrintClose('pdc', 0, 3, fileName)
 
+    # Start checkpointing the Extensive checking, and restore the last checkpoint if resuming
+    if d.Extensive and ((d.CheckpointCount > 0) or d.resume):
+        if d.masterExtractDir:
+            checkpointFile = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_{d.progName}.checkpoint'
+            configFiles = [f'./{d.masterDir}/master.cfg', f'./{d.masterDir}/{d.masterExtractDir}/extract.cfg']
+        else:
+            checkpointFile = f'./{d.masterDir}/{d.masterShortName}_{d.progName}.checkpoint'
+            configFiles = [f'./{d.masterDir}/master.cfg']
+        codeFiles = [f'./{d.masterDir}/cleanMaster.py', f'./{d.masterDir}/linkMaster.py']
+        f.StartCheckpoints(checkpointFile, [d.masterFileName, masterCSV] + configFiles + codeFiles, {'SortedNeighbourhood': d.SortedNeighbourhood, 'Vectorised': d.Vectorised})
+
     # Now look for possible duplicates - if the Extensive options is invoked
-    possDuplicateChecks = 0
+    # The possible duplicates are grouped into clusters of linked patients, and each cluster is reported once
+    # (if saving the pair feature cache, then pairs already linked at 100.0 confidence are still compared, so that they are saved)
+    possDuplicateClusters = 0
+    possDuplicatePatients = 0
     if d.Extensive:
-        f.openPossibleDuplicatesCheck()
-        for rec1 in sorted(d.ExtensiveMasterRecKey):
-            if d.ExtensiveMasterRecKey[rec1] == '':
-                continue
-            (UR1, Mf1, Mg1, Mdob1, Msex1, Mf1ny, Mf1dm,  Mf1sx, Mg1ny, Mg1dm, Mg1sx) = d.ExtensiveMasterRecKey[rec1].split('~')
-            Birthdate1 = d.ExtensiveMasterBirthdate[rec1]
-            OtherFields1 = d.ExtensiveOtherMasterFields[rec1]
-            if d.useMiddleNames:
-                Mm1 = d.ExtensiveMasterMiddleNames[rec1]
-            possDuplicates = {}
-            for rec2 in sorted(d.ExtensiveMasterRecKey):
-                if rec2 <= rec1:
-                    continue
-                if d.ExtensiveMasterRecKey[rec2] == '':
-                    continue
-                (UR2, Mf2, Mg2, Mdob2, Msex2, Mf2ny, Mf2dm, Mf2sx, Mg2ny, Mg2dm, Mg2sx) = d.ExtensiveMasterRecKey[rec2].split('~')
-                if (Mf1 == Mf2) and (Mg1 == Mg2) and (Mdob1 == Mdob2) and (Msex1 == Msex2):
-                    continue
-                Birthdate2 = d.ExtensiveMasterBirthdate[rec2]
-                OtherFields2 = d.ExtensiveOtherMasterFields[rec2]
-                if d.useMiddleNames:
-                    Mm2 = d.ExtensiveMasterMiddleNames[rec2]
-                weight = 1.0
-                if Mf1 == Mf2:
-                    soundFamilyNameConfidence = 100.0
-                else:
-                    (soundFamilyNameConfidence, weight) = f.FamilyNameSoundCheck(Mf1, Mf1ny, Mf1dm, Mf1sx, Mf2, Mf2ny, Mf2dm, Mf2sx, 1.0)
-                if Mg1 == Mg2:
-                    soundGivenNameConfidence = 100.0
-                else:
-                    (soundGivenNameConfidence, weight) = f.GivenNameSoundCheck(Mg1, Mg1ny, Mg1dm, Mg1sx, Mg2, Mg2ny, Mg2dm,  Mg2sx, 1.0)
-                totalConfidence = 0
-                totalWeight = 0
-                for coreRoutine, (thisWeight, thisParam) in d.ExtensiveRoutines.items():
-                    weight = 0.0
-                    confidence = 0.0
-                    if coreRoutine == 'FamilyName':
-                        (confidence, weight) = f.FamilyNameCheck(Mf1, Mf2, thisWeight)
-                    elif coreRoutine == 'FamilyNameSound':
-                        (confidence, weight) = f.FamilyNameSoundCheck(Mf1, Mf1ny, Mf1dm, Mf1sx, Mf2, Mf2ny, Mf2dm, Mf2sx, thisWeight)
-                    elif coreRoutine == 'GivenName':
-                        (confidence, weight) = f.GivenNameCheck(Mg1, Mg2, thisWeight)
-                    elif coreRoutine == 'GivenNameSound':
-                        (confidence, weight) = f.GivenNameSoundCheck(Mg1, Mg1ny, Mg1dm, Mg1sx, Mg2, Mg2ny, Mg2dm, Mg2sx, thisWeight)
-                    elif coreRoutine == 'MiddleNames':
-                        if d.useMiddleNames:
-                            (confidence, weight) = f.MiddleNamesCheck(Mm1, Mm2, thisWeight)
-                    elif coreRoutine == 'MiddleNamesInitial':
-                        if d.useMiddleNames:
-                            (confidence, weight) = f.MiddleNamesInitialCheck(Mm1, Mm2, thisWeight)
-                    elif coreRoutine == 'Sex':
-                        (confidence, weight) = f.SexCheck(Msex1, Msex2, thisWeight)
-                    elif coreRoutine == 'Birthdate':
-                        (confidence, weight) = f.BirthdateCheck(Mdob1, Mdob2, thisWeight)
-                    elif coreRoutine == 'BirthdateNearYear':
-                        (confidence, weight) = f.BirthdateNearYearCheck(Mdob1, Mdob2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateNearMonth':
-                        (confidence, weight) = f.BirthdateNearMonthCheck(Mdob1, Mdob2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateNearDay':
-                        (confidence, weight) = f.BirthdateNearDayCheck(Birthdate1, Birthdate2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateYearSwap':
-                        (confidence, weight) = f.BirthdateYearSwapCheck(Mdob1, Mdob2, thisWeight)
-                    elif coreRoutine == 'BirthdateDayMonthSwap':
-                        (confidence, weight) = f.BirthdateDayMonthSwapCheck(Mdob1, Mdob2, thisWeight)
-                    if weight > 0:
-                        totalConfidence += confidence * weight
-                        totalWeight += weight
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    weight = d.ExtensiveFields[field]
-                    if weight > 0:
-                        if (OtherFields1[field] is not None) and (OtherFields2[field] is not None):
-                            if OtherFields1[field] == OtherFields2[field]:
-                                totalConfidence += 100.0 * weight
-                                totalWeight += weight
-                            else:
-                                totalConfidence += 0.0 * weight
-                                totalWeight += weight
-                if totalWeight == 0:
-                    continue
-                totalConfidence = totalConfidence / totalWeight
-                if totalConfidence >= d.ExtensiveConfidence:
-                    if totalConfidence not in possDuplicates:
-                        possDuplicates[totalConfidence] = []
-                    if Mdob2 == '':
-                        possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Mf2, Mg2, Mdob2, Msex2])
-                    else:
-                        possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Mf2, Mg2, Birthdate2, Msex2])
-            if len(possDuplicates.keys()) > 0:
-                possDuplicateChecks += 1
-                if Mdob1 == '':
-                    line = ['Possible duplcate patient for', UR1, Mf1, Mg1, Mdob1, Msex1]
-                else:
-                    line = ['Possible duplcate patient for', UR1, Mf1, Mg1, Birthdate1, Msex1]
-                d.worksheet['pdc'].append(line)
-                for confidence in (reversed(sorted(possDuplicates))):
-                    for dup in (range(len(possDuplicates[confidence]))):
-                        line = ['', '', '', '', '', '', confidence]
-                        for field in (range(1, len(possDuplicates[confidence][dup]))):
-                            line.append(possDuplicates[confidence][dup][field])
-                        rec2 = possDuplicates[confidence][dup][0]
-                        OtherFields2 = d.ExtensiveOtherMasterFields[rec2]
-                        for field in (sorted(d.ExtensiveFields.keys())):
-                            if (OtherFields1[field] is not None) and (OtherFields2[field] is not None):
-                                if OtherFields1[field] == OtherFields2[field]:
-                                    line.append('match')
-                                else:
-                                    line.append('')
-                            else:
-                                line.append('')
-                        d.worksheet['pdc'].append(line)
-            if ((rec1 + 1) % d.masterDebugCount) == 0:
-                logging.info('%d records extensively checked', rec1 + 1)
-
+        distinctKeys = f.DistinctRecKeys(d.ExtensiveMasterRecKey)
+        neighbours = None
+        if d.SortedNeighbourhood:
+            neighbours = f.SortedNeighbourhood(distinctKeys, d.ExtensiveMasterRecords)
+        if d.Vectorised:
+            d.ExtensiveMasterTable.finish()
+        f.BuildNameGraph()
+        if d.features:
+            if neighbours is None:
+                records = sum(1 for recKey in distinctKeys.values() if recKey != '')
+                f.FeatureCheckSize(records * (records - 1) // 2, 'use sorted neighbourhood checking (-S)')
+            f.FeatureOpen(featureFile)
+        else:
+            d.ExtensiveLinked = f.LinkedRecords()
+        duplicates = f.ExtensiveFanOut(f.ExtensiveDuplicates(distinctKeys, d.ExtensiveMasterRecords, d.ExtensiveMasterTable, neighbours, d.masterDebugCount))
+        if d.features:
+            f.FeatureClose(['ExtensiveMasterRecKey', 'ExtensiveMasterRecords', 'ExtensiveMembers'], 'ExtensiveMasterRecords')
         if d.masterExtractDir:
             fileName = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_PossibleDuplicates.xlsx'
         else:
             fileName = f'./{d.masterDir}/{d.masterShortName}_PossibleDuplicates.xlsx'
-        f.PrintClose('pdc', 1, 4, fileName)
+        (possDuplicateClusters, possDuplicatePatients) = f.PrintDuplicateClusters(duplicates, fileName)
 
     # And finally, create the report
     f.openReport()
@@ -574,10 +702,30 @@ Then read in the master file and save it as a CSV file, making sure that there a
     if probDuplicateChecks > 0:
         d.rpt.write(f'{probDuplicateChecks}\tProbable duplicates [same name/dob/sex - different {d.masterURname}] (file {d.masterShortName}_ProbableDuplicates.xlsx)\n')
     if d.Extensive:
-        if possDuplicateChecks > 0:
-            d.rpt.write(f'{possDuplicateChecks}\tPatients with possible duplicates (file {d.masterShortName}_PossibleDuplicates.xlsx)\n')
+        if possDuplicateClusters > 0:
+            d.rpt.write(f'{possDuplicateClusters}\tGroups of possible duplicate patients [{possDuplicatePatients} patients] (file {d.masterShortName}_PossibleDuplicates.xlsx)\n')
+        f.ReportDistinct()
+        if d.SortedNeighbourhood:
+            d.rpt.write(f'{d.ExtensivePairsCompared}\tPairs of records compared using sorted neighbourhood passes [{", ".join(d.ExtensiveNeighbourhood)}] with a window size of {d.ExtensiveWindow}\n')
+        else:
+            d.rpt.write(f'{d.ExtensivePairsCompared}\tPairs of records compared using extensive checking\n')
+        if d.ExtensivePairsLinked > 0:
+            d.rpt.write(f'{d.ExtensivePairsLinked}\tPairs of records not compared as they were already linked at 100.0 confidence\n')
+        if d.Vectorised:
+            d.rpt.write('\t[the vectorised engine also compares the pairs of records already linked at 100.0 confidence, so the pairs compared may differ from the standard engine]\n')
+        elif (d.workers > 1) and not d.features:
+            d.rpt.write('\t[each worker process only skips the pairs linked by the records it checked, so the pairs compared and linked may vary with the number of workers]\n')
+        if d.features:
+            d.rpt.write(f'{d.FeaturePairs}\tPairs of records saved in the pair feature cache ({d.masterShortName}_{d.progName}.features)\n')
+        f.ReportPruned()
     d.rpt.close()
 
+    # Save any new phonetic codes for later runs
+    f.SaveNameCodes()
+
+    # The run is finished, so there is nothing left to resume
+    f.EndCheckpoints()
+
     # Close the error log csv file and exit
     d.fe.close()
     sys.exit(EX_OK)
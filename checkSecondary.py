@@ -6,9 +6,9 @@ A script to check the goodness of health of a secondary PMI file
 
 SYNOPSIS
 $ python checkSecondary.py secondaryDirectory [-f secondaryExtractDirectory|--secondaryExtractDir=secondaryExtractDirectory]
-                                              [-E|--Extensive] [-s secondaryDebugKey|--secondaryDebugKey=secondaryDebugKey]
+                                              [-E|--Extensive] [-V|--Vectorised] [-W workers|--workers=workers] [-s secondaryDebugKey|--secondaryDebugKey=secondaryDebugKey]
                                               [-t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount]
-                                              [-q|--quick] [-v loggingLevel|--verbose=loggingLevel] [-o logfile|--logfile=logfile]
+                                              [-x|--estimate] [-N sample|--sample=sample] [-R seed|--seed=seed] [-F|--features] [-U|--rescore] [-q|--quick] [-v loggingLevel|--verbose=loggingLevel] [-o logfile|--logfile=logfile]
 
 
 OPTIONS
@@ -23,12 +23,50 @@ The optional extract sub-directory, of the secondary directory, containing the e
 Invoke extensive checking for possible duplicates. Extensive checking can invoke various function on the core data elements (FamilyName, GivenName, Birthdate, Sex)
 plus simple checks of equality for any other field in the master PMI extract file.
 
+-V|--Vectorised
+Use the vectorised (NumPy) Extensive checking engine, which scores each secondary record against all the following secondary records at once (implies -E)
+The vectorised engine computes the same confidences as the standard Extensive checking routines. Requires NumPy.
+If Numba is installed, then the birthdate and exact match checks are run as compiled loops over the integer encoded columns (giving the same confidences).
+
+-W workers|--workers=workers
+The number of worker processes used for extensive checking. Default is 1
+The pairs of secondary records to be checked are split into tiles, which are handed out to the worker processes as they become free.
+The possible duplicates are reported in the same order as for a single process. Requires an operating system that supports fork.
+
 -s secondaryDebugKey|--secondaryDebugKey=secondaryDebugKey
 The key for triggering logging of information about a specific secondary record. Default is None
 
 -t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount
 A counter to trigger progress logging; a progress message is created every secondaryDebugCount(th) secondary record. Default is 50000
 
+-x|--estimate
+Estimate the cost of the Extensive checking, then exit without checking all the pairs of records, creating secondary.csv or producing any workbooks (requires -E or -V)
+The secondary PMI extract is read in and the pairs of records to be compared are counted.
+An evenly spaced sample of the records is checked, and timed, to estimate the Extensive checking time, the possible duplicates and the peak memory.
+The estimate is reported in {secondaryShortName}_checkSecondary_Estimate.txt
+
+-N sample|--sample=sample
+Extensively check a random sample of 'sample' secondary records, each against every other secondary record, then exit without creating secondary.csv or the other workbooks (requires -E or -V)
+This is a quick way to tune the [ExtensiveCore] and [ExtensiveFields] weights and the Check Confidence Value. No pair of records is abandoned,
+so the confidence of every pair is counted in the confidence histogram in {secondaryShortName}_checkSecondary_Sample.txt
+The possible duplicates of the sampled records are saved in {secondaryShortName}_Sample_PossibleDuplicates.xlsx
+
+-R seed|--seed=seed
+The random seed for choosing the sample (-N), so that the same sample can be checked again after changing the configuration. Default is a different sample every run
+
+-F|--features
+Save the features of every pair of records compared in the pair feature cache ({secondaryShortName}_checkSecondary.features, next to secondary.csv) (requires -E, and not -V, -W, -x or -N)
+The feature of each configured [ExtensiveCore] routine and [ExtensiveFields] field is its confidence, and whether it applied. No pair of records is abandoned,
+so that every pair can be re-scored (-U). The cache takes 24 bytes, plus 9 bytes per feature, for each pair.
+Every record is compared with every other record, so the cache grows with the square of the number of records
+(10,000 records make almost 50,000,000 pairs of records), and the cache is refused if that would be more than 10,000,000 pairs of records.
+
+-U|--rescore
+Re-score the pair feature cache (-F) with the current [ExtensiveCore] and [ExtensiveFields] weights and Check Confidence Value, using NumPy,
+and regenerate {secondaryShortName}_PossibleDuplicates.xlsx, without reading the secondary PMI extract or computing any confidences, then exit.
+The re-scoring, and a confidence histogram of every pair, is reported in {secondaryShortName}_checkSecondary_Rescore.txt
+Weights can be changed, or set to 0, but any other change to the [ExtensiveCore] or [ExtensiveFields] sections requires the cache to be saved again (-F).
+
 -q|--quick
 Just performa a basic check of the secondary CSV file. Do not check alias or meged links. Do not create the cleaned up secondary CSV file.
 
@@ -41,6 +79,7 @@ The name of a log file where you want all messages captured.
 
 THE MAIN CODE
 Start by parsing the command line arguements and setting up logging.
+The phonetic codes (NYSIIS, Double Metaphone and Soundex) of each distinct name are saved in phoneticCodes.csv, next to secondary.csv, and reused by later runs.
 
 Then read in the secondary PMI extract file and save it as a CSV file and make sure that there are no errors in the secondary PMI extract.
 Many of the checks are contained in secondaryDirectory/cleanSecondary.py
@@ -50,6 +89,12 @@ merged records have a matching secondary record and probable duplicates.
 This is based up cleaned up family name and cleaned up given name so there is no guaranttees that they are duplicates.
 No checks of address, medicare number, next of kin or any other secondary identifiers are attempted unless the Extensive options is involked.
 If the Extensive options is involked then a further check is conducted for possible duplicates.
+Records with the same Extensive checking data (names, birthdate, sex, middle names and other fields) are only checked once, and share the possible duplicates found.
+If worker processes are requested, then the pairs of records are split into tiles and each tile is checked by the next free worker process.
+If an estimate is requested, then the pairs of records are counted and a timed sample of the records is checked, before reporting the estimate and exiting.
+If a sample is requested, then a random sample of the records is checked, before reporting the confidence histogram and the sample's possible duplicates and exiting.
+If the pair feature cache is requested, then the features of every pair of records compared are saved, so that PossibleDuplicates.xlsx can be regenerated with new weights.
+If re-scoring is requested, then the pair feature cache is re-scored with the current weights, and PossibleDuplicates.xlsx regenerated, without reading the secondary PMI extract.
 
 The function in secondaryDirectory/cleanSecondary.py associated with cleaning up family names, given names, birthdates and gender
 may need editing to reflect any specific anomolies in the PMI extract.
@@ -65,11 +110,13 @@ import argparse
 import logging
 import re
 import datetime
+import multiprocessing
 from importlib.machinery import SourceFileLoader
 from importlib.util import spec_from_loader, module_from_spec
 from openpyxl.styles import NamedStyle
 import data as d
 import functions as f
+import vectors as v
 
 # This next section is plagurised from /usr/include/sysexits.h
 EX_OK = 0        # successful termination
@@ -109,8 +156,15 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
     parser.add_argument ('secondaryDir', metavar='secondaryDirectory', help='The name of directory containg the secondary configuration and cleanSecondary.py routines')
     parser.add_argument ('-f', '--secondaryExtractDir', dest='secondaryExtractDir', metavar='secondaryExtractDirectory', default=None, help='The name of the secondary directory sub-directory that contains the extract secondary CSV file and configuration specific to the extract')
     parser.add_argument ('-E', '--Extensive', dest='Extensive', action='store_true', help='Invoke Extensive checking to look for possible duplicates')
+    parser.add_argument ('-V', '--Vectorised', dest='Vectorised', action='store_true', help='Use the vectorised (NumPy) Extensive checking engine (implies -E)')
+    parser.add_argument ('-W', '--workers', dest='workers', metavar='workers', type=int, default=1, help='The number of worker processes used for Extensive checking')
     parser.add_argument ('-s', '--secondaryDebugKey', dest='secondaryDebugKey', metavar='secondaryDebugKey', default=None, help='The key for triggering logging of information about a specific secondary record')
     parser.add_argument ('-t', '--secondaryDebugCount', dest='secondaryDebugCount', metavar='secondaryDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every secondaryDebugCount(th) secondary record')
+    parser.add_argument ('-x', '--estimate', dest='estimate', action='store_true', help='Estimate the cost of the Extensive checking, then exit')
+    parser.add_argument ('-N', '--sample', dest='sample', metavar='sample', type=int, default=0, help='Extensively check a random sample of sample secondary records, then exit')
+    parser.add_argument ('-R', '--seed', dest='seed', metavar='seed', type=int, default=None, help='The random seed for choosing the sample')
+    parser.add_argument ('-F', '--features', dest='features', action='store_true', help='Save the features of every pair of records compared in the pair feature cache (grows with the square of the number of records)')
+    parser.add_argument ('-U', '--rescore', dest='rescore', action='store_true', help='Re-score the pair feature cache with the current weights, regenerate PossibleDuplicates.xlsx, then exit')
     parser.add_argument ('-q', '--quick', dest='quick', action='store_true', help='Just a basic check of the secondary CSV file')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-o', '--logfile', dest='logfile', metavar='logfile', default=None, help='The name of a logging file')
@@ -133,10 +187,73 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
 
     d.secondaryDir = args.secondaryDir
     d.secondaryExtractDir = args.secondaryExtractDir
-    d.Extensive = args.Extensive
+    d.Extensive = args.Extensive or args.Vectorised
+    d.Vectorised = args.Vectorised
+    if d.Vectorised and not v.Available():
+        logging.fatal('Vectorised Extensive checking invoked, but NumPy is not installed')
+        sys.exit(EX_UNAVAILABLE)
+    if d.Vectorised:
+        v.SelectKernels()
+    d.workers = args.workers
+    if d.workers < 1:
+        logging.fatal('The number of workers must be at least 1')
+        sys.exit(EX_USAGE)
+    if (d.workers > 1) and ('fork' not in multiprocessing.get_all_start_methods()):
+        logging.fatal('Worker processes requested, but this operating system does not support fork')
+        sys.exit(EX_UNAVAILABLE)
     d.secondaryDebugKey = args.secondaryDebugKey
     d.secondaryDebugCount = args.secondaryDebugCount
     d.quick = args.quick
+    d.estimate = args.estimate
+    if d.estimate and (d.quick or not d.Extensive):
+        logging.fatal('Estimating the cost of the Extensive checking requires the -E or -V option (and not -q)')
+        sys.exit(EX_USAGE)
+    d.sample = args.sample
+    d.sampleSeed = args.seed
+    if d.sample < 0:
+        logging.fatal('The sample size cannot be negative')
+        sys.exit(EX_USAGE)
+    if (d.sample > 0) and (d.quick or d.estimate or not d.Extensive):
+        logging.fatal('Sampling the Extensive checking requires the -E or -V option (and not -q or -x)')
+        sys.exit(EX_USAGE)
+    d.features = args.features
+    if d.features:
+        if not d.Extensive:
+            logging.fatal('Saving the pair feature cache requires the -E option')
+            sys.exit(EX_USAGE)
+        if d.Vectorised:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -V option')
+            sys.exit(EX_USAGE)
+        if d.workers > 1:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -W option')
+            sys.exit(EX_USAGE)
+        if d.quick:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -q option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+    d.rescore = args.rescore
+    if d.rescore:
+        if d.features:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -F option')
+            sys.exit(EX_USAGE)
+        if d.quick:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -q option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+        if not v.Available():
+            logging.fatal('Re-scoring the pair feature cache invoked, but NumPy is not installed')
+            sys.exit(EX_UNAVAILABLE)
+        d.Extensive = True            # The new weights and Check Confidence Value are in the Extensive checking configuration
 
     # Read in the secondary configuration file
     f.getSecondaryConfig(False)
@@ -176,6 +293,24 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
         logging.fatal('importing ./%s/linkSecondary.py failed', d.secondaryDir)
         sys.exit(EX_SOFTWARE)
 
+    # The pair feature cache is saved next to secondary.csv
+    if d.secondaryExtractDir:
+        featureFile = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_{d.progName}.features'
+    else:
+        featureFile = f'./{d.secondaryDir}/{d.secondaryShortName}_{d.progName}.features'
+
+    # If re-scoring, then regenerate the possible duplicates from the pair feature cache, with the current weights and Check Confidence Value, and exit
+    if d.rescore:
+        d.date_style = NamedStyle(name='Date', number_format='dd-mmm-yyyy')
+        pairs = f.FeatureRead(featureFile)
+        duplicates = f.ExtensiveFanOut(f.FeatureDuplicates(f.FeatureMatches(pairs, True)))
+        if d.secondaryExtractDir:
+            fileName = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_PossibleDuplicates.xlsx'
+        else:
+            fileName = f'./{d.secondaryDir}/{d.secondaryShortName}_PossibleDuplicates.xlsx'
+        possDuplicateChecks = f.PrintPossibleDuplicates(duplicates, fileName)
+        f.FeatureReport([f'{possDuplicateChecks}\tPossible duplicates (file {d.secondaryShortName}_PossibleDuplicates.xlsx)'])
+        sys.exit(EX_OK)
 
 
     # Open Error file
@@ -195,7 +330,7 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
     f.openNameCheck('GivenName')
 
     # Open the secondary.csv output file if we are saving it
-    if not d.quick:
+    if not (d.quick or d.estimate or d.sample):
         try:
             if d.secondaryExtractDir:
                 d.sfc = open(f'./{d.secondaryDir}/{d.secondaryExtractDir}/secondary.csv', 'wt', newline='')
@@ -210,13 +345,23 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
         d.sfcCSV = csv.writer(d.sfc, dialect='excel')
         d.sfcCSV.writerow(d.secondarySaveTitles)
 
+    # Load the phonetic codes saved by earlier runs
+    if d.secondaryExtractDir:
+        f.LoadNameCodes(f'{d.secondaryDir}/{d.secondaryExtractDir}')
+    else:
+        f.LoadNameCodes(d.secondaryDir)
+
+    # Create the table for vectorised Extensive checking
+    if d.Vectorised:
+        d.ExtensiveSecondaryTable = v.ExtensiveTable()
+
     # Process each raw PMI record (after cleaning up things link unprintables etc.)
     familyNamesChecked = 0
     familyNameErrors = 0
     givenNamesChecked = 0
     givenNameErrors = 0
     while d.sc.secondaryReadRawPMI():
-        if not d.quick:
+        if not (d.quick or d.estimate or d.sample):
             d.sfcCSV.writerow(d.csvfields)
             ocount += 1
 
@@ -317,20 +462,13 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
 
         # Collect Extensive checking data if required
         if d.Extensive:
-            d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = thisUR + '~' + thisKey + '~' + f.Sounds(Sf, Sg)
-            if Sdob == '':
-                d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = d.futureBirthdate
-            else:
-                d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = f.Birthdate(Sdob)
+            d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = thisUR + '~' + thisKey
+            Smn = None
             if d.useMiddleNames:
-                d.ExtensiveSecondaryMiddleNames[d.secondaryRecNo] = f.secondaryField('MiddleNames').upper()
-            thisHash = {}
-            for field in (sorted(d.ExtensiveFields.keys())):
-                if f.secondaryField(field) == '':
-                    thisHash[field] = None
-                else:
-                    thisHash[field] = hash(f.secondaryField(field))
-            d.ExtensiveOtherSecondaryFields[d.secondaryRecNo] = thisHash
+                Smn = f.secondaryField('MiddleNames').upper()
+            d.ExtensiveSecondaryRecords[d.secondaryRecNo] = f.ExtensiveRecord(Sf, Sg, Sdob, Ssex, Smn, f.ExtensiveOtherFields(f.secondaryField))
+            if f.ExtensiveDistinct(d.secondaryRecNo, d.ExtensiveSecondaryRecords[d.secondaryRecNo]) and d.Vectorised:        # Only the distinct records are checked
+                d.ExtensiveSecondaryTable.append(d.secondaryRecNo, v.VectorRow(d.ExtensiveSecondaryRecords[d.secondaryRecNo]))
 
         # Report progress
         if (d.secondaryRecNo % d.secondaryDebugCount) == 0:
@@ -340,6 +478,32 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
     # Close the raw secondary PMI file
     d.sc.secondaryCloseRawPMI()
 
+    # If estimating, then report the estimated cost of the Extensive checking and exit
+    if d.estimate:
+        if d.Vectorised:
+            d.ExtensiveSecondaryTable.finish()
+        f.BuildNameGraph()
+        f.EstimateDuplicates(f.DistinctRecKeys(d.ExtensiveSecondaryRecKey), d.ExtensiveSecondaryRecords, d.ExtensiveSecondaryTable, None)
+        f.EstimateReport('Pairs of records to be compared [every record with every other record]', '', '')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
+    # If sampling, then check the sampled records, report the confidence histogram and exit
+    if d.sample > 0:
+        if d.Vectorised:
+            d.ExtensiveSecondaryTable.finish()
+        f.BuildNameGraph()
+        if d.secondaryExtractDir:
+            fileName = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Sample_PossibleDuplicates.xlsx'
+        else:
+            fileName = f'./{d.secondaryDir}/{d.secondaryShortName}_Sample_PossibleDuplicates.xlsx'
+        f.SampleDuplicates(d.ExtensiveSecondaryRecKey, d.ExtensiveSecondaryRecords, d.ExtensiveSecondaryTable, f.DistinctRecKeys(d.ExtensiveSecondaryRecKey), fileName)
+        f.SampleReport('Secondary records', 'Pairs of records scored [each sampled record with every other record]', f'{d.secondaryShortName}_Sample_PossibleDuplicates.xlsx')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
     # If not quick then close the newly created secondary.csv file so that we can re-read it. If quick, then just exit
     if not d.quick:
         d.sfc.close()
@@ -429,124 +593,21 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
     # Now look for possible duplicates - if the Extensive options is invoked
     possDuplicateChecks = 0
     if d.Extensive:
-        f.openPossibleDuplicatesCheck()
-        for rec1 in sorted(d.ExtensiveSecondaryRecKey):
-            if d.ExtensiveSecondaryRecKey[rec1] == '':
-                continue
-            (UR1, Sf1, Sg1, Sdob1, Ssex1, Sf1ny, Sf1dm, Sf1sx, Sg1ny, Sg1dm, Sg1sx) = d.ExtensiveSecondaryRecKey[rec1].split('~')
-            Birthdate1 = d.ExtensiveSecondaryBirthdate[rec1]
-            OtherFields1 = d.ExtensiveOtherSecondaryFields[rec1]
-            if d.useMiddleNames:
-                Sm1 = d.ExtensiveSecondaryMiddleNames[rec1]
-            possDuplicates = {}
-            for rec2 in sorted(d.ExtensiveSecondaryRecKey):
-                if rec2 <= rec1:
-                    continue
-                if d.ExtensiveSecondaryRecKey[rec2] == '':
-                    continue
-                (UR2, Sf2, Sg2, Sdob2, Ssex2, Sf2ny, Sf2dm, Sf2sx, Sg2ny, Sg2dm, Sg2sx) = d.ExtensiveSecondaryRecKey[rec2].split('~')
-                if (Sf1 == Sf2) and (Sg1 == Sg2) and (Sdob1 == Sdob2) and (Ssex1 == Ssex2):
-                    continue
-                Birthdate2 = d.ExtensiveSecondaryBirthdate[rec2]
-                OtherFields2 = d.ExtensiveOtherSecondaryFields[rec2]
-                if d.useMiddleNames:
-                    Sm2 = d.ExtensiveSecondaryMiddleNames[rec2]
-                weight = 1.0
-                if Sf1 == Sf2:
-                    soundFamilyNameConfidence = 100.0
-                else:
-                    (soundFamilyNameConfidence, weight) = f.FamilyNameSoundCheck(Sf1, Sf1ny, Sf1dm, Sf1sx, Sf2, Sf2ny, Sf2dm, Sf2sx, 1.0)
-                if Sg1 == Sg2:
-                    soundGivenNameConfidence = 100.0
-                else:
-                    (soundGivenNameConfidence, weight) = f.GivenNameSoundCheck(Sg1, Sg1ny, Sg1dm, Sg1sx, Sg2, Sg2ny, Sg2dm, Sg2sx, 1.0)
-                totalConfidence = 0
-                totalWeight = 0
-                for coreRoutine, (thisWeight, thisParam) in d.ExtensiveRoutines.items():
-                    weight = 0.0
-                    confidence = 0.0
-                    if coreRoutine == 'FamilyName':
-                        (confidence, weight) = f.FamilyNameCheck(Sf1, Sf2, thisWeight)
-                    elif coreRoutine == 'FamilyNameSound':
-                        (confidence, weight) = f.FamilyNameSoundCheck(Sf1, Sf1ny, Sf1dm, Sf1sx, Sf2, Sf2ny, Sf2dm, Sf2sx, thisWeight)
-                    elif coreRoutine == 'GivenName':
-                        (confidence, weight) = f.GivenNameCheck(Sg1, Sg2, thisWeight)
-                    elif coreRoutine == 'GivenNameSound':
-                        (confidence, weight) = f.GivenNameSoundCheck(Sg1, Sg1ny, Sg1dm, Sg1sx, Sg2, Sg2ny, Sg2dm, Sg2sx, thisWeight)
-                    elif coreRoutine == 'MiddleNames':
-                        if d.useMiddleNames:
-                            (confidence, weight) = f.MiddleNamesCheck(Sm1, Sm2, thisWeight)
-                    elif coreRoutine == 'MiddleNamesInitial':
-                        if d.useMiddleNames:
-                            (confidence, weight) = f.MiddleNamesInitialCheck(Sm1, Sm2, thisWeight)
-                    elif coreRoutine == 'Sex':
-                        (confidence, weight) = f.SexCheck(Ssex1, Ssex2, thisWeight)
-                    elif coreRoutine == 'Birthdate':
-                        (confidence, weight) = f.BirthdateCheck(Sdob1, Sdob2, thisWeight)
-                    elif coreRoutine == 'BirthdateNearYear':
-                        (confidence, weight) = f.BirthdateNearYearCheck(Sdob1, Sdob2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateNearMonth':
-                        (confidence, weight) = f.BirthdateNearMonthCheck(Sdob1, Sdob2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateNearDay':
-                        (confidence, weight) = f.BirthdateNearDayCheck(Birthdate1, Birthdate2, thisParam, thisWeight)
-                    elif coreRoutine == 'BirthdateYearSwap':
-                        (confidence, weight) = f.BirthdateYearSwapCheck(Sdob1, Sdob2, thisWeight)
-                    elif coreRoutine == 'BirthdateDayMonthSwap':
-                        (confidence, weight) = f.BirthdateDayMonthSwapCheck(Sdob1, Sdob2, thisWeight)
-                    if weight > 0:
-                        totalConfidence += confidence * weight
-                        totalWeight += weight
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    weight = d.ExtensiveFields[field]
-                    if weight > 0:
-                        if (OtherFields1[field] is not None) and (OtherFields2[field] is not None):
-                            if OtherFields1[field] == OtherFields2[field]:
-                                totalConfidence += 100.0 * weight
-                                totalWeight += weight
-                            else:
-                                totalConfidence += 0.0 * weight
-                                totalWeight += weight
-                if totalWeight == 0:
-                    continue
-                totalConfidence = totalConfidence / totalWeight
-                if totalConfidence >= d.ExtensiveConfidence:
-                    if totalConfidence not in possDuplicates:
-                        possDuplicates[totalConfidence] = []
-                    if Sdob2 == '':
-                        possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Sf2, Sg2, Sdob2, Ssex2])
-                    else:
-                        possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Sf2, Sg2, Birthdate2, Ssex2])
-            if len(possDuplicates.keys()) > 0:
-                possDuplicateChecks += 1
-                if Sdob1 == '':
-                    line = ['Possible duplcate patient for', UR1, Sf1, Sg1, Sdob1, Ssex1]
-                else:
-                    line = ['Possible duplcate patient for', UR1, Sf1, Sg1, Birthdate1, Ssex1]
-                d.worksheet['pdc'].append(line)
-                for confidence in (reversed(sorted(possDuplicates))):
-                    for dup in (range(len(possDuplicates[confidence]))):
-                        line = ['', '', '', '', '', '', confidence]
-                        for field in (range(1, len(possDuplicates[confidence][dup]))):
-                            line.append(possDuplicates[confidence][dup][field])
-                        rec2 = possDuplicates[confidence][dup][0]
-                        OtherFields2 = d.ExtensiveOtherSecondaryFields[rec2]
-                        for field in (sorted(d.ExtensiveFields.keys())):
-                            if (OtherFields1[field] is not None) and (OtherFields2[field] is not None):
-                                if OtherFields1[field] == OtherFields2[field]:
-                                    line.append('match')
-                                else:
-                                    line.append('')
-                            else:
-                                line.append('')
-                        d.worksheet['pdc'].append(line)
-            if ((rec1  + 1) % d.secondaryDebugCount) == 0:
-                logging.info('%d records extensively checked', rec1 + 1)
-
+        if d.Vectorised:
+            d.ExtensiveSecondaryTable.finish()
+        f.BuildNameGraph()
+        if d.features:
+            records = sum(1 for recKey in f.DistinctRecKeys(d.ExtensiveSecondaryRecKey).values() if recKey != '')
+            f.FeatureCheckSize(records * (records - 1) // 2, 'check a smaller extract')
+            f.FeatureOpen(featureFile)
+        duplicates = f.ExtensiveFanOut(f.ExtensiveDuplicates(f.DistinctRecKeys(d.ExtensiveSecondaryRecKey), d.ExtensiveSecondaryRecords, d.ExtensiveSecondaryTable, None, d.secondaryDebugCount))
+        if d.features:
+            f.FeatureClose(['ExtensiveSecondaryRecKey', 'ExtensiveSecondaryRecords', 'ExtensiveMembers'], 'ExtensiveSecondaryRecords')
         if d.secondaryExtractDir:
             fileName = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_PossibleDuplicates.xlsx'
         else:
             fileName = f'./{d.secondaryDir}/{d.secondaryShortName}_PossibleDuplicates.xlsx'
-        f.PrintClose('pdc', 1, 4, fileName)
+        possDuplicateChecks = f.PrintPossibleDuplicates(duplicates, fileName)
 
 
     # And finally, create the report
@@ -588,8 +649,17 @@ Then read in the secondary file and save it as a CSV file, making sure that ther
         d.rpt.write(f'{probDuplicateChecks}\tProbable duplicates [same name/dob/sex - different {d.secondaryURname}] (file {d.secondaryShortName}_ProbableDuplicates.xlsx)\n')
     if possDuplicateChecks > 0:
         d.rpt.write(f'{possDuplicateChecks}\tPossible duplicates (file {d.secondaryShortName}_PossibleDuplicates.xlsx)\n')
+    if d.Extensive:
+        f.ReportDistinct()
+        d.rpt.write(f'{d.ExtensivePairsCompared}\tPairs of records compared using extensive checking\n')
+        if d.features:
+            d.rpt.write(f'{d.FeaturePairs}\tPairs of records saved in the pair feature cache ({d.secondaryShortName}_{d.progName}.features)\n')
+        f.ReportPruned()
     d.rpt.close()
 
+    # Save any new phonetic codes for later runs
+    f.SaveNameCodes()
+
     # Close the error log csv file and exit
     d.fe.close()
     sys.exit(EX_OK)
@@ -12,11 +12,22 @@ masterExtractDir = ''        # Master extract directory
 secondaryDir = ''        # Secondary directory
 secondaryExtractDir = ''    # Secondary extract directory
 Extensive=False            # Invoke Extensive checking
+SortedNeighbourhood = False    # Use sorted neighbourhood passes for Extensive checking
+Vectorised = False        # Use the vectorised (NumPy) Extensive checking engine
+workers = 1            # The number of worker processes that share the checking
 masterDebugKey = ''        # Master Debug Key
 masterDebugCount = 50000    # Master Debug Count
 secondaryDebugKey = ''        # Secondary Debug Key
 secondaryDebugCount = 10000    # Secondary Debug Count
 quick = False            # Quick - report file health only
+resume = False            # Resume from the last checkpoint
+estimate = False        # Estimate the cost of the Extensive checking, then exit
+sample = 0            # The number of records to extensively check in a sampled tuning run, then exit (0 - not sampling)
+sampleSeed = None        # The random seed for choosing the sampled records (None - a different sample every run)
+features = False        # Save the feature vector of every pair of records compared in the pair feature cache
+rescore = False            # Re-score the pair feature cache with the current weights and Check Confidence Value, then exit
+TimeBudget = 0.0        # The minutes, from the start of the run, for the Extensive checking (0 - no time budget)
+CheckpointCount = 0        # Save a checkpoint every CheckpointCount(th) record (0 = no checkpoints)
 
 scriptType = ''            # The name of the script
 
@@ -103,19 +114,92 @@ secondarySaveColumns = []    # Column number (counting from 0) of the columns in
 secondarySaveTitles = []    # Column names/titles for the columns (from the extract file) in secondary.csv
 
 ExtensiveConfidence=100.0        # The confidence level that must be reached before possible duplicates/matches are reported
+ExtensiveTopK = 0            # The maximum number of possible Extensive Matches/Finds kept for each secondary record (0 = keep them all)
                     # The valid Extensive checking routines
 DefinedRoutines = ['FamilyName', 'FamilyNameSound', 'GivenName', 'GivenNameSound', 'MiddleNames', 'MiddleNamesInitial', 'Sex', 'Birthdate', 'BirthdateNearYear', 'BirthdateNearMonth', 'BirthdateNearDay', 'BirthdateYearSwap', 'BirthdateDayMonthSwap']
 ExtensiveRoutines = {}            # The configured Extensive checking routines - their weights and possibly their parameter
 ExtensiveFields = {}            # The weights for the 'other fields'
 useMiddleNames = False            # Middle names are being checked
 ExtensiveMasterRecKey = {}        # The record number and key for each master record
-ExtensiveMasterMiddleNames = {}        # the record number and Middle Names for each master record
-ExtensiveMasterBirthdate = {}        # the record number and Birthdate for each master record
-ExtensiveOtherMasterFields = {}        # The record number and hash of the other fields for each master record
+ExtensiveMasterRecords = {}        # The record number and prepared Extensive checking data (functions.ExtensiveRecord) for each master record
 ExtensiveSecondaryRecKey = {}        # The record number and key for each secondary record
-ExtensiveSecondaryMiddleNames = {}    # the record number and Middle Names for each secondary record
-ExtensiveSecondaryBirthdate = {}    # the record number and Birthdate for each secondary record
-ExtensiveOtherSecondaryFields = {}    # The record number and hash of the other fields for each secondary record
+ExtensiveSecondaryRecords = {}        # The record number and prepared Extensive checking data (functions.ExtensiveRecord) for each secondary record
+ExtensiveScorer = None            # The compiled Extensive checking routines and weights (functions.ExtensiveScorer)
+NameGraph = None            # The distinct names in the Extensive checking data and their sound confidences (functions.NameGraph)
+SoundCache = None            # SoundCheck wrapped in a least recently used memo cache (functions.SoundCheckCache)
+SoundBatchSize = 8            # The minimum number of other names for a batch (rapidfuzz) sound check of one name against many
+                    # The valid parts of an Extensive blocking key
+DefinedBlockingParts = ['FamilyName', 'FamilyNameNYSIIS', 'FamilyNameMetaphone', 'FamilyNameSoundex', 'FamilyNameInitial', 'GivenName', 'GivenNameNYSIIS', 'GivenNameMetaphone', 'GivenNameSoundex', 'GivenNameInitial', 'Birthdate', 'BirthYear', 'BirthMonth', 'Sex']
+ExtensiveBlocking = {}            # The configured Extensive blocking keys - Keys: blocking key name, Values: the list of parts
+ExtensiveBlocks = {}            # The Extensive blocks - Keys: blocking key value, Values: the record numbers of the records in this block
+ExtensiveMaxBlock = 0            # The maximum number of records in an Extensive block (0 = no cap) - bigger blocks are split into sub-blocks
+ExtensiveSubBlockParts = []        # The parts used, in turn, to split the Extensive blocks with more than ExtensiveMaxBlock records
+ExtensiveSplitBlocks = {}        # The Extensive blocks that were split - Keys: blocking key value, Values: the part used to split this block into sub-blocks
+ExtensiveSortedBlocks = {}        # The sub-blocks still too big after all the sub-block parts were used - Keys: blocking key value, Values: [sorted sorting keys, matching record numbers]
+ExtensiveCapped = {}            # The Extensive blocks with more than ExtensiveMaxBlock records - Keys: blocking key value, Values: [records, sub-blocks, sorted neighbourhood sub-blocks]
+ExtensiveBlockStats = {}        # The value-frequency statistics for each blocking key - Keys: blocking key name, Values: [blocks, records, records in the largest block]
+DefinedNearParts = ['BirthdateNearDay', 'BirthdateNearMonth', 'BirthdateNearYear']    # Blocking key parts that match a range of birthdates
+DefinedSwapParts = ['BirthdateYearSwap', 'BirthdateDayMonthSwap']    # Blocking key parts that match a birthdate with the year digits, or the day and month, swapped
+ExtensiveNearBlocks = {}        # The Extensive blocks for blocking keys with a BirthdateNear part - Keys: blocking key value, Values: [sorted birthdate day ordinals, matching record numbers]
+ExtensiveNeighbourhood = {}        # The configured sorted neighbourhood passes - Keys: pass name, Values: the list of parts of the sorting key
+ExtensiveWindow = 10            # The width of the sorted neighbourhood sliding window
+ExtensiveMasterTable = None        # The vectorised Extensive checking data for the master records
+ExtensiveSecondaryTable = None        # The vectorised Extensive checking data for the secondary records
+VectorKernels = False        # Use the compiled (Numba) kernels in the vectorised Extensive checking engine (see vectors.SelectKernels)
+StringCodes = {'': 0}            # The shared string dictionary - the integer code for each distinct name, sex, middle names and 'other field' value
+Strings = ['']                # The string for each integer code
+ExtensivePairsCompared = 0        # Count of pairs of records compared using Extensive checking
+ExtensivePairsSkipped = 0        # Count of pairs of records not compared because they did not share an Extensive block
+ExtensiveSecondaryUnblocked = 0        # Count of secondary records with no Extensive blocking key (never compared)
+ExtensiveMasterUnblocked = 0        # Count of master records with no Extensive blocking key (never compared)
+ExtensivePruned = {}            # Count of pairs of records abandoned because they could not reach ExtensiveConfidence - Keys: the routine or 'other field' after which they were abandoned
+ExtensiveCheck = None            # The records being checked for possible duplicates, shared with the worker processes
+ExtensiveDone = 0            # The number of records already checked for possible duplicates (restored from a checkpoint)
+ExtensiveFound = []            # The possible duplicates already found (restored from a checkpoint)
+ExtensiveDistinct = {}            # The first record with each distinct set of Extensive checking data - Keys: (names, birthdate, sex, middle names, 'other fields'), Values: record number
+ExtensiveMembers = {}            # The records with the same Extensive checking data - Keys: the first record number, Values: the list of record numbers (only for data shared by more than one record)
+ExtensiveLinked = None            # The records already linked at 100.0 confidence (a UnionFind), whose pairs are not scored again (None if not linking)
+ExtensivePairsLinked = 0        # Count of pairs of records not scored because they were already linked at 100.0 confidence
+
+EstimateSampleSize = 1000        # The number of records in the timed sample when estimating the cost of the Extensive checking
+EstimateLargestBlocks = 10        # The number of the largest blocks to report when estimating the cost of the Extensive checking
+EstimateRecords = 0            # The number of records to be extensively checked
+EstimatePairs = 0            # The number of candidate pairs of records
+EstimateSampled = 0            # The number of records in the timed sample
+EstimateTime = 0.0            # The seconds taken to extensively check the records in the timed sample
+EstimatePossibles = 0            # The number of possible matches/duplicates found in the timed sample
+EstimateSize = 0            # The bytes of memory holding the possible matches/duplicates found in the timed sample
+EstimateBlocks = {}            # The records and pairs of records for each block - Keys: block, Values: [records, pairs]
+
+SampleBinWidth = 5            # The width, in confidence points, of each bin of the confidence histogram for a sampled tuning run
+SampleRecs = []                # The record numbers of the sampled records
+SamplePID = {}                # The PID of each secondary PMI record that could be sampled (findUR.py) - Keys: record number, Values: PID
+SamplePairs = 0                # The number of pairs of records scored in the sampled tuning run
+SampleHistogram = []            # The number of pairs of records scored (or re-scored from the pair feature cache) in each bin of confidence
+SampleFound = {}            # The number of possible matches/duplicates for each sampled record - Keys: record number, Values: count
+
+FeatureMagic = b'PMIFEAT1'        # The first bytes of a pair feature cache file
+FeatureFile = None            # The open pair feature cache file (None if not saving pair features)
+FeatureStruct = None            # The struct.Struct that packs one pair of records (record numbers, sound confidences, then the confidence and applicable flag of each feature)
+FeaturePairs = 0            # The number of pairs of records in the pair feature cache
+FeatureBlock = 1000000            # The number of pairs of records re-scored at a time
+FeatureMaxPairs = 10000000        # The most pairs of records that can be saved in the pair feature cache when every record is compared with every other record
+FeatureNames = []            # The features (routines and 'other fields') saved in the pair feature cache, in saved order
+FeatureWeights = []            # The current weight of each feature saved in the pair feature cache (0.0 if no longer configured)
+FeatureFound = 0            # The number of re-scored pairs of records at or above the Check Confidence Value
+FeatureMasterRecs = {}            # The master PMI records in the pair feature cache (findUR.py) - Keys: record number, Values: True
+FeatureRows = {}            # The secondary PMI record of each secondary PMI record that could be found (findUR.py) - Keys: record number, Values: d.csvfields
+
+BudgetEnd = None            # The time.monotonic() when the time budget runs out
+BudgetWork = []                # The master PMI records waiting to be extensively checked, best first - [tier, number of candidates, masterRecNo, PID, UR] (re-read when checked)
+BudgetChecked = 0            # The number of master PMI records extensively checked within the time budget
+BudgetLeft = []                # The master PMI records not extensively checked before the time budget ran out - [number of candidates, masterRecNo, PID, UR]
+BudgetSecondaryLeft = set()        # The secondary PMI records that are candidates of the master PMI records not extensively checked
+
+CheckpointFile = None            # The checkpoint file (None if not checkpointing)
+CheckpointSignature = None        # The fingerprints of the input files, configuration and options that the checkpoint is valid for
+CheckpointErrors = 0            # The position in the error log csv file when checkpointing started
+CheckpointRecNo = 0            # The number of master PMI records already checked (restored from a checkpoint)
 
 sc = None            # The name space for the secondaryDir/Clean%secondaryShortName%.py subroutines
 sl = None            # The name space for the secondaryDir/Link%secondaryShortName%.py subroutines
@@ -183,10 +267,16 @@ secondaryPID = []        # The record number for this secondary PID
 keySsx = {}            # The Sounds Like (Soundex) Keys and the record number for this key
 keySdm = {}            # The Sounds Like (Double Metaphone) Keys and the record number for this key
 keySny = {}            # The Sounds Like (NYSIIS) Keys and the record number for this key
+NameCodes = {}            # The phonetic code store - Keys: cleaned name, Values: (NYSIIS, Double Metaphone, Soundex) codes
+NameCodesFile = None        # The file where the phonetic code store is saved between runs
+NameCodesAdded = 0        # Count of names added to the phonetic code store during this run
 key123 = {}            # The Family Name, Sex and DOB Key and the rec. number
 key124 = {}            # The Family Name, Sex and Given Name Key and the rec. no.
 key134 = {}            # The Family Name, DOB and Given Name Key and the rec.rd no.
 key234 = {}            # The Sex, DOB and Given Name Key and the record number
+SpellingDistance = 0        # The maximum edit distance for a spelling match of a name (0 = no spelling matching)
+SpellingFamilyNames = None    # The deletion neighbourhood index of the secondary PMI family names (functions.SpellingIndex)
+SpellingGivenNames = None    # The deletion neighbourhood index of the secondary PMI given names (functions.SpellingIndex)
 masterNewRec = {}        # Record number of the "merged TO" patient
 masterLinkRec = {}        # Record number of the "merged INTO" patient
 masterPrimRec = {}        # Record number of primary for an alias
@@ -219,7 +309,8 @@ recStatus = {}            # The found status
                 # 3 = %Keys124 match
                 # 2 = %Keys134 match
                 # 1 = %Keys234 match
-                # 0 = No Match found
+                # 0 = %Spelling match (similar spelling of Family Name and/or Given Name, DOB and Sex match)
+                # -1 = No Match found
 foundRec = {}            # The found patient record number(s) in the Master PMI file
 foundSound = {}            # Master record sound match for Secondary records
 extras = {}            # The additional information about sound matches
@@ -228,3 +319,4 @@ secondaryRawRecNo = 0        # Record number of raw record read in from to Secon
 secondaryRecNo = 0        # Record no. of record read in from saved Secondary PMI
 possExtensiveMatches = {}    # Possible Extensive Matches for each secondaryRecNo
 possExtensiveFinds = {}        # Possible Extensive Finds for each secondaryRecNo
+possExtensiveOverflow = {}    # Count of the possible Extensive Matches/Finds not kept (beyond ExtensiveTopK) for each secondaryRecNo
@@ -7,10 +7,11 @@ Then read in the master PMI file and check each record looking for any secondary
 
 SYNOPSIS
 $ python findUR.py masterDirectory [-e masterExtractDirectory|--masterExtractDir=masterExtractDirectory]
-                   secondaryDirectory [-f secondaryExtractDirectory|--secondaryExtractDir=secondaryExtractDirectory] [-E|--Extensive]
+                   secondaryDirectory [-f secondaryExtractDirectory|--secondaryExtractDir=secondaryExtractDirectory] [-E|--Extensive] [-V|--Vectorised] [-W workers|--workers=workers]
                    [-m masterDebugKey|--masterDebugKey=masterDebugKey] [-n masterDebugCount|--masterDebugCount=masterDebugCount]
                    [-s secondaryDebugKey|--secondaryDebugKey=secondaryDebugKey] [-t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount]
-                   [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
+                   [-k checkpointCount|--checkpointCount=checkpointCount] [-r|--resume] [-x|--estimate] [-N sample|--sample=sample] [-R seed|--seed=seed]
+                   [-F|--features] [-U|--rescore] [-T timeBudget|--timeBudget=timeBudget] [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
 
 
 OPTIONS
@@ -30,6 +31,16 @@ The optional extract sub-directory, of the secondary directory, containing the e
 Invoke extensive checking for possible duplicates. Extensive checking can invoke various function on the core data elements (FamilyName, GivenName, Birthdate, Sex)
 plus simple checks of equality for any other field in the master and secondary PMI files.
 
+-V|--Vectorised
+Use the vectorised (NumPy) Extensive checking engine, which scores each master record against all the candidate secondary records at once (implies -E)
+The vectorised engine computes the same confidences as the standard Extensive checking routines. Requires NumPy.
+If Numba is installed, then the birthdate and exact match checks are run as compiled loops over the integer encoded columns (giving the same confidences).
+
+-W workers|--workers=workers
+The number of worker processes used to check the master PMI records against the secondary PMI records. Default is 1
+The master PMI file is split into one shard per worker and each worker process checks the records in one shard.
+The results from each shard are merged, giving the same results, in the same order, as a single process. Requires an operating system that supports fork.
+
 -m masterDebugKey|--masterDebugKey=masterDebugKey
 The key for triggering logging of information about a specific master record. Default is None
 
@@ -42,6 +53,55 @@ The key for triggering logging of information about a specific secondary record.
 -t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount
 A counter to trigger progress logging; a progress message is created every secondaryDebugCount(th) secondary record. Default is 50000
 
+-k checkpointCount|--checkpointCount=checkpointCount
+Save a checkpoint every checkpointCount(th) master record checked, and at the end of Pass 2 (checking the master PMI records). Default is 0 (no checkpoints)
+With worker processes the checkpoint is only saved at the end of Pass 2.
+The checkpoint ({secondaryShortName}_findUR.checkpoint) is saved next to secondary.csv and is removed when findUR.py finishes.
+
+-r|--resume
+Resume from the last checkpoint, skipping the master PMI records already checked.
+The secondary PMI file is read in again, but the checkpoint is only used if master.csv, secondary.csv, found.xlsx, notFound.xlsx, matched.xlsx, notMatched.xlsx,
+the configuration and the clean and link routines are unchanged, and the -E and -V options are the same.
+
+-x|--estimate
+Estimate the cost of the Extensive checking, then exit without checking all the master PMI records or producing any workbooks (requires -E or -V)
+The secondary PMI file is read in, the keys and blocks are built and the candidate pairs of records are counted for every master PMI record.
+An evenly spaced sample of the master PMI records is checked, and timed, to estimate the Extensive checking time, the possible matches and the peak memory.
+The estimate, and the largest Extensive blocks, are reported in {secondaryShortName}_findUR_Estimate.txt
+
+-N sample|--sample=sample
+Extensively check a random sample of 'sample' secondary PMI records against every master PMI record, then exit without producing the other workbooks (requires -E or -V)
+(with [ExtensiveBlocking] keys, each sampled secondary PMI record is only checked against the master PMI records that share a block)
+This is a quick way to tune the [ExtensiveCore] and [ExtensiveFields] weights and the Check Confidence Value. No pair of records is abandoned,
+so the confidence of every pair is counted in the confidence histogram in {secondaryShortName}_findUR_Sample.txt
+The possible finds of the sampled secondary PMI records are saved in {secondaryShortName}_Sample_Finds.xlsx
+
+-R seed|--seed=seed
+The random seed for choosing the sample (-N), so that the same sample can be checked again after changing the configuration. Default is a different sample every run
+
+-F|--features
+Save the features of every pair of records compared in the pair feature cache ({secondaryShortName}_findUR.features, next to secondary.csv) (requires -E, and not -V, -W, -r, -x or -N)
+The feature of each configured [ExtensiveCore] routine and [ExtensiveFields] field is its confidence, and whether it applied. No pair of records is abandoned,
+so that every pair can be re-scored (-U). The cache takes 24 bytes, plus 9 bytes per feature, for each pair, plus the details of every master PMI record compared.
+Without [ExtensiveBlocking] keys every master PMI record is compared with every secondary PMI record, so the cache grows with the product of the number of records,
+and the cache is refused if that would be more than 10,000,000 pairs of records.
+
+-U|--rescore
+Re-score the pair feature cache (-F) with the current [ExtensiveCore] and [ExtensiveFields] weights, Check Confidence Value and Extensive Top K, using NumPy,
+and regenerate {secondaryShortName}_Extensive_Finds.xlsx and {secondaryShortName}_Probable_Finds.xlsx, without reading the PMI files or computing any confidences, then exit.
+The re-scoring, and a confidence histogram of every pair, is reported in {secondaryShortName}_findUR_Rescore.txt
+Weights can be changed, or set to 0, but any other change to the [ExtensiveCore] or [ExtensiveFields] sections requires the cache to be saved again (-F).
+
+-T timeBudget|--timeBudget=timeBudget
+The minutes, from the start of the run, that can be spent on Extensive checking (requires -E or -V, and not -W, -k, -r, -x, -N or -F). Default is 0 (no time budget)
+The master PMI records are still all checked against the secondary PMI keys, but the Extensive checking is done best first -
+the master PMI records that matched a secondary PMI record on the full key, a sound key or a partial key first,
+then the master PMI records with the fewest candidate secondary PMI records (the smallest and most specific blocks).
+When the time budget runs out the Extensive checking stops, and the workbooks are created from the possible finds found so far.
+Only the sort keys of each master PMI record are kept in memory, and each master PMI record is re-read when it is extensively checked,
+so the master PMI file must not have records that span lines.
+What was, and was not, extensively checked is reported in {secondaryShortName}_findUR_Coverage.txt
+
 -v loggingLevel|--verbose=loggingLevel
 Set the level of logging that you want.
 
@@ -51,6 +111,7 @@ The name of a log file where you want all messages captured.
 
 THE MAIN CODE
 Start by parsing the command line arguements and setting up logging.
+The phonetic codes (NYSIIS, Double Metaphone and Soundex) of each distinct name are saved in phoneticCodes.csv, next to master.csv, and reused by later runs.
 
 Then read in the Secondary PMI file and create a "key" for each patient that does not have a alternate UR number.
 (If the secondary PMI file contains deleted, merged or alias patients, then we ignore them)
@@ -60,7 +121,22 @@ Next read in the master PMI file and compute the same "key" for each patient.
 The Master PMI file can contains aliases and merged patients.
 We do look for both full and partial matches against aliases and we report the match against the alias as we assume the alias and the
 primary patient are a perfect match. We already know that they have the same UR number, as this has been checked in checkMaster.pl
+If a [SpellingKeys] spelling distance is configured, and no other match is found, then look for secondary patients with a similarly spelt family name and/or given name.
+(The distinct secondary family names and given names are indexed by their deletion variants, so the similarly spelt names are found by looking up the master name's deletion variants)
 If the Extensive checking option is invoked, then compute an overall confidence score good matches based upon the extended matching fields.
+If [ExtensiveBlocking] keys are configured, then each master patient is only compared with the secondary patients that share at least one blocking key.
+Secondary patients with the same Extensive checking data (names, birthdate, sex, middle names and other fields) are only compared once, and share the confidence scores.
+(Blocking keys with a BirthdateNear part are indexed by birthdate, so the secondary patients with a birthdate within range are found with a binary search)
+(Blocking keys with a Birthdate swap part index the secondary patients under their swapped birthdate, so swapped birthdate partners are found with one look up)
+(Blocks bigger than the configured maximum block size are split into sub-blocks, or searched as a sorted neighbourhood, and are listed in the report)
+If worker processes are requested, then each worker process checks one shard of the master PMI file and the results are merged in shard order.
+If an estimate is requested, then the candidate pairs are counted and a timed sample of the master PMI records is checked, before reporting the estimate and exiting.
+If a sample is requested, then a random sample of the secondary PMI records is checked against the master PMI, before reporting the confidence histogram and the sample's possible finds and exiting.
+If checkpoints are requested, then the status of the secondary PMI records, the Extensive finds and the master PMI links are saved periodically,
+so that a failed run can be resumed without re-checking the master PMI records already checked.
+If the pair feature cache is requested, then the features of every pair of records compared are saved, so that the Extensive and Probable Finds can be regenerated with new weights.
+If re-scoring is requested, then the pair feature cache is re-scored with the current weights, and the Extensive and Probable Finds regenerated, without reading the PMI files.
+If a time budget is requested, then the Extensive checking is done best first, at the end of Pass 2, and stops when the time budget runs out.
 
 Determine which patients in the Master PMI file are records of interest. Then re-read the Master PMI file and save the information about patient of interest.
 
@@ -76,11 +152,14 @@ import csv
 import argparse
 import logging
 import re
+import multiprocessing
+import time
 from importlib.machinery import SourceFileLoader
 from importlib.util import spec_from_loader, module_from_spec
 from openpyxl.styles import NamedStyle
 import data as d
 import functions as f
+import vectors as v
 
 # This next section is plagurised from /usr/include/sysexits.h
 EX_OK = 0        # successful termination
@@ -123,10 +202,20 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     parser.add_argument ('-e', '--masterExtractDir', dest='masterExtractDir', metavar='masterExtractDirectory', help='The name of the master directory sub-directory that contains the extract master CSV file and configuration specific to the extract')
     parser.add_argument ('-f', '--secondaryExtractDir', dest='secondaryExtractDir', metavar='secondaryExtractDirectory', help='The name of the secondary directory sub-directory that contains the extract secondary CSV file and configuration specific to the extract')
     parser.add_argument ('-E', '--Extensive', dest='Extensive', action='store_true', help='Invoke Extensive checking to look for possible matches')
+    parser.add_argument ('-V', '--Vectorised', dest='Vectorised', action='store_true', help='Use the vectorised (NumPy) Extensive checking engine (implies -E)')
+    parser.add_argument ('-W', '--workers', dest='workers', metavar='workers', type=int, default=1, help='The number of worker processes used to check the master PMI records')
     parser.add_argument ('-m', '--masterDebugKey', dest='masterDebugKey', metavar='masterDebugKey', help='The key for triggering logging of information about a specific master record')
     parser.add_argument ('-n', '--masterDebugCount', dest='masterDebugCount', metavar='masterDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every masterDebugCount(th) master record')
     parser.add_argument ('-s', '--secondaryDebugKey', dest='secondaryDebugKey', metavar='secondaryDebugKey', help='The key for triggering logging of information about a specific secondary record')
     parser.add_argument ('-t', '--secondaryDebugCount', dest='secondaryDebugCount', metavar='secondaryDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every secondaryDebugCount(th) secondary record')
+    parser.add_argument ('-k', '--checkpointCount', dest='checkpointCount', metavar='checkpointCount', type=int, default=0, help='Save a checkpoint every checkpointCount(th) master record checked')
+    parser.add_argument ('-r', '--resume', dest='resume', action='store_true', help='Resume from the last checkpoint')
+    parser.add_argument ('-x', '--estimate', dest='estimate', action='store_true', help='Estimate the cost of the Extensive checking, then exit')
+    parser.add_argument ('-N', '--sample', dest='sample', metavar='sample', type=int, default=0, help='Extensively check a random sample of sample secondary PMI records, then exit')
+    parser.add_argument ('-R', '--seed', dest='seed', metavar='seed', type=int, default=None, help='The random seed for choosing the sample')
+    parser.add_argument ('-F', '--features', dest='features', action='store_true', help='Save the features of every pair of records compared in the pair feature cache (grows with the product of the number of records without [ExtensiveBlocking])')
+    parser.add_argument ('-U', '--rescore', dest='rescore', action='store_true', help='Re-score the pair feature cache with the current weights, regenerate the Extensive and Probable Finds, then exit')
+    parser.add_argument ('-T', '--timeBudget', dest='timeBudget', metavar='timeBudget', type=float, default=0.0, help='The minutes, from the start of the run, that can be spent on Extensive checking')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-o', '--logfile', dest='logfile', metavar='logfile', help='The name of a logging file')
     args = parser.parse_args()
@@ -150,11 +239,109 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     d.secondaryDir = args.secondaryDir
     d.masterExtractDir = args.masterExtractDir
     d.secondaryExtractDir = args.secondaryExtractDir
-    d.Extensive = args.Extensive
+    d.Extensive = args.Extensive or args.Vectorised
+    d.Vectorised = args.Vectorised
+    if d.Vectorised and not v.Available():
+        logging.fatal('Vectorised Extensive checking invoked, but NumPy is not installed')
+        sys.exit(EX_UNAVAILABLE)
+    if d.Vectorised:
+        v.SelectKernels()
+    d.workers = args.workers
+    if d.workers < 1:
+        logging.fatal('The number of workers must be at least 1')
+        sys.exit(EX_USAGE)
+    if (d.workers > 1) and ('fork' not in multiprocessing.get_all_start_methods()):
+        logging.fatal('Worker processes requested, but this operating system does not support fork')
+        sys.exit(EX_UNAVAILABLE)
     d.masterDebugKey = args.masterDebugKey
     d.masterDebugCount = args.masterDebugCount
     d.secondaryDebugKey = args.secondaryDebugKey
     d.secondaryDebugCount = args.secondaryDebugCount
+    d.CheckpointCount = args.checkpointCount
+    if d.CheckpointCount < 0:
+        logging.fatal('The checkpoint count cannot be negative')
+        sys.exit(EX_USAGE)
+    d.resume = args.resume
+    d.estimate = args.estimate
+    if d.estimate and not d.Extensive:
+        logging.fatal('Estimating the cost of the Extensive checking requires the -E or -V option')
+        sys.exit(EX_USAGE)
+    d.sample = args.sample
+    d.sampleSeed = args.seed
+    if d.sample < 0:
+        logging.fatal('The sample size cannot be negative')
+        sys.exit(EX_USAGE)
+    if (d.sample > 0) and (d.estimate or not d.Extensive):
+        logging.fatal('Sampling the Extensive checking requires the -E or -V option (and not -x)')
+        sys.exit(EX_USAGE)
+    d.features = args.features
+    if d.features:
+        if not d.Extensive:
+            logging.fatal('Saving the pair feature cache requires the -E option')
+            sys.exit(EX_USAGE)
+        if d.Vectorised:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -V option')
+            sys.exit(EX_USAGE)
+        if d.workers > 1:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -W option')
+            sys.exit(EX_USAGE)
+        if d.resume:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -r option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Saving the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+    d.rescore = args.rescore
+    if d.rescore:
+        if d.features:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -F option')
+            sys.exit(EX_USAGE)
+        if d.resume:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -r option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('Re-scoring the pair feature cache cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+        if not v.Available():
+            logging.fatal('Re-scoring the pair feature cache invoked, but NumPy is not installed')
+            sys.exit(EX_UNAVAILABLE)
+        d.Extensive = True            # The new weights and Check Confidence Value are in the Extensive checking configuration
+    d.TimeBudget = args.timeBudget
+    if d.TimeBudget < 0:
+        logging.fatal('The time budget cannot be negative')
+        sys.exit(EX_USAGE)
+    if d.TimeBudget > 0:
+        if not d.Extensive:
+            logging.fatal('A time budget requires the -E or -V option')
+            sys.exit(EX_USAGE)
+        if d.workers > 1:
+            logging.fatal('A time budget cannot be combined with the -W option')
+            sys.exit(EX_USAGE)
+        if d.CheckpointCount > 0:
+            logging.fatal('A time budget cannot be combined with the -k option')
+            sys.exit(EX_USAGE)
+        if d.resume:
+            logging.fatal('A time budget cannot be combined with the -r option')
+            sys.exit(EX_USAGE)
+        if d.estimate:
+            logging.fatal('A time budget cannot be combined with the -x option')
+            sys.exit(EX_USAGE)
+        if d.sample:
+            logging.fatal('A time budget cannot be combined with the -N option')
+            sys.exit(EX_USAGE)
+        if d.features:
+            logging.fatal('A time budget cannot be combined with the -F option')
+            sys.exit(EX_USAGE)
+        if d.rescore:
+            logging.fatal('A time budget cannot be combined with the -U option')
+            sys.exit(EX_USAGE)
+    d.BudgetEnd = time.monotonic() + d.TimeBudget * 60
 
 
     # Read in the extract configuration file if required
@@ -199,6 +386,14 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         # Read in the extract configuration file
         f.getSecondaryConfig(True)
 
+    # Check that the routines for any BirthdateNear blocking key parts are configured
+    if d.Extensive:
+        for blockName, blockParts in d.ExtensiveBlocking.items():
+            for part in blockParts:
+                if (part in d.DefinedNearParts) and (part not in d.ExtensiveRoutines):
+                    logging.fatal('Extensive blocking key "%s" has a %s part, but the %s core data checking routine is not configured', blockName, part, part)
+                    sys.exit(EX_CONFIG)
+
     # Assemble the reporting columns
     d.reportingColumns = []
     d.reportingDates = []
@@ -249,6 +444,38 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         logging.fatal('importing ./%s/linkSecondary.py failed', d.secondaryDir)
         sys.exit(1)
 
+    # The pair feature cache is saved next to secondary.csv
+    if d.secondaryExtractDir:
+        featureFile = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_{d.progName}.features'
+    else:
+        featureFile = f'./{d.secondaryDir}/{d.secondaryShortName}_{d.progName}.features'
+
+    # If re-scoring, then regenerate the Extensive and Probable Finds from the pair feature cache, with the current weights and Check Confidence Value, and exit
+    if d.rescore:
+        d.date_style = NamedStyle(name='Date', number_format='dd-mmm-yyyy')
+        pairs = f.FeatureRead(featureFile)
+        d.possExtensiveFinds = {}
+        for (masterRecNo, secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in f.FeatureMatches(pairs, False):
+            for memberRecNo in d.ExtensiveMembers.get(secRecNo, [secRecNo]):
+                f.SavePossible(d.possExtensiveFinds, memberRecNo, masterRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence)
+        f.PossiblesTopK(d.possExtensiveFinds)
+        f.PrintHeading('ef', 4, 'Checked', 'Identical based upon Extensive checking')
+        f.PrintHeading('pf', 4, 'Checked', 'Similar based upon Extensive checking')
+        d.extensivefound = 0
+        d.probablefound = 0
+        for d.secondaryRecNo, d.csvfields in d.FeatureRows.items():
+            if d.secondaryRecNo in d.possExtensiveFinds:
+                f.PrintExtensiveFinds()
+        if d.secondaryExtractDir:
+            f.PrintClose('ef', 0, 10, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Extensive_Finds.xlsx')
+            f.PrintClose('pf', 0, 10, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Probable_Finds.xlsx')
+        else:
+            f.PrintClose('ef', 0, 10, f'{d.secondaryDir}/{d.secondaryShortName}_Extensive_Finds.xlsx')
+            f.PrintClose('pf', 0, 10, f'{d.secondaryDir}/{d.secondaryShortName}_Probable_Finds.xlsx')
+        f.FeatureReport([f'{d.extensivefound}\tRecords found to be identical, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Extensive_Finds.xlsx)',
+                         f'{d.probablefound}\tRecords found to be similar, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Probable_Finds.xlsx)'])
+        sys.exit(EX_OK)
+
     # Open Error file
     f.openErrorFile()
 
@@ -264,6 +491,12 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     # Read in the Not Matched PIDs - confirmed non-matches - further checking requried
     f.getNotMatched()
 
+    # Load the phonetic codes saved by earlier runs
+    if d.masterExtractDir:
+        f.LoadNameCodes(f'{d.masterDir}/{d.masterExtractDir}')
+    else:
+        f.LoadNameCodes(d.masterDir)
+
 
     # Open the notFoundDone file
     d.date_style = NamedStyle(name='Date', number_format='dd-mmm-yyyy')
@@ -280,6 +513,10 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     d.key124 = {}            # The Family Name, Sex and Given Name Key and the rec. no.
     d.key134 = {}            # The Family Name, DOB and Given Name Key and the rec.rd no.
     d.key234 = {}            # The Sex, DOB and Given Name Key and the record number
+    d.SpellingFamilyNames = f.SpellingIndex()    # The deletion neighbourhood index of the family names
+    d.SpellingGivenNames = f.SpellingIndex()    # The deletion neighbourhood index of the given names
+    if d.Vectorised:
+        d.ExtensiveSecondaryTable = v.ExtensiveTable()
     secondaryCSV = None
     if d.secondaryExtractDir:
         secondaryCSV = f'./{d.secondaryDir}/{d.secondaryExtractDir}/secondary.csv'
@@ -342,8 +579,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
             d.extras[d.secondaryRecNo] = ''
 
             # Now compute the sounds key
-            soundKey = f.Sounds(Sf, Sg)
-            (Sfny, Sfdm, Sfsx, Sgny, Sgdm, Sgsx) = soundKey.split('~')
+            sounds = f.Sounds(Sf, Sg)
+            (Sfny, Sfdm, Sfsx, Sgny, Sgdm, Sgsx) = sounds
             soundKeysx = Sfsx + '~' + Sgsx + '~' + Sdob + '~' + Ssex
             if soundKeysx not in d.keySsx:
                 d.keySsx[soundKeysx] = []
@@ -375,27 +612,45 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                 d.key234[thisKey] = []
             d.key234[thisKey].append(d.secondaryRecNo)
 
+            # Index the names for the spelling keys
+            if d.SpellingDistance > 0:
+                d.SpellingFamilyNames.add(Sf)
+                d.SpellingGivenNames.add(Sg)
+
             if d.Extensive and (pid not in d.foundSecondaryRec) :        # Collect and pack Extensive checking data (if required)
-                d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = f.Sounds(Sf, Sg)
-                if Sdob == '':
-                    d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = d.futureBirthdate
-                else:
-                    d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = f.Birthdate(Sdob)
+                Smn = None
                 if d.useMiddleNames:
-                    d.ExtensiveSecondaryMiddleNames[d.secondaryRecNo] = f.secondaryField('MiddleNames').upper()
-                thisHash = {}
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    fieldData = f.secondaryField(field)
-                    if fieldData == '':
-                        thisHash[field] = None
-                    else:
-                        thisHash[field] = hash(fieldData)
-                d.ExtensiveOtherSecondaryFields[d.secondaryRecNo] = thisHash
+                    Smn = f.secondaryField('MiddleNames').upper()
+                secondaryRecord = f.ExtensiveRecord(Sf, Sg, Sdob, Ssex, Smn, f.ExtensiveOtherFields(f.secondaryField))
+                if f.ExtensiveDistinct(d.secondaryRecNo, secondaryRecord):        # Only the first record with the same Extensive checking data is checked
+                    d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = Sf + '~' + Sg + '~' + Sdob + '~' + Ssex
+                    if d.sample > 0:
+                        d.SamplePID[d.secondaryRecNo] = pid
+                    blockKeys = f.BlockingKeys(Sf, Sg, Sdob, Ssex, sounds) + f.SwapBlockingKeys(Sf, Sg, Sdob, Ssex, sounds, True)
+                    nearKeys = f.NearBlockingKeys(Sf, Sg, Sdob, Ssex, sounds)
+                    if d.ExtensiveBlocking and (len(blockKeys) == 0) and (len(nearKeys) == 0):
+                        d.ExtensiveSecondaryUnblocked += 1
+                    for blockKey in blockKeys:
+                        if blockKey not in d.ExtensiveBlocks:
+                            d.ExtensiveBlocks[blockKey] = []
+                        d.ExtensiveBlocks[blockKey].append(d.secondaryRecNo)
+                    for nearKey, _ in nearKeys:
+                        f.NearBlock(nearKey, d.secondaryRecNo, Sdob)
+                    d.ExtensiveSecondaryRecords[d.secondaryRecNo] = secondaryRecord
+                    if d.Vectorised:
+                        d.ExtensiveSecondaryTable.append(d.secondaryRecNo, v.VectorRow(secondaryRecord))
+
+    if not (d.estimate or d.sample):        # An estimate or a sample doesn't produce these workbooks
+        if d.secondaryExtractDir:
+            f.PrintClose('nf', 0, 5, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_NotFound_Done.xlsx')
+        else:
+            f.PrintClose('nf', 0, 5, f'{d.secondaryDir}/{d.secondaryShortName}_NotFound_Done.xlsx')
 
-    if d.secondaryExtractDir:
-        f.PrintClose('nf', 0, 5, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_NotFound_Done.xlsx')
-    else:
-        f.PrintClose('nf', 0, 5, f'{d.secondaryDir}/{d.secondaryShortName}_NotFound_Done.xlsx')
+    if d.Vectorised:
+        d.ExtensiveSecondaryTable.finish()
+    f.BuildNameGraph()
+    f.NearBlocksIndex()
+    f.CapBlocks()
 
     logging.info('End of Pass 1')
 
@@ -411,6 +666,56 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         masterCSV = f'./{d.masterDir}/{d.masterExtractDir}/master.csv'
     else:
         masterCSV = f'./{d.masterDir}/master.csv'
+
+    # If estimating, then report the estimated cost of the Extensive checking and exit
+    if d.estimate:
+        f.EstimateFind(masterCSV)
+        if d.ExtensiveBlocking:
+            f.EstimateReport(f'Candidate pairs of records that share an Extensive block [{", ".join(d.ExtensiveBlocking)}]', 'Extensive blocks', f'{d.masterLongName} patients')
+        else:
+            f.EstimateReport(f'Candidate pairs of records [every {d.masterLongName} patient with every {d.secondaryLongName} patient]', 'Extensive blocks', f'{d.masterLongName} patients')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
+    # If sampling, then check the sampled secondary PMI records against the master PMI, report the confidence histogram and exit
+    if d.sample > 0:
+        if d.secondaryExtractDir:
+            f.SampleFind(masterCSV, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Sample_Finds.xlsx')
+        else:
+            f.SampleFind(masterCSV, f'{d.secondaryDir}/{d.secondaryShortName}_Sample_Finds.xlsx')
+        if d.ExtensiveBlocking:
+            f.SampleReport('Secondary PMI records', f'Pairs of records scored [each sampled record with every {d.masterLongName} patient that shares an Extensive block]', f'{d.secondaryShortName}_Sample_Finds.xlsx')
+        else:
+            f.SampleReport('Secondary PMI records', f'Pairs of records scored [each sampled record with every {d.masterLongName} patient]', f'{d.secondaryShortName}_Sample_Finds.xlsx')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
+    # Start checkpointing, and restore the last checkpoint if resuming
+    if (d.CheckpointCount > 0) or d.resume:
+        if d.masterExtractDir:
+            inputFiles = [f'./{d.masterDir}/master.cfg', f'./{d.masterDir}/{d.masterExtractDir}/extract.cfg']
+        else:
+            inputFiles = [f'./{d.masterDir}/master.cfg']
+        inputFiles += [f'./{d.masterDir}/cleanMaster.py', f'./{d.masterDir}/linkMaster.py', masterCSV, secondaryCSV]
+        inputFiles += [f'./{d.secondaryDir}/secondary.cfg', f'./{d.secondaryDir}/cleanSecondary.py', f'./{d.secondaryDir}/linkSecondary.py']
+        if d.secondaryExtractDir:
+            secondaryFolder = f'./{d.secondaryDir}/{d.secondaryExtractDir}'
+            inputFiles.append(f'{secondaryFolder}/extract.cfg')
+        else:
+            secondaryFolder = f'./{d.secondaryDir}'
+        inputFiles += [f'{secondaryFolder}/{xlsx}.xlsx' for xlsx in ['found', 'notFound', 'matched', 'notMatched']]
+        f.StartCheckpoints(f'{secondaryFolder}/{d.secondaryShortName}_{d.progName}.checkpoint', inputFiles, {'Extensive': d.Extensive, 'Vectorised': d.Vectorised})
+
+    # Save the features of every pair of records compared, if required
+    if d.features:
+        if not d.ExtensiveBlocking:
+            with open(masterCSV, 'rt') as csvfile:
+                masterRecords = sum(1 for _ in csv.reader(csvfile, dialect='excel')) - 1
+            f.FeatureCheckSize(masterRecords * len(d.ExtensiveSecondaryRecKey), 'configure [ExtensiveBlocking] keys')
+        f.FeatureOpen(featureFile)
+
     with open(masterCSV, 'rt') as csvfile:
         masterPMI = csv.reader(csvfile, dialect='excel')
         d.masterRecNo = 0
@@ -425,6 +730,10 @@ Check the quality of the match and remember the master PMI data. Then re-read th
             if (d.masterRecNo % d.masterDebugCount) == 0:
                 logging.info('%d master PMI records read', d.masterRecNo)
 
+            # Skip the master PMI records checked before the last checkpoint
+            if d.masterRecNo <= d.CheckpointRecNo:
+                continue
+
             # Save alias and merge links for this record
             f.masterSaveLinks()
 
@@ -448,180 +757,24 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                         d.feCSV.writerow([f'{d.progName}:ERROR in found.xlsx:{ur},{d.foundPID[ur]} - {d.secondaryLongName} {d.secondaryPIDname} {secondaryPID} not found'])
 
 
-            # Clean up the Master PMI family name and given name name
-            Mf = d.mc.masterCleanFamilyName()
-            Mg = d.mc.masterCleanGivenName()
-            Mdob = d.mc.masterCleanDOB()
-            Msex = d.mc.masterCleanSex()
-            testKey = False
-            thisKey = Mf + '~' + Mg + '~' + Mdob + '~' + Msex
-            if (d.masterDebugKey) and (d.masterDebugKey == thisKey):
-                logging.info('%s Test Patient:%s:%s:%s', d.masterLongName, pid, ur, thisKey)
-                testKey = True
-
-
-            # Check if this Master PMI file record matches any Secondary PMI records
-            Mfny = Mfdm1 = Mfdm2 = Mfsx = Mgny = Mgdm = Mgsx = My = Mm = Md = masterBirthdate = Mmn = None
-            soundKey = f.Sounds(Mf, Mg)
-            (Mfny, Mfdm, Mfsx, Mgny, Mgdm, Mgsx) = soundKey.split('~')
-            found = False
-            if thisKey in d.fullKey:
-                found = True
-                for secRecNo in d.fullKey[thisKey]:
-                    f.SaveStatus(secRecNo, 6, '')
-
-            # Check for a Sound match
-            if not found:
-                soundFound = ''
-                soundKeydm = Mfdm + '~' + Mgdm+ '~' + Mdob + '~' + Msex
-                if soundKeydm in d.keySdm:
-                    soundFound = '1'
-                else:
-                    soundFound = '0'
-                soundKeyny = Mfny + '~' + Mgny + '~' + Mdob + '~' + Msex
-                if soundKeyny in d.keySny:
-                    soundFound += '1'
-                else:
-                    soundFound += '0'
-                soundKeysx = Mfsx + '~' + Mgsx + '~' + Mdob + '~' + Msex
-                if soundKeysx in d.keySsx:
-                    soundFound += '1'
-                else:
-                    soundFound += '0'
-                if soundFound != '000':
-                    found = True
-                    if soundKeydm in d.keySdm:
-                        for secRecNo in d.keySdm[soundKeydm]:
-                            f.SaveStatus(secRecNo, 5, soundFound)
-                    elif soundKeyny in d.keySny:
-                        for secRecNo in d.keySny[soundKeyny]:
-                            f.SaveStatus(secRecNo, 5, soundFound)
-                    elif soundKeysx in d.keySsx:
-                        for secRecNo in d.keySsx[soundKeysx]:
-                            f.SaveStatus(secRecNo, 5, soundFound)
+            # Check if this Master PMI file record matches any Secondary PMI records (unless worker processes are doing the checking)
+            if d.workers == 1:
+                f.FindMasterRecord()
+                if (d.CheckpointCount > 0) and ((d.masterRecNo % d.CheckpointCount) == 0):
+                    f.CheckpointFind('in Pass 2')
+        masterLines = masterPMI.line_num
 
-            # And finally the four partial keys
-            if not found:
-                thisKey = Mf + '~' + Mg + '~' + Mdob
-                if thisKey in d.key123:
-                    found = True
-                    for secRecNo in d.key123[thisKey]:
-                        f.SaveStatus(secRecNo, 4, '')
-            if not found:
-                thisKey = Mf + '~' + Mg + '~' + Msex
-                if thisKey in d.key124:
-                    found = True
-                    for secRecNo in d.key124[thisKey]:
-                        f.SaveStatus(secRecNo, 3, '')
-            if not found:
-                thisKey = Mf + '~' + Mdob + '~' + Msex
-                if thisKey in d.key134:
-                    found = True
-                    for secRecNo in d.key134[thisKey]:
-                        f.SaveStatus(secRecNo, 2, '')
-            if not found:
-                thisKey = Mg + '~' + Mdob + '~' + Msex
-                if thisKey in d.key234:
-                    found = True
-                    for secRecNo in d.key234[thisKey]:
-                        f.SaveStatus(secRecNo, 1, '')
-
-            # For Extensive checking we compute a confidence level that this master record matches each secondary record
-            # There can be multiple secondary records claiming to be linked to each master record
-            if d.Extensive:
-                if Mdob == '':
-                    masterBirthdate = d.futureBirthdate
-                else:
-                    masterBirthdate = f.Birthdate(Mdob)
-                if d.useMiddleNames:
-                    Mmn = f.masterField('MiddleNames').upper()
-                masterOtherFields = {}
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    fieldData = f.masterField(field)
-                    if fieldData == '':
-                        masterOtherFields[field] = None
-                    else:
-                        masterOtherFields[field] = hash(fieldData)
-                for secRecNo, stringKey in d.ExtensiveSecondaryRecKey.items():
-                    # Unpack the secondary PMI items for this secondary PMI record
-                    (Sfny, Sfdm, Sfsx, Sgny, Sgdm, Sgsx) = stringKey.split('~')
-                    secondaryBirthdate = d.ExtensiveSecondaryBirthdate[secRecNo]
-                    Smn = None
-                    if d.useMiddleNames:
-                        Smn = d.ExtensiveSecondaryMiddleNames[secRecNo]
-                    secondaryOtherFields = d.ExtensiveOtherSecondaryFields[secRecNo]
-                    weight = 1.0
-                    if Mf == Sf:
-                        soundFamilyNameConfidence = 100.0
-                    else:
-                        (soundFamilyNameConfidence, weight) = f.FamilyNameSoundCheck(Mf, Mfny, Mfdm, Mfsx, Sf, Sfny, Sfdm, Sfsx, 1.0)
-                    if Mg == Sg:
-                        soundGivenNameConfidence = 100.0
-                    else:
-                        (soundGivenNameConfidence, weight) = f.GivenNameSoundCheck(Mg, Mgny, Mgdm, Mgsx, Sg, Sgny, Sgdm, Sgsx, 1.0)
-
-                    # Compute the goodness of fit between this secondary record and the master record
-                    totalConfidence = 0
-                    totalWeight = 0
-                    # Start with the things that require algorithms
-                    for coreRoutine, (thisWeight, thisParam) in d.ExtensiveRoutines.items():
-                        weight = 0.0
-                        confidence = 0.0
-                        if coreRoutine == 'FamilyName':
-                            (confidence, weight) = f.FamilyNameCheck(Mf, Sf, thisWeight)
-                        elif coreRoutine == 'FamilyNameSound':
-                            (confidence, weight) = f.FamilyNameSoundCheck(Mf, Mfny, Mfdm, Mfsx, Sf, Sfny, Sfdm, Sfsx, thisWeight)
-                        elif coreRoutine == 'GivenName':
-                            (confidence, weight) = f.GivenNameCheck(Mg, Sg, thisWeight)
-                        elif coreRoutine == 'GivenNameSound':
-                            (confidence, weight) = f.GivenNameSoundCheck(Mg, Mgny, Mgdm, Mgsx, Sg, Sgny, Sgdm, Sgsx, thisWeight)
-                        elif coreRoutine == 'MiddleNames':
-                            if d.useMiddleNames:
-                                (confidence, weight) = f.MiddleNamesCheck(Mmn, Smn, thisWeight)
-                        elif coreRoutine == 'MiddleNamesInitial':
-                            if d.useMiddleNames:
-                                (confidence, weight) = f.MiddleNamesInitialCheck(Mmn, Smn, thisWeight)
-                        elif coreRoutine == 'Sex':
-                            (confidence, weight) = f.SexCheck(Msex, Ssex, thisWeight)
-                        elif coreRoutine == 'Birthdate':
-                            (confidence, weight) = f.BirthdateCheck(Mdob, Sdob, thisWeight)
-                        elif coreRoutine == 'BirthdateNearYear':
-                            (confidence, weight) = f.BirthdateNearYearCheck(Mdob, Sdob, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateNearMonth':
-                            (confidence, weight) = f.BirthdateNearMonthCheck(Mdob, Sdob, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateNearDay':
-                            (confidence, weight) = f.BirthdateNearDayCheck(masterBirthdate, secondaryBirthdate, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateYearSwap':
-                            (confidence, weight) = f.BirthdateYearSwapCheck(Mdob, Sdob, thisWeight)
-                        elif coreRoutine == 'BirthdateDayMonthSwap':
-                            (confidence, weight) = f.BirthdateDayMonthSwapCheck(Mdob, Sdob, thisWeight)
-                        if weight > 0:
-                            totalConfidence += confidence * weight
-                            totalWeight += weight
-                    # Then the things that just need matching (best done on hash values)
-                    for field in (sorted(d.ExtensiveFields.keys())):
-                        weight = d.ExtensiveFields[field]
-                        if weight > 0:
-                            if masterOtherFields[field] and secondaryOtherFields[field]:
-                                if masterOtherFields[field] == secondaryOtherFields[field]:
-                                    totalConfidence += 100.0 * weight
-                                    totalWeight += weight
-                                else:
-                                    totalConfidence += 0.0 * weight
-                                    totalWeight += weight
-                    # Compute the total weight
-                    if totalWeight > 0:
-                        totalConfidence = totalConfidence / totalWeight
-                    # And save this master data against this secondary record if we have an adequate match
-                    # A master record can be matched to multiple secondary records, with varying degrees of confidence (multiple secondary rows with the same AltUR)
-                    # A secondary record can only be matched to multiple master records if there are multiple master records with the same UR!!!
-                    if totalConfidence >= d.ExtensiveConfidence:
-                        if secRecNo not in d.possExtensiveFinds:
-                            d.possExtensiveFinds[secRecNo] = {}
-                        if totalConfidence not in d.possExtensiveFinds[secRecNo]:
-                            d.possExtensiveFinds[secRecNo][totalConfidence] = []
-                        d.possExtensiveFinds[secRecNo][totalConfidence].append([d.masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence])
+    # Check the Master PMI file records using worker processes, each checking one shard of the Master PMI file
+    if (d.workers > 1) and (d.CheckpointRecNo < d.masterRecNo):
+        f.FindMasterShards(masterCSV, d.masterRecNo, masterLines)
+    f.CheckpointFind('at the end of Pass 2')
 
+    # With a time budget, extensively check the master PMI records best first, until the time budget runs out
+    if d.TimeBudget > 0:
+        f.BudgetFind(masterCSV, d.masterRecNo, masterLines)
+
+    # Turn the kept possible Extensive finds back into lists of master records by confidence
+    f.PossiblesTopK(d.possExtensiveFinds)
     logging.info('End of Pass 2')
 
 
@@ -656,7 +809,7 @@ Check the quality of the match and remember the master PMI data. Then re-read th
 
     for secRecNo, confidences in d.possExtensiveFinds.items():
         for confidence in confidences:
-            for i, masterRecNos in enumerate(confidence):
+            for i, masterRecNos in enumerate(confidences[confidence]):
                 masterRecNo = masterRecNos[0]
                 if masterRecNo not in d.wantedMasterRec:
                     # Report progress
@@ -670,6 +823,14 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                         d.wantedMasterRec[d.masterPrimRec[masterRecNo]] = True
                     if masterRecNo in d.masterNewRec:
                         d.wantedMasterRec[d.masterNewRec[masterRecNo]] = True
+
+    # Any master PMI record compared could become a possible find when the pair feature cache is re-scored
+    for masterRecNo in d.FeatureMasterRecs:
+        d.wantedMasterRec[masterRecNo] = True
+        if masterRecNo in d.masterPrimRec:
+            d.wantedMasterRec[d.masterPrimRec[masterRecNo]] = True
+        if masterRecNo in d.masterNewRec:
+            d.wantedMasterRec[d.masterNewRec[masterRecNo]] = True
     logging.info('End of Pass 3')
 
 
@@ -703,7 +864,7 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     f.PrintHeading('nf', 2, 'Checked', 'Message')
     f.PrintHeading('fm', 3, 'Checked', 'Message')
     f.PrintHeading('fa', 3, 'Checked', 'Message')
-    for thisFile in ['f', 'df', 'dpf', 'pfsnd', 'pfnf', 'pfng', 'pfnbd', 'pfnsx']:
+    for thisFile in ['f', 'df', 'dpf', 'pfsnd', 'pfnf', 'pfng', 'pfnbd', 'pfnsx', 'pfspl']:
         f.PrintHeading(thisFile + 'td', 3, 'Checked', 'Message')
         f.PrintHeading(thisFile + 'dn', 3, 'Checked', 'Message')
     f.PrintHeading('ef', 4, 'Checked', 'Identical based upon Extensive checking')
@@ -720,8 +881,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     d.dfounddn = 0        # Count of secondary records with duplicate master records found (Done)
     d.dpfoundtd = 0        # Count of secondary records with duplicate similar master records found
     d.dpfounddn = 0        # Count of secondary records with duplicate similar master records found (Done)
-    d.extensivefind = 0    # Count of identical secondary records found using extensive matching
-    d.probablefind = 0    # Count of similar secondary records found using extensive matching
+    d.extensivefound = 0    # Count of identical secondary records found using extensive matching
+    d.probablefound = 0    # Count of similar secondary records found using extensive matching
     nmatch = 0
     notFound = 0
     dmatch = 0
@@ -736,6 +897,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     pfoundsxdn = 0
     pfoundbd = 0
     pfoundbddn = 0
+    pfoundspl = 0
+    pfoundspldn = 0
     with open(secondaryCSV, 'rt') as csvfile:
         secondaryPMI = csv.reader(csvfile, dialect='excel')
         d.secondaryRecNo = 0
@@ -765,6 +928,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                 continue
 
             withoutAltUR += 1
+            if d.features:        # Keep the secondary PMI record for re-scoring the pair feature cache
+                d.FeatureRows[d.secondaryRecNo] = d.csvfields
 
             # Report the probable finds based upon Extensive checking
             if d.Extensive and (d.secondaryRecNo in d.possExtensiveFinds):
@@ -816,6 +981,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                         f.PrintDuplicateFound('Given Name')
                     elif d.recStatus[d.secondaryRecNo] == 1:
                         f.PrintDuplicateFound('Surname')
+                    elif d.recStatus[d.secondaryRecNo] == 0:
+                        f.PrintDuplicateFound('Spelling')
                 else :                    # Only one, it's an exact or partial match
                     isFound = f.CheckIfFound()
                     if d.recStatus[d.secondaryRecNo] == 6:
@@ -846,6 +1013,11 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                         pfoundf += 1
                         if isFound:
                             pfoundfdn += 1
+                    elif d.recStatus[d.secondaryRecNo] == 0:
+                        f.PrintPartialFound('pfspl', foundMasterRecNo, 'Spelling', foundMasterSound)
+                        pfoundspl += 1
+                        if isFound:
+                            pfoundspldn += 1
 
 
     if d.secondaryExtractDir:
@@ -868,6 +1040,8 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         f.PrintClose('pfngtd', 0, 7, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_SimilarFound_NotGivenName_ToDo.xlsx')
         f.PrintClose('pfnsxdn', 0, 7, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_SimilarFound_NotSex_Done.xlsx')
         f.PrintClose('pfnsxtd', 0, 7, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_SimilarFound_NotSex_ToDo.xlsx')
+        f.PrintClose('pfspldn', 0, 7, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_SimilarFound_Spelling_Done.xlsx')
+        f.PrintClose('pfspltd', 0, 7, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_SimilarFound_Spelling_ToDo.xlsx')
         f.PrintClose('ef', 0, 10, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Extensive_Finds.xlsx')
         f.PrintClose('pf', 0, 10, f'{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_Probable_Finds.xlsx')
     else:
@@ -890,11 +1064,17 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         f.PrintClose('pfngtd', 0, 7, f'{d.secondaryDir}/{d.secondaryShortName}_SimilarFound_NotGivenName_ToDo.xlsx')
         f.PrintClose('pfnsxdn', 0, 7, f'{d.secondaryDir}/{d.secondaryShortName}_SimilarFound_NotSex_Done.xlsx')
         f.PrintClose('pfnsxtd', 0, 7, f'{d.secondaryDir}/{d.secondaryShortName}_SimilarFound_NotSex_ToDo.xlsx')
+        f.PrintClose('pfspldn', 0, 7, f'{d.secondaryDir}/{d.secondaryShortName}_SimilarFound_Spelling_Done.xlsx')
+        f.PrintClose('pfspltd', 0, 7, f'{d.secondaryDir}/{d.secondaryShortName}_SimilarFound_Spelling_ToDo.xlsx')
         f.PrintClose('ef', 0, 10, f'{d.secondaryDir}/{d.secondaryShortName}_Extensive_Finds.xlsx')
         f.PrintClose('pf', 0, 10, f'{d.secondaryDir}/{d.secondaryShortName}_Probable_Finds.xlsx')
 
     logging.info('End of Pass 5')
 
+    # Finish the pair feature cache with everything needed to regenerate the Extensive and Probable Finds
+    if d.features:
+        f.FeatureClose(['ExtensiveMembers', 'FeatureRows', 'masterDetails', 'masterNewRec', 'masterPrimRec'], None)
+
 
 
     # Now printout the report
@@ -1011,6 +1191,14 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         if (pfoundsnd - pfoundsnddn) > 0:
             d.rpt.write(f'\t\t[{pfoundsnd - pfoundsnddn} to be checked] ({d.secondaryShortName}_SimilarFound_OnSound_ToDo.xlsx)\n')
         last += 1
+    if pfoundspl > 0:
+        d.rpt.write(f'{pfoundspl}\t{d.secondaryLongName} patients found to be similar to one {d.masterLongName} patient\n')
+        d.rpt.write(f'\t\tmatched on birth date, sex and the spelling of surname and firstname [within {d.SpellingDistance} edits]\n')
+        if pfoundspldn > 0:
+            d.rpt.write(f'\t\t[{pfoundspldn} already checked - found.xlsx] ({d.secondaryShortName}_SimilarFound_Spelling_Done.xlsx)\n')
+        if (pfoundspl - pfoundspldn) > 0:
+            d.rpt.write(f'\t\t[{pfoundspl - pfoundspldn} to be checked] ({d.secondaryShortName}_SimilarFound_Spelling_ToDo.xlsx)\n')
+        last += 1
     d.rpt.write('\nNOTE: The ')
     if last == 1:
         d.rpt.write('last number should equal ')
@@ -1044,11 +1232,35 @@ Check the quality of the match and remember the master PMI data. Then re-read th
 
     # Report the possible matches based upon Extensive checking
     if d.Extensive:
-        d.rpt.write(f'{d.extensivefind}\tRecords found to be identical, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Extensive_Finds.xlsx)\n')
-        d.rpt.write(f'{d.probablefind}\tRecords found to be similar, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Probable_Finds.xlsx)\n')
+        d.rpt.write(f'{d.extensivefound}\tRecords found to be identical, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Extensive_Finds.xlsx)\n')
+        d.rpt.write(f'{d.probablefound}\tRecords found to be similar, using extensive matching, to patients in {d.masterLongName} ({d.secondaryShortName}_Probable_Finds.xlsx)\n')
+        d.rpt.write('\n')
+        f.ReportDistinct()
+        d.rpt.write(f'{d.ExtensivePairsCompared}\tPairs of records compared using extensive matching\n')
+        d.rpt.write(f'{d.ExtensivePairsSkipped}\tPairs of records not compared as they did not share an [ExtensiveBlocking] block\n')
+        if d.ExtensiveBlocking:
+            d.rpt.write(f'{d.ExtensiveSecondaryUnblocked}\tRecords with no [ExtensiveBlocking] key (e.g. no Birthdate), which were not compared with any patient in {d.masterLongName}\n')
+            d.rpt.write(f'{d.ExtensiveMasterUnblocked}\tPatients in {d.masterLongName} with no [ExtensiveBlocking] key (e.g. no Birthdate), which were not compared with any record\n')
+        if d.features:
+            d.rpt.write(f'{d.FeaturePairs}\tPairs of records saved in the pair feature cache ({d.secondaryShortName}_{d.progName}.features)\n')
+        if d.TimeBudget > 0:
+            d.rpt.write(f'{len(d.BudgetLeft)}\t{d.masterLongName} patients not extensively checked before the time budget of {d.TimeBudget:g} minutes ran out ({d.secondaryShortName}_{d.progName}_Coverage.txt)\n')
+        f.ReportCapped()
+        f.ReportPruned()
+        f.ReportOverflow()
 
     d.rpt.close()
 
+    # Report the coverage of the time budgeted Extensive checking
+    if d.TimeBudget > 0:
+        f.BudgetReport()
+
+    # Save any new phonetic codes for later runs
+    f.SaveNameCodes()
+
+    # The run is finished, so there is nothing left to resume
+    f.EndCheckpoints()
+
     # Close the error log csv file and exit
     d.fe.close()
     sys.exit(0)
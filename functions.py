@@ -4,17 +4,38 @@
 
 import os
 import sys
+import io
 import logging
 import csv
 import re
 import datetime
+import functools
+import hashlib
+import heapq
+import importlib.metadata
+import multiprocessing
+import pickle
+import random
+import struct
+import time
+from bisect import bisect_left, bisect_right
 from configparser import ConfigParser as ConfParser
 from configparser import MissingSectionHeaderError, NoSectionError, NoOptionError, ParsingError
 from openpyxl import Workbook
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 from jellyfish import soundex, nysiis, metaphone, levenshtein_distance, jaro_winkler_similarity
+try:
+    from rapidfuzz.process import cdist
+    from rapidfuzz.distance import Levenshtein, JaroWinkler
+except ImportError:
+    cdist = None
+try:
+    import resource
+except ImportError:
+    resource = None
 import data as d
+import vectors as v
 
 # This next section is plagurised from /usr/include/sysexits.h
 EX_OK = 0        # successful termination
@@ -144,6 +165,15 @@ After reading in the configuration data, check that it defines a valid configuat
         if d.Extensive:
             if config.has_option('ExtensiveConfidence', 'Check Confidence Value') or not extractDir:
                 d.ExtensiveConfidence = config.getfloat('ExtensiveConfidence', 'Check Confidence Value')
+            if config.has_option('ExtensiveConfidence', 'Maximum Candidates'):
+                try:
+                    d.ExtensiveTopK = config.getint('ExtensiveConfidence', 'Maximum Candidates')
+                except (ValueError) as e:
+                    logging.fatal('Bad Maximum Candidates (%s) in the [ExtensiveConfidence] section of ./%s/master.cfg: %s', config.get('ExtensiveConfidence', 'Maximum Candidates'), d.masterDir, e)
+                    sys.exit(EX_CONFIG)
+                if d.ExtensiveTopK < 0:
+                    logging.fatal('Bad Maximum Candidates (%d) in the [ExtensiveConfidence] section of ./%s/master.cfg - cannot be negative', d.ExtensiveTopK, d.masterDir)
+                    sys.exit(EX_CONFIG)
             if config.has_section('ExtensiveCore'):
                 d.ExtensiveRoutines = {}
                 ExtensiveCore = config.items('ExtensiveCore')
@@ -181,7 +211,7 @@ After reading in the configuration data, check that it defines a valid configuat
                                     sys.exit(EX_CONFIG)
                                 else:
                                     d.useMiddleNames = True
-                            d.ExtensiveRoutines[item[0]] = w
+                            d.ExtensiveRoutines[item[0]] = (w, None)
             if config.has_section('ExtensiveFields'):
                 d.ExtensiveFields = {}
                 ExtensiveFields = config.items('ExtensiveFields')
@@ -196,6 +226,68 @@ After reading in the configuration data, check that it defines a valid configuat
                         sys.exit(EX_CONFIG)
                     if w != 0:
                         d.ExtensiveFields[item[0]] = w
+            if config.has_section('ExtensiveBlocking'):
+                d.ExtensiveBlocking = {}
+                ExtensiveBlocking = config.items('ExtensiveBlocking')
+                for item in (ExtensiveBlocking):
+                    if item[0] == 'maximum block size':
+                        try:
+                            d.ExtensiveMaxBlock = int(item[1])
+                        except (ValueError) as e:
+                            logging.fatal('Extensive blocking with bad maximum block size (%s) in ./%s/master.cfg: %s', item[1], d.masterDir, e)
+                            sys.exit(EX_CONFIG)
+                        if d.ExtensiveMaxBlock < 0:
+                            logging.fatal('Extensive blocking maximum block size (%s) in ./%s/master.cfg cannot be negative', item[1], d.masterDir)
+                            sys.exit(EX_CONFIG)
+                        continue
+                    if item[0] == 'sub block parts':
+                        d.ExtensiveSubBlockParts = []
+                        for part in item[1].split(','):
+                            part = part.strip()
+                            if part not in d.DefinedBlockingParts:
+                                logging.fatal('Extensive blocking sub block parts with unknown part (%s) in ./%s/master.cfg', part, d.masterDir)
+                                sys.exit(EX_CONFIG)
+                            d.ExtensiveSubBlockParts.append(part)
+                        continue
+                    parts = []
+                    nearParts = 0
+                    for part in item[1].split(','):
+                        part = part.strip()
+                        if (part in d.DefinedNearParts) or (part in d.DefinedSwapParts):
+                            nearParts += 1
+                        elif part not in d.DefinedBlockingParts:
+                            logging.fatal('Extensive blocking key "%s" with unknown part (%s) in ./%s/master.cfg', item[0], part, d.masterDir)
+                            sys.exit(EX_CONFIG)
+                        parts.append(part)
+                    if nearParts > 1:
+                        logging.fatal('Extensive blocking key "%s" with more than one BirthdateNear or Birthdate swap part in ./%s/master.cfg', item[0], d.masterDir)
+                        sys.exit(EX_CONFIG)
+                    d.ExtensiveBlocking[item[0]] = parts
+            if config.has_section('ExtensiveNeighbourhood'):
+                d.ExtensiveNeighbourhood = {}
+                ExtensiveNeighbourhood = config.items('ExtensiveNeighbourhood')
+                for item in (ExtensiveNeighbourhood):
+                    if item[0] == 'window size':
+                        try:
+                            d.ExtensiveWindow = int(item[1])
+                        except (ValueError) as e:
+                            logging.fatal('Extensive sorted neighbourhood with bad window size (%s) in ./%s/master.cfg: %s', item[1], d.masterDir, e)
+                            sys.exit(EX_CONFIG)
+                        if d.ExtensiveWindow < 2:
+                            logging.fatal('Extensive sorted neighbourhood window size (%s) in ./%s/master.cfg must be at least 2', item[1], d.masterDir)
+                            sys.exit(EX_CONFIG)
+                        continue
+                    parts = []
+                    for part in item[1].split(','):
+                        part = part.strip()
+                        if part not in d.DefinedBlockingParts:
+                            logging.fatal('Extensive sorted neighbourhood pass "%s" with unknown part (%s) in ./%s/master.cfg', item[0], part, d.masterDir)
+                            sys.exit(EX_CONFIG)
+                        parts.append(part)
+                    d.ExtensiveNeighbourhood[item[0]] = parts
+
+            # Compile the Extensive checking configuration into the scoring plan
+            d.ExtensiveScorer = ExtensiveScorer()
 
     except (MissingSectionHeaderError, NoSectionError, NoOptionError, ParsingError) as e:
         logging.fatal('%s', e)
@@ -426,10 +518,30 @@ After reading in the configuration data, check that it defines a valid configuat
                 d.secondaryReportingColumns = row
                 break
 
+        # Check Section [SpellingKeys]
+        if config.has_option('SpellingKeys', 'spelling distance'):
+            try:
+                d.SpellingDistance = config.getint('SpellingKeys', 'spelling distance')
+            except (ValueError) as e:
+                logging.fatal('Bad spelling distance (%s) in the [SpellingKeys] section: %s', config.get('SpellingKeys', 'spelling distance'), e)
+                sys.exit(EX_CONFIG)
+            if d.SpellingDistance not in [0, 1, 2]:
+                logging.fatal('Bad spelling distance (%d) in the [SpellingKeys] section - must be 0, 1 or 2', d.SpellingDistance)
+                sys.exit(EX_CONFIG)
+
         # Check the Extensive checking Sections
         if d.Extensive:
             if config.has_option('ExtensiveConfidence', 'Check Confidence Value'):
                 d.ExtensiveConfidence = config.getfloat('ExtensiveConfidence', 'Check Confidence Value')
+            if config.has_option('ExtensiveConfidence', 'Maximum Candidates'):
+                try:
+                    d.ExtensiveTopK = config.getint('ExtensiveConfidence', 'Maximum Candidates')
+                except (ValueError) as e:
+                    logging.fatal('Bad Maximum Candidates (%s) in the [ExtensiveConfidence] section of ./%s/secondary.cfg: %s', config.get('ExtensiveConfidence', 'Maximum Candidates'), d.secondaryDir, e)
+                    sys.exit(EX_CONFIG)
+                if d.ExtensiveTopK < 0:
+                    logging.fatal('Bad Maximum Candidates (%d) in the [ExtensiveConfidence] section of ./%s/secondary.cfg - cannot be negative', d.ExtensiveTopK, d.secondaryDir)
+                    sys.exit(EX_CONFIG)
             if config.has_section('ExtensiveCore'):
                 d.ExtensiveRoutines = {}
                 ExtensiveCore = config.items('ExtensiveCore')
@@ -467,7 +579,7 @@ After reading in the configuration data, check that it defines a valid configuat
                             logging.fatal('Extensive checking routine "%s" with bad weight (%s) in ./%s/secondary.cfg', item[0], item[1], d.secondaryDir)
                             sys.exit(EX_CONFIG)
                         if w != 0:
-                            d.ExtensiveRoutines[item[0]] = w
+                            d.ExtensiveRoutines[item[0]] = (w, None)
             if config.has_section('ExtensiveFields'):
                 d.ExtensiveFields = {}
                 ExtensiveFields = config.items('ExtensiveFields')
@@ -483,6 +595,9 @@ After reading in the configuration data, check that it defines a valid configuat
                     if w != 0:
                         d.ExtensiveFields[item[0]] = w
 
+            # Compile the Extensive checking configuration into the scoring plan
+            d.ExtensiveScorer = ExtensiveScorer()
+
     except (MissingSectionHeaderError, NoSectionError, NoOptionError, ParsingError) as e:
         logging.fatal('%s', e)
         if extractDir:
@@ -683,21 +798,21 @@ Open the file for possible duplicate name check messages
     d.worksheet['pdc'].append(heading)
 
 
-def openReport():
+def openReport(reportName='Report'):
     '''
 Open the report file for appending
     '''
 
     if d.scriptType == 'master':
         if d.masterExtractDir:
-            fileName = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_{d.progName}_Report.txt'
+            fileName = f'./{d.masterDir}/{d.masterExtractDir}/{d.masterShortName}_{d.progName}_{reportName}.txt'
         else:
-            fileName = f'./{d.masterDir}/{d.masterShortName}_{d.progName}_Report.txt'
+            fileName = f'./{d.masterDir}/{d.masterShortName}_{d.progName}_{reportName}.txt'
     else:
         if d.secondaryExtractDir:
-            fileName = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_{d.progName}_Report.txt'
+            fileName = f'./{d.secondaryDir}/{d.secondaryExtractDir}/{d.secondaryShortName}_{d.progName}_{reportName}.txt'
         else:
-            fileName = f'./{d.secondaryDir}/{d.secondaryShortName}_{d.progName}_Report.txt'
+            fileName = f'./{d.secondaryDir}/{d.secondaryShortName}_{d.progName}_{reportName}.txt'
     try:
         d.rpt = open(fileName, 'wt', newline='')
     except:
@@ -1359,24 +1474,77 @@ Compute the Soundex value for a name
 
 
 
+def NameCodes(name):
+    '''
+Return the (NYSIIS, Double Metaphone, Soundex) codes for a name from the phonetic code store (computing and storing them if they are not in the store)
+    '''
+
+    if name not in d.NameCodes:
+        d.NameCodes[name] = (nysiis(name), metaphone(name), soundex(name))
+        d.NameCodesAdded += 1
+    return d.NameCodes[name]
+
+
+def NameCodesHeading():
+    '''
+The heading of the phonetic code store file (the codes depend upon the version of jellyfish that computed them)
+    '''
+
+    try:
+        version = importlib.metadata.version('jellyfish')
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+    return ['Name', 'NYSIIS', 'Metaphone', 'Soundex', f'jellyfish {version}']
+
+
+def LoadNameCodes(directory):
+    '''
+Load the phonetic code store saved in directory by an earlier run (if there is one, and it was computed by the same version of jellyfish)
+    '''
+
+    d.NameCodesFile = f'./{directory}/phoneticCodes.csv'
+    d.NameCodes = {}
+    d.NameCodesAdded = 0
+    if not os.path.exists(d.NameCodesFile):
+        return
+    with open(d.NameCodesFile, 'rt', newline='') as csvfile:
+        codesCSV = csv.reader(csvfile, dialect='excel')
+        heading = next(codesCSV, None)
+        if heading != NameCodesHeading():
+            logging.warning('%s was not created by this version of jellyfish - phonetic codes will be recomputed', d.NameCodesFile)
+            return
+        for row in codesCSV:
+            d.NameCodes[row[0]] = (row[1], row[2], row[3])
+    logging.info('%d names loaded from %s', len(d.NameCodes), d.NameCodesFile)
+
+
+def SaveNameCodes():
+    '''
+Save the phonetic code store, if any names were added during this run
+    '''
+
+    if (d.NameCodesFile is None) or (d.NameCodesAdded == 0):
+        return
+    try:
+        with open(d.NameCodesFile + '.tmp', 'wt', newline='') as csvfile:
+            codesCSV = csv.writer(csvfile, dialect='excel')
+            codesCSV.writerow(NameCodesHeading())
+            for name, codes in d.NameCodes.items():
+                codesCSV.writerow([name, *codes])
+        os.replace(d.NameCodesFile + '.tmp', d.NameCodesFile)
+    except OSError as e:
+        logging.warning('cannot save the phonetic codes in %s: %s', d.NameCodesFile, e)
+        return
+    logging.info('%d names saved in %s (%d new)', len(d.NameCodes), d.NameCodesFile, d.NameCodesAdded)
+
+
 def Sounds(part1, part2):
     '''
 Compute the NSYIIS, double metaphones and Soundex codes for two names
+Returns the tuple of the three codes for part1 followed by the three codes for part2
     '''
 
-    codes = ''
-    codes += nysiis(part1)
-    codes += '~'
-    codes += metaphone(part1)
-    codes += '~'
-    codes += soundex(part1)
-    codes += '~'
-    codes += nysiis(part2)
-    codes += '~'
-    codes += metaphone(part2)
-    codes += '~'
-    codes += soundex(part2)
-    return codes
+    return NameCodes(part1) + NameCodes(part2)
 
 
 def SoundCheck(name1, name1ny, name1dm, name1sx, name2, name2ny, name2dm, name2sx):
@@ -1403,19 +1571,62 @@ Compute the confidence that two names are the same
     return max(metaConfidence, soundexConfidence) * 100.0
 
 
-def FamilyNameCheck(family1, family2, weight):
+def SoundChecks(name, sounds, otherNames, otherSounds):
     '''
-Compute the Family Name confidence
+Compute the sound confidence (as per SoundCheck) of one name against a list of other names
+sounds and otherSounds are the (NYSIIS, Double Metaphone, Soundex) codes of name and otherNames
+If rapidfuzz is installed, and there are at least d.SoundBatchSize other names, then the Levenshtein distances and Jaro-Winkler similarities
+are each computed in one batch call, otherwise each pair of names is checked with SoundCheck
     '''
-    logging.debug('FamliyNameCheck:%s:%s', family1, family2)
 
-    if (family1 == '') or (family2 == ''):
-        return (0.0, 0.0)
+    if (cdist is None) or (not v.Available()) or (len(otherNames) < d.SoundBatchSize):
+        return [SoundCheck(name, *sounds, otherName, *otherSounds[i]) for i, otherName in enumerate(otherNames)]
+
+    (nameny, namedm, namesx) = sounds
+    confidences = [0.0] * len(otherNames)
+    metaNames = []            # The other names that need a Levenshtein weighted Double Metaphone confidence
+    soundexNames = []        # The other names that need a Jaro-Winkler weighted Soundex confidence
+    for i, otherName in enumerate(otherNames):
+        (otherny, otherdm, othersx) = otherSounds[i]
+        if (otherName == name) or (otherny == nameny):
+            confidences[i] = 1.0
+            continue
+        if otherdm == namedm:
+            metaNames.append(i)
+        if othersx == namesx:
+            soundexNames.append(i)
+    if len(metaNames) > 0:
+        distances = cdist([name], [otherNames[i] for i in metaNames], scorer=Levenshtein.distance)[0].tolist()
+        for i, distance in zip(metaNames, distances):
+            confidences[i] = 1.0 - float(distance) / (float(max(len(name), len(otherNames[i]))) * 2.0)
+    if len(soundexNames) > 0:
+        similarities = cdist([name], [otherNames[i] for i in soundexNames], scorer=JaroWinkler.similarity, dtype='float64')[0].tolist()
+        for i, similarity in zip(soundexNames, similarities):
+            confidences[i] = max(confidences[i], similarity)
+    return [confidence * 100.0 for confidence in confidences]
+
+
+def SoundCheckCache(size):
+    '''
+Wrap SoundCheck in a bounded memo cache that remembers the sound confidence of the 'size' most recently used pairs of names
+(no cache if size is 0)
+    '''
 
-    if family1 == family2:
-        return (100.0, weight)
+    if size > 0:
+        d.SoundCache = functools.lru_cache(maxsize=size)(SoundCheck)
     else:
-        return (0.0, weight)
+        d.SoundCache = None
+
+
+def ReportSoundCache():
+    '''
+Report the use of the SoundCheck memo cache
+    '''
+
+    if d.SoundCache is None:
+        return
+    info = d.SoundCache.cache_info()
+    d.rpt.write(f'{info.hits + info.misses}\tPairs of names checked for sound confidence ({info.hits} found in the cache, {info.misses} computed, cache size {info.maxsize})\n')
 
 
 def FamilyNameSoundCheck(family1, family1ny, family1dm, family1sx, family2, family2ny, family2dm, family2sx, weight):
@@ -1430,26 +1641,12 @@ Compute the Family Name sound confidence
     if family1 == family2 :            # Irrelevant if family names are identical
         return (0.0, 0.0)
 
+    if d.SoundCache is not None:
+        return (d.SoundCache(family1, family1ny, family1dm, family1sx, family2, family2ny, family2dm, family2sx), weight)
     return (SoundCheck(family1, family1ny, family1dm, family1sx, family2, family2ny, family2dm, family2sx), weight)
 
 
 
-def GivenNameCheck(given1, given2, weight):
-    '''
-Compute the Given Name confidence
-    '''
-    logging.debug('GivenNameCheck:%s:%s', given1, given2)
-
-    if (given1 == '') or (given2 == ''):
-        return (0.0, 0.0)
-
-    if given1 == given2:
-        return (100.0, weight)
-    else:
-        return (0.0, weight)
-
-
-
 def GivenNameSoundCheck(given1, given1ny, given1dm, given1sx, given2, given2ny, given2dm, given2sx, weight):
     '''
 Compute the Given Name sound confidence
@@ -1462,307 +1659,2538 @@ Compute the Given Name sound confidence
     if given1 == given2 :            # Irrelevant if given names are identical
         return (0.0, 0.0)
 
+    if d.SoundCache is not None:
+        return (d.SoundCache(given1, given1ny, given1dm,  given1sx, given2, given2ny, given2dm,  given2sx), weight)
     return (SoundCheck(given1, given1ny, given1dm,  given1sx, given2, given2ny, given2dm,  given2sx), weight)
 
 
-def MiddleNamesCheck(middle1, middle2, weight):
+def Birthdate (dob):
     '''
-Compute the Middle Name confidence
+Convert a string birthdate to a datetime value
     '''
-    logging.debug('MiddleNamesCheck:%s:%s', middle1, middle2)
 
-    if (middle1 == '') or (middle2 == ''):
-        return (0.0, 0.0)
-
-    if middle1 == middle2:
-        return (100.0, weight)
-    else:
-        return (0.0, weight)
+    (year, month, day) = dob.split('-')
+    return(datetime.date(int(year), int(month), int(day)))
 
 
-def MiddleNamesInitialCheck(middle1, middle2, weight):
+class NameGraph:
     '''
-Compute the Middle Initial confidence
+The vocabulary of distinct names, each with an integer id, and the sound confidence (SoundCheck) between them
+SoundCheck returns 0.0 unless two names share a NYSIIS, Double Metaphone or Soundex code,
+so build() only computes the sound confidence of distinct names that share a code, giving a sparse graph of name ids.
+Names added after build() are linked to the names in the built vocabulary as they are added.
     '''
-    logging.debug('MiddleNamesInitialCheck:%s:%s', middle1, middle2)
 
-    if (middle1 == '') or (middle2 == ''):
-        return (0.0, 0.0)
+    def __init__(self):
+        self.ids = {}            # Keys: name, Values: name id
+        self.names = []            # The name for each name id
+        self.sounds = []        # The (NYSIIS, Double Metaphone, Soundex) codes for each name id
+        self.edges = []            # The neighbours of each name id - Keys: neighbouring name id, Values: sound confidence
+        self.buckets = {}        # Keys: (code number, code), Values: the ids of the built names with that code
+        self.built = 0            # The number of names in the built vocabulary
+
+    def add(self, name, sounds):
+        '''
+Add a name (and it's sound codes) to the vocabulary and return it's name id
+        '''
+
+        if name in self.ids:
+            return self.ids[name]
+        nameId = len(self.names)
+        self.ids[name] = nameId
+        self.names.append(name)
+        self.sounds.append(sounds)
+        self.edges.append({})
+        if self.built > 0:
+            otherIds = []
+            for i, code in enumerate(sounds):
+                otherIds += self.buckets.get((i, code), [])
+            otherIds = list(dict.fromkeys(otherIds))
+            confidences = SoundChecks(name, sounds, [self.names[otherId] for otherId in otherIds], [self.sounds[otherId] for otherId in otherIds])
+            self.edges[nameId] = dict(zip(otherIds, confidences))
+        return nameId
+
+    def build(self):
+        '''
+Compute the sound confidence of every pair of names, in the vocabulary, that share a sound code
+        '''
+
+        self.buckets = {}
+        for nameId, sounds in enumerate(self.sounds):
+            for i, code in enumerate(sounds):
+                if (i, code) not in self.buckets:
+                    self.buckets[(i, code)] = []
+                self.buckets[(i, code)].append(nameId)
+        for members in self.buckets.values():
+            for i, id1 in enumerate(members):
+                otherIds = [id2 for id2 in members[i + 1:] if id2 not in self.edges[id1]]
+                confidences = SoundChecks(self.names[id1], self.sounds[id1], [self.names[id2] for id2 in otherIds], [self.sounds[id2] for id2 in otherIds])
+                for id2, confidence in zip(otherIds, confidences):
+                    self.edges[id1][id2] = confidence
+                    self.edges[id2][id1] = confidence
+        self.built = len(self.names)
+
+    def similarity(self, id1, id2):
+        '''
+Return the sound confidence (as per SoundCheck) of the names with these name ids
+        '''
+
+        if id1 == id2:
+            return 100.0
+        if id1 < id2:
+            (id1, id2) = (id2, id1)
+        if id2 < self.built:
+            return self.edges[id1].get(id2, 0.0)
+        return SoundCheck(self.names[id1], *self.sounds[id1], self.names[id2], *self.sounds[id2])
+
+
+def BuildNameGraph():
+    '''
+Build the sound confidence graph of the names collected in the Extensive checking data so far
+    '''
 
-    if middle1[0:1] == middle2[0:1]:
-        return (100.0, weight)
-    else:
-        return (0.0, weight)
+    if d.NameGraph is None:
+        return
+    d.NameGraph.build()
+    logging.info('%d distinct names, %d pairs of names that share a sound code', len(d.NameGraph.names), sum(len(edges) for edges in d.NameGraph.edges) // 2)
 
 
-def SexCheck(sex1, sex2, weight):
+def StringCode(value):
     '''
-Compute the Sex confidence
+Convert a string to its integer code in the shared string dictionary (the empty string is always code 0)
+Each distinct value is held once, in the dictionary, and the records just hold the codes
     '''
-    logging.debug('SexCheck:%s:%s', sex1, sex2)
 
-    if (sex1 == '') or (sex2 == ''):
-        return (0.0, 0.0)
+    code = d.StringCodes.get(value)
+    if code is None:
+        code = len(d.Strings)
+        d.StringCodes[value] = code
+        d.Strings.append(value)
+    return code
 
-    if sex1 == sex2:
-        return (100.0, weight)
-    else:
-        return (0.0, weight)
 
+class ExtensiveRecord:
+    '''
+The Extensive checking data for one record, unpacked and parsed once so that it can be scored against many other records
+The family name, given name, sex, middle names (and middle names initial) are held as their code in the shared string dictionary (StringCode)
+The sound codes of the names come from the phonetic code store (NameCodes)
+otherFields is the tuple of codes (0 if missing) of the 'other fields', in sorted field name order
+    '''
+
+    __slots__ = ('familyName', 'givenName', 'birthdate', 'sex', 'familyNameSounds', 'givenNameSounds', 'familyNameId', 'givenNameId',
+                 'year', 'month', 'day', 'yearText', 'monthText', 'dayText', 'date', 'middleNames', 'middleInitial', 'otherFields')
+
+    def __init__(self, familyName, givenName, birthdate, sex, middleNames, otherFields):
+        self.familyName = StringCode(familyName)
+        self.givenName = StringCode(givenName)
+        self.birthdate = birthdate
+        self.sex = StringCode(sex)
+        self.familyNameSounds = NameCodes(familyName)
+        self.givenNameSounds = NameCodes(givenName)
+        if d.NameGraph is None:
+            d.NameGraph = NameGraph()
+        self.familyNameId = d.NameGraph.add(familyName, self.familyNameSounds)
+        self.givenNameId = d.NameGraph.add(givenName, self.givenNameSounds)
+        if birthdate == '':
+            (self.yearText, self.monthText, self.dayText) = ('', '', '')
+            (self.year, self.month, self.day) = (0, 0, 0)
+            self.date = d.futureBirthdate
+        else:
+            (self.yearText, self.monthText, self.dayText) = birthdate.split('-')
+            self.year = int(self.yearText)
+            self.month = int(self.monthText)
+            self.day = int(self.dayText)
+            self.date = datetime.date(self.year, self.month, self.day)
+        if middleNames is None:
+            middleNames = ''
+        self.middleNames = StringCode(middleNames)
+        self.middleInitial = StringCode(middleNames[0:1])
+        self.otherFields = otherFields
+
+
+def ExtensiveOtherFields(fieldValue):
+    '''
+Compute the tuple of 'other field' codes (0 if missing), in sorted field name order, for an ExtensiveRecord
+fieldValue is masterField or secondaryField
+    '''
+
+    return tuple(StringCode(fieldValue(field)) for field in sorted(d.ExtensiveFields.keys()))
 
 
-def BirthdateCheck(birthdate1, birthdate2, weight):
+def ExtensiveDistinct(recNo, record):
     '''
-Compute the Birthdate confidence
+Check if an ExtensiveRecord is the first record with its Extensive checking data (names, birthdate, sex, middle names and 'other fields')
+Records with the same Extensive checking data score the same against every other record, so only the first (distinct) record is checked
+and its possible duplicates, or finds, are fanned out to the other records with the same data (d.ExtensiveMembers)
+Returns True if this is a distinct record
     '''
-    logging.debug('BirthdateCheck:%s:%s', birthdate1, birthdate2)
 
-    if (birthdate1 == '') or (birthdate2 == ''):
-        return (0.0, 0.0)
+    checkKey = (record.familyName, record.givenName, record.birthdate, record.sex, record.middleNames, record.otherFields)
+    if checkKey not in d.ExtensiveDistinct:
+        d.ExtensiveDistinct[checkKey] = recNo
+        return True
+    firstRec = d.ExtensiveDistinct[checkKey]
+    if firstRec not in d.ExtensiveMembers:
+        d.ExtensiveMembers[firstRec] = [firstRec]
+    d.ExtensiveMembers[firstRec].append(recNo)
+    return False
 
-    if birthdate1 == birthdate2:
-        return (100.0, weight)
-    else:
-        return (0.0, weight)
 
+def DistinctRecKeys(recKeys):
+    '''
+Return the Extensive record keys of just the distinct records (see ExtensiveDistinct)
+    '''
 
+    if len(d.ExtensiveMembers) == 0:
+        return recKeys
+    copies = set()
+    for members in d.ExtensiveMembers.values():
+        copies.update(members[1:])
+    return {recNo: recKey for (recNo, recKey) in recKeys.items() if recNo not in copies}
 
-def Birthdate (dob):
+
+def ExtensiveFanOut(duplicates):
     '''
-Convert a string birthdate to a datetime value
+Fan the possible duplicates found between the distinct records out to all the records with the same Extensive checking data
+duplicates is the list of [rec1, extensiveMatches] for each distinct record with possible duplicates
+Returns the list of [rec1, extensiveMatches] for every record with possible duplicates, in record number order, as if every record had been checked
     '''
 
-    (year, month, day) = dob.split('-')
-    return(datetime.date(int(year), int(month), int(day)))
+    if len(d.ExtensiveMembers) == 0:
+        return duplicates
+    found = {}
+    for (first1, extensiveMatches) in duplicates:
+        for (first2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in extensiveMatches:
+            for rec1 in d.ExtensiveMembers.get(first1, [first1]):
+                for rec2 in d.ExtensiveMembers.get(first2, [first2]):
+                    if rec1 < rec2:
+                        (lowRec, highRec) = (rec1, rec2)
+                    else:
+                        (lowRec, highRec) = (rec2, rec1)
+                    if lowRec not in found:
+                        found[lowRec] = []
+                    found[lowRec].append([highRec, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+    return [[rec1, sorted(found[rec1])] for rec1 in sorted(found)]
+
 
+def ReportDistinct():
+    '''
+Report the records that were not extensively checked, because an earlier record had the same Extensive checking data
+    '''
 
+    copies = sum(len(members) - 1 for members in d.ExtensiveMembers.values())
+    if copies == 0:
+        return
+    d.rpt.write(f'{copies}\tRecords with the same Extensive checking data as an earlier record [{len(d.ExtensiveMembers)} distinct records] (checked once and the results shared)\n')
 
 
-def BirthdateNearYearCheck(birthdate1, birthdate2, param, weight):
+# The Extensive checking routines, compiled into the scoring plan (see ExtensiveScorer)
+# Each one takes two ExtensiveRecords plus the configured weight and parameter (the field number for ScoreOtherField, _param if not used)
+# and returns the (confidence, weight) for the pair of records - a weight of 0.0 if the routine does not apply to the pair (e.g. missing data)
+def ScoreFamilyName(rec1, rec2, weight, _param):
     '''
-Check if two birthdates are within 'param' years (i.e. 1981-11-12 === 1984-08-09 if 'param' is 3, but not if 'param' is 2)
+Compute the Family Name confidence
     '''
-    logging.debug('BirthdateNearYearCheck:%s:%s', birthdate1, birthdate2)
 
-    if (birthdate1 == '') or (birthdate2 == ''):
+    if (rec1.familyName == 0) or (rec2.familyName == 0):
         return (0.0, 0.0)
+    if rec1.familyName == rec2.familyName:
+        return (100.0, weight)
+    return (0.0, weight)
 
-    if birthdate1 == birthdate2 :            # Irrelevant if birthdates are identical
-        return (0.0, 0.0)
 
-    (year1, month1, day1) = birthdate1.split('-')
-    (year2, month2, day2) = birthdate2.split('-')
-    year1 = int(year1)
-    month1 = int(month1)
-    day1 = int(day1)
-    year2 = int(year2)
-    month2 = int(month2)
-    day2 = int(day2)
-
-    if year1 > year2 :                # Check backwards
-        yearDiff = year1 - year2
-        if yearDiff > param:
-            return (0.0, 0.0)
-        if month1 > month2:
-            yearDiff += 1
-        elif month1 == month2:
-            if day1 > day2:
-                yearDiff += 1
-        if yearDiff > param:
-            return (0.0, 0.0)
-        else:
-            return (100.0, weight)
-    else:
-        yearDiff = year2 - year1
-        if yearDiff > param:
-            return (0.0, 0.0)
-        if month2 > month1:
-            yearDiff += 1
-        elif month2 == month1:
-            if day2 > day1:
-                yearDiff += 1
-        if yearDiff > param:
-            return (0.0, 0.0)
-        else:
-            return (100.0, weight)
+def ScoreFamilyNameSound(rec1, rec2, weight, _param):
+    '''
+Compute the Family Name sound confidence (from the name graph, d.NameGraph)
+    '''
 
+    if (rec1.familyName == 0) or (rec2.familyName == 0) or (rec1.familyName == rec2.familyName):
+        return (0.0, 0.0)
+    return (d.NameGraph.similarity(rec1.familyNameId, rec2.familyNameId), weight)
 
 
-def BirthdateNearMonthCheck(birthdate1, birthdate2, param, weight):
+def ScoreGivenName(rec1, rec2, weight, _param):
     '''
-Check if two birthdates are within 'param' months (i.e. 1981-11-12 === 1981-08-09 if 'param' is 3, but not if 'param' is 2)
+Compute the Given Name confidence
     '''
-    logging.debug('BirthdateNearMonthCheck')
 
-    if (birthdate1 == '') or (birthdate2 == ''):
+    if (rec1.givenName == 0) or (rec2.givenName == 0):
         return (0.0, 0.0)
+    if rec1.givenName == rec2.givenName:
+        return (100.0, weight)
+    return (0.0, weight)
+
+
+def ScoreGivenNameSound(rec1, rec2, weight, _param):
+    '''
+Compute the Given Name sound confidence (from the name graph, d.NameGraph)
+    '''
 
-    if birthdate1 == birthdate2 :            # Irrelevant if birthdates are identical
+    if (rec1.givenName == 0) or (rec2.givenName == 0) or (rec1.givenName == rec2.givenName):
         return (0.0, 0.0)
+    return (d.NameGraph.similarity(rec1.givenNameId, rec2.givenNameId), weight)
 
-    (year1, month1, day1) = birthdate1.split('-')
-    (year2, month2, day2) = birthdate2.split('-')
-    year1 = int(year1)
-    month1 = int(month1)
-    day1 = int(day1)
-    year2 = int(year2)
-    month2 = int(month2)
-    day2 = int(day2)
-
-    if year1 > year2 :                # Check backwards
-        monthDiff = (year1 - year2) * 12 + month1 - month2
-        if month1 == month2:
-            if day1 > day2:
-                monthDiff += 1
-        if monthDiff > param:
-            return (0.0, 0.0)
-        else:
-            return (100.0, weight)
-    else:
-        monthDiff = (year2 - year1) * 12 + month2 - month1
-        if month2 == month1:
-            if day2 > day1:
-                monthDiff += 1
-        if monthDiff > param:
-            return (0.0, 0.0)
-        else:
-            return (100.0, weight)
+
+def ScoreMiddleNames(rec1, rec2, weight, _param):
+    '''
+Compute the Middle Name confidence
+    '''
+
+    if (rec1.middleNames == 0) or (rec2.middleNames == 0):
+        return (0.0, 0.0)
+    if rec1.middleNames == rec2.middleNames:
+        return (100.0, weight)
+    return (0.0, weight)
 
 
-def BirthdateNearDayCheck(date1, date2, param, weight):
+def ScoreMiddleNamesInitial(rec1, rec2, weight, _param):
     '''
-Check if two birthdates are within 'param' days (i.e. 1981-11-12 === 1981-11-09 if 'param' is 3, but not if 'param' is 2)
+Compute the Middle Initial confidence
     '''
-    logging.debug('BirthdateNearDayCheck')
 
-    if (date1 == d.futureBirthdate) or (date2 == d.futureBirthdate):
+    if (rec1.middleNames == 0) or (rec2.middleNames == 0):
         return (0.0, 0.0)
+    if rec1.middleInitial == rec2.middleInitial:
+        return (100.0, weight)
+    return (0.0, weight)
+
+
+def ScoreSex(rec1, rec2, weight, _param):
+    '''
+Compute the Sex confidence
+    '''
 
-    if date1 == date2 :            # Irrelevant if birthdates are identical
+    if (rec1.sex == 0) or (rec2.sex == 0):
         return (0.0, 0.0)
+    if rec1.sex == rec2.sex:
+        return (100.0, weight)
+    return (0.0, weight)
 
-    if date1 > date2:
-        dateDiff = date1 - date2
-    else:
-        dateDiff = date2 - date1
-    if dateDiff.days < param:
+
+def ScoreBirthdate(rec1, rec2, weight, _param):
+    '''
+Compute the Birthdate confidence
+    '''
+
+    if (rec1.birthdate == '') or (rec2.birthdate == ''):
+        return (0.0, 0.0)
+    if rec1.birthdate == rec2.birthdate:
         return (100.0, weight)
+    return (0.0, weight)
+
+
+def ScoreBirthdateNearYear(rec1, rec2, weight, param):
+    '''
+Check if two birthdates are within 'param' years (i.e. 1981-11-12 === 1984-08-09 if 'param' is 3, but not if 'param' is 2)
+    '''
+
+    if (rec1.birthdate == '') or (rec2.birthdate == '') or (rec1.birthdate == rec2.birthdate):
+        return (0.0, 0.0)
+    if rec1.year > rec2.year :                # Check backwards
+        yearDiff = rec1.year - rec2.year
+        if (rec1.month > rec2.month) or ((rec1.month == rec2.month) and (rec1.day > rec2.day)):
+            yearDiff += 1
     else:
-        return (0.0, weight)
+        yearDiff = rec2.year - rec1.year
+        if (rec2.month > rec1.month) or ((rec2.month == rec1.month) and (rec2.day > rec1.day)):
+            yearDiff += 1
+    if yearDiff > param:
+        return (0.0, 0.0)
+    return (100.0, weight)
 
 
-def BirthdateYearSwapCheck(birthdate1, birthdate2, weight):
+def ScoreBirthdateNearMonth(rec1, rec2, weight, param):
     '''
-Check if two dates match if the last two digits of year are swapped (i.e. 1982-11-15 === 1928-11-15)
+Check if two birthdates are within 'param' months (i.e. 1981-11-12 === 1981-08-09 if 'param' is 3, but not if 'param' is 2)
     '''
-    logging.debug('BirthdateYearSwapCheck:%s:%s', birthdate1, birthdate2)
 
-    if (birthdate1 == '') or (birthdate2 == ''):
+    if (rec1.birthdate == '') or (rec2.birthdate == '') or (rec1.birthdate == rec2.birthdate):
+        return (0.0, 0.0)
+    if rec1.year > rec2.year :                # Check backwards
+        monthDiff = (rec1.year - rec2.year) * 12 + rec1.month - rec2.month
+        if (rec1.month == rec2.month) and (rec1.day > rec2.day):
+            monthDiff += 1
+    else:
+        monthDiff = (rec2.year - rec1.year) * 12 + rec2.month - rec1.month
+        if (rec2.month == rec1.month) and (rec2.day > rec1.day):
+            monthDiff += 1
+    if monthDiff > param:
         return (0.0, 0.0)
+    return (100.0, weight)
+
+
+def ScoreBirthdateNearDay(rec1, rec2, weight, param):
+    '''
+Check if two birthdates are within 'param' days (i.e. 1981-11-12 === 1981-11-09 if 'param' is 3, but not if 'param' is 2)
+    '''
 
-    if birthdate1 == birthdate2 :            # Irrelevant if birthdates are identical
+    if (rec1.date == d.futureBirthdate) or (rec2.date == d.futureBirthdate) or (rec1.date == rec2.date):
         return (0.0, 0.0)
+    if abs((rec1.date - rec2.date).days) < param:
+        return (100.0, weight)
+    return (0.0, weight)
 
-    (year1, month1, day1) = birthdate1.split('-')
-    (year2, month2, day2) = birthdate2.split('-')
 
-    if (month1 != month2) or (day1 != day2):
-        return (0.0, weight)
+def ScoreBirthdateYearSwap(rec1, rec2, weight, _param):
+    '''
+Check if two dates match if the last two digits of year are swapped (i.e. 1982-11-15 === 1928-11-15)
+    '''
 
-    if year1[0:2] != year2[0:2]:
+    if (rec1.birthdate == '') or (rec2.birthdate == '') or (rec1.birthdate == rec2.birthdate):
+        return (0.0, 0.0)
+    if (rec1.monthText != rec2.monthText) or (rec1.dayText != rec2.dayText) or (rec1.yearText[0:2] != rec2.yearText[0:2]):
         return (0.0, weight)
-
-    if year1[2:4] ==  year2[3:4] + year2[2:3]:
+    if rec1.yearText[2:4] == rec2.yearText[3:4] + rec2.yearText[2:3]:
         return (100.0, weight)
-    else:
-        return (0.0, weight)
-
+    return (0.0, weight)
 
 
-def BirthdateDayMonthSwapCheck(birthdate1, birthdate2, weight):
+def ScoreBirthdateDayMonthSwap(rec1, rec2, weight, _param):
     '''
 Check if two dates match if the month and day are swapped (i.e. 1982-11-12 === 1982-12-11)
     '''
-    logging.debug('BirthdateDaySwapCheck:%s:%s', birthdate1, birthdate2)
 
-    if (birthdate1 == '') or (birthdate2 == ''):
+    if (rec1.birthdate == '') or (rec2.birthdate == '') or (rec1.birthdate == rec2.birthdate):
         return (0.0, 0.0)
+    if rec1.yearText != rec2.yearText:
+        return (0.0, weight)
+    if (rec1.monthText == rec2.dayText) and (rec2.monthText == rec1.dayText):
+        return (100.0, weight)
+    return (0.0, 0.0)
+
+
+def ScoreOtherField(rec1, rec2, weight, param):
+    '''
+Compute the confidence of an exact match of the param(th) 'other field'
+    '''
 
-    if birthdate1 == birthdate2 :            # Irrelevant if birthdates are identical
+    if (rec1.otherFields[param] == 0) or (rec2.otherFields[param] == 0):
         return (0.0, 0.0)
+    if rec1.otherFields[param] == rec2.otherFields[param]:
+        return (100.0, weight)
+    return (0.0, weight)
 
-    (year1, month1, day1) = birthdate1.split('-')
-    (year2, month2, day2) = birthdate2.split('-')
 
-    if year1 != year2:
-        return (0.0, weight)
+ScoreRoutines = {'FamilyName':ScoreFamilyName, 'FamilyNameSound':ScoreFamilyNameSound, 'GivenName':ScoreGivenName, 'GivenNameSound':ScoreGivenNameSound,
+                 'MiddleNames':ScoreMiddleNames, 'MiddleNamesInitial':ScoreMiddleNamesInitial, 'Sex':ScoreSex, 'Birthdate':ScoreBirthdate,
+                 'BirthdateNearYear':ScoreBirthdateNearYear, 'BirthdateNearMonth':ScoreBirthdateNearMonth, 'BirthdateNearDay':ScoreBirthdateNearDay,
+                 'BirthdateYearSwap':ScoreBirthdateYearSwap, 'BirthdateDayMonthSwap':ScoreBirthdateDayMonthSwap}
 
-    if (month1 == day2) and (month2 == day1):
-        return (100.0, weight)
-    else:
-        return (0.0, 0.0)
+# The relative cost of each routine - the scoring plan runs the cheapest routines first
+# (exact matches, then date arithmetic, then the sound routines, which run Levenshtein and Jaro-Winkler)
+ScoreCosts = {'FamilyName':1, 'GivenName':1, 'MiddleNames':1, 'MiddleNamesInitial':1, 'Sex':1, 'Birthdate':1, 'OtherField':1,
+              'BirthdateNearYear':2, 'BirthdateNearMonth':2, 'BirthdateNearDay':2, 'BirthdateYearSwap':2, 'BirthdateDayMonthSwap':2,
+              'FamilyNameSound':3, 'GivenNameSound':3}
 
 
-def SaveStatus(secondaryRecNo, status, soundFound):
+class ExtensiveScorer:
     '''
-Assemble a concatinated list of all the Master file records numbers which have the same 'highest' status
+The configured Extensive checking routines, weights and parameters plus the 'other field' weights, compiled into a scoring plan
+The plan is built once, when the configuration has been read, and is shared by all the scripts
+The plan runs the cheapest checks first and abandons a pair as soon as the Check Confidence Value can no longer be reached
     '''
 
-    if secondaryRecNo in d.recStatus:
-        if d.recStatus[secondaryRecNo] > status:
-            return                            # Lower status - ignore
-
-        if d.recStatus[secondaryRecNo] < status :            # New higher status
-            d.foundRec[secondaryRecNo] = ''        # Start new list
-            d.foundSound[secondaryRecNo] = ''        # Start new list
-            d.recStatus[secondaryRecNo] = status            # Save status
-        if d.foundRec[secondaryRecNo] != '' :            # Concatentate if list already started
-            d.foundRec[secondaryRecNo] += '~' + str(d.masterRecNo)        # Append to the list
-            d.foundSound[secondaryRecNo] += '~' + soundFound        # Append to the list
+    def __init__(self):
+        self.names = []            # The name of each routine or 'other field', in the order in which they are added to the total confidence
+        plan = []
+        for coreRoutine, (weight, param) in d.ExtensiveRoutines.items():
+            if ('Middle' in coreRoutine) and not d.useMiddleNames:
+                continue
+            if weight > 0:
+                plan.append((ScoreCosts[coreRoutine], -weight, len(self.names), ScoreRoutines[coreRoutine], weight, param))
+                self.names.append(coreRoutine)
+        for i, field in enumerate(sorted(d.ExtensiveFields.keys())):
+            weight = d.ExtensiveFields[field]
+            if weight > 0:
+                plan.append((ScoreCosts['OtherField'], -weight, len(self.names), ScoreOtherField, weight, i))
+                self.names.append(field)
+        plan.sort(key=lambda step: step[0:3])
+
+        # Each step of the plan is (slot, routine, weight, parameter, the weight of the steps still to come)
+        self.plan = []
+        remaining = sum(step[4] for step in plan)
+        for (_, _, slot, routine, weight, param) in plan:
+            remaining -= weight
+            self.plan.append((slot, routine, weight, param, remaining))
+        self.familyNameSound = self.slot('FamilyNameSound')
+        self.givenNameSound = self.slot('GivenNameSound')
+
+    def slot(self, name):
+        '''
+Return the slot (position in the total confidence) for a routine, or None if it is not configured
+        '''
+
+        if name in self.names:
+            return self.names.index(name)
+        return None
+
+    def score(self, rec1, rec2):
+        '''
+Score a pair of ExtensiveRecords
+Returns None if the pair cannot reach the Check Confidence Value, otherwise
+the total confidence, the total weight (0 if no routine returned a weight) and the family name and given name sound confidences (100.0 for identical names)
+The total confidence is summed in configured order, so it does not depend upon the order of the plan
+        '''
+
+        # The best total confidence still achievable is (totalConfidence + 100.0 * remaining) / (totalWeight + remaining)
+        target = d.ExtensiveConfidence - 1e-9
+        results = [None] * len(self.names)
+        totalConfidence = 0.0
+        totalWeight = 0.0
+        for (slot, routine, thisWeight, thisParam, remaining) in self.plan:
+            (confidence, weight) = routine(rec1, rec2, thisWeight, thisParam)
+            results[slot] = (confidence, weight)
+            if weight > 0:
+                totalConfidence += confidence * weight
+                totalWeight += weight
+            if totalConfidence + 100.0 * remaining < target * (totalWeight + remaining):
+                name = self.names[slot]
+                d.ExtensivePruned[name] = d.ExtensivePruned.get(name, 0) + 1
+                return None
+
+        # Compute the total confidence
+        (totalConfidence, totalWeight) = self.total(results)
+        if totalConfidence < d.ExtensiveConfidence:
+            return None
+        return (totalConfidence, totalWeight) + self.sounds(rec1, rec2, results)
+
+    def features(self, rec1, rec2):
+        '''
+Run every routine, without abandoning the pair, for the pair feature cache (FeatureScore)
+Returns the (confidence, weight) of each routine, in configured order, plus the family name and given name sound confidences
+        '''
+
+        results = [None] * len(self.names)
+        for (slot, routine, thisWeight, thisParam, _) in self.plan:
+            results[slot] = routine(rec1, rec2, thisWeight, thisParam)
+        return (results,) + self.sounds(rec1, rec2, results)
+
+    def total(self, results):
+        '''
+Sum the (confidence, weight) of each routine, in configured order, into the total confidence and the total weight
+        '''
+
+        totalConfidence = 0
+        totalWeight = 0
+        for (confidence, weight) in results:
+            if weight > 0:
+                totalConfidence += confidence * weight
+                totalWeight += weight
+        if totalWeight > 0:
+            totalConfidence = totalConfidence / totalWeight
+        return (totalConfidence, totalWeight)
+
+    def sounds(self, rec1, rec2, results):
+        '''
+The family name and given name sound confidences (100.0 for identical names), which the sound routines may already have computed
+        '''
+
+        if rec1.familyName == rec2.familyName:
+            soundFamilyNameConfidence = 100.0
+        elif (rec1.familyName == 0) or (rec2.familyName == 0):
+            soundFamilyNameConfidence = 0.0
+        elif self.familyNameSound is not None:
+            soundFamilyNameConfidence = results[self.familyNameSound][0]
         else:
-            d.foundRec[secondaryRecNo] = str(d.masterRecNo)        # Start the list
-            d.foundSound[secondaryRecNo] = soundFound        # Start the list
-    else:
-        d.recStatus[secondaryRecNo] = status                # Save status
-        d.foundRec[secondaryRecNo] = str(d.masterRecNo)            # Start the list
-        d.foundSound[secondaryRecNo] = soundFound            # Start the list
+            soundFamilyNameConfidence = d.NameGraph.similarity(rec1.familyNameId, rec2.familyNameId)
+        if rec1.givenName == rec2.givenName:
+            soundGivenNameConfidence = 100.0
+        elif (rec1.givenName == 0) or (rec2.givenName == 0):
+            soundGivenNameConfidence = 0.0
+        elif self.givenNameSound is not None:
+            soundGivenNameConfidence = results[self.givenNameSound][0]
+        else:
+            soundGivenNameConfidence = d.NameGraph.similarity(rec1.givenNameId, rec2.givenNameId)
+        return (soundFamilyNameConfidence, soundGivenNameConfidence)
 
 
-def CheckIfFound():
+def ReportPruned():
     '''
-Check if this secondary record (PID) is in found.xlsx
+Report the pairs of records that Extensive checking abandoned, once the Check Confidence Value could no longer be reached
     '''
 
-    pid = d.sc.secondaryCleanPID()
-    if pid in d.foundUR:
-        return True
-    else:
-        return False
+    if len(d.ExtensivePruned) == 0:
+        return
+    d.rpt.write(f'{sum(d.ExtensivePruned.values())}\tPairs of records abandoned, as they could not reach the Check Confidence Value ({d.ExtensiveConfidence})\n')
+    for (slot, _, _, _, _) in d.ExtensiveScorer.plan:
+        name = d.ExtensiveScorer.names[slot]
+        if name in d.ExtensivePruned:
+            d.rpt.write(f'\t[{d.ExtensivePruned[name]} abandoned after {name}]\n')
+
 
+def SavePossible(possibles, secondaryRecNo, masterRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence):
+    '''
+Save a possible Extensive match between a secondary record and a master record in possibles (d.possExtensiveFinds or d.possExtensiveMatches)
+Normally possibles[secondaryRecNo] is a dictionary - Keys: confidence, Values: the list of [masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence]
+If d.ExtensiveTopK is configured, then possibles[secondaryRecNo] is a heap of the best d.ExtensiveTopK candidates (see PossiblesTopK)
+(higher confidence is better and, for the same confidence, the lower master record number is better)
+and the candidates that are not kept are counted in d.possExtensiveOverflow
+    '''
+
+    if d.ExtensiveTopK == 0:
+        if secondaryRecNo not in possibles:
+            possibles[secondaryRecNo] = {}
+        if totalConfidence not in possibles[secondaryRecNo]:
+            possibles[secondaryRecNo][totalConfidence] = []
+        possibles[secondaryRecNo][totalConfidence].append([masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence])
+        return
+    if secondaryRecNo not in possibles:
+        possibles[secondaryRecNo] = []
+    candidate = (totalConfidence, -masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence)
+    if len(possibles[secondaryRecNo]) < d.ExtensiveTopK:
+        heapq.heappush(possibles[secondaryRecNo], candidate)
+        return
+    d.possExtensiveOverflow[secondaryRecNo] = d.possExtensiveOverflow.get(secondaryRecNo, 0) + 1
+    if candidate > possibles[secondaryRecNo][0]:
+        heapq.heapreplace(possibles[secondaryRecNo], candidate)
 
 
-def PrintHeading(thisFile, fileType, message1, message2):
+def PossiblesTopK(possibles):
     '''
-Open a workbook and print the heading
-message1 and message2 get prepended to the heading, if presents
-fileType defines the number of UR/altUR fields to prepend to the heading
-    1 - prepend a heading column of master PMI PID and UR
-    2 - prepend heading columns for secondary PID, secondary UR and altUR
-    3 - prepend heading columns for both of the above
-    4 - prepend heading columns for both of the above and the extensive match confidence levels
+Convert the heaps of the best candidates (see SavePossible) back into dictionaries of confidences, once all the candidates have been saved
     '''
 
-    heading = []
-    if message1 != '':
-        heading.append(message1)
-    if message2 != '':
-        heading.append(message2)
-    if fileType == 1:
-        heading.append(f'{d.masterShortName} {d.masterPIDname}' )
-        heading.append(f'{d.masterShortName} {d.masterURname}')
-    elif fileType == 2:
-        heading.append(f'{d.secondaryShortName} {d.secondaryPIDname}')
-        heading.append(f'{d.secondaryShortName} {d.secondaryURname}')
+    if d.ExtensiveTopK == 0:
+        return
+    for secondaryRecNo, heap in possibles.items():
+        confidences = {}
+        for (totalConfidence, negativeMasterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence) in sorted(heap, key=lambda candidate: -candidate[1]):
+            if totalConfidence not in confidences:
+                confidences[totalConfidence] = []
+            confidences[totalConfidence].append([-negativeMasterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence])
+        possibles[secondaryRecNo] = confidences
+
+
+def OverflowMessage(secondaryRecNo):
+    '''
+The note, for the reports, of the Extensive candidates for a secondary record that were not kept (beyond d.ExtensiveTopK)
+    '''
+
+    if secondaryRecNo not in d.possExtensiveOverflow:
+        return ''
+    return f'[plus {d.possExtensiveOverflow[secondaryRecNo]} lower confidence candidates not kept]'
+
+
+def ReportOverflow():
+    '''
+Report the Extensive candidates that were not kept, as they were not amongst the best d.ExtensiveTopK for their secondary record
+    '''
+
+    if d.ExtensiveTopK == 0:
+        return
+    d.rpt.write(f'{sum(d.possExtensiveOverflow.values())}\tPossible matches not kept, as they were not amongst the best {d.ExtensiveTopK} for their {d.secondaryLongName} patient ({len(d.possExtensiveOverflow)} patients)\n')
+
+
+def KeyParts(familyName, givenName, birthdate, sex, sounds):
+    '''
+Compute all the possible parts of a blocking or sorting key for a record (sounds is the tuple returned by Sounds(familyName, givenName))
+    '''
+
+    (fny, fdm, fsx, gny, gdm, gsx) = sounds
+    return {'FamilyName':familyName, 'FamilyNameNYSIIS':fny, 'FamilyNameMetaphone':fdm, 'FamilyNameSoundex':fsx, 'FamilyNameInitial':familyName[0:1],
+            'GivenName':givenName, 'GivenNameNYSIIS':gny, 'GivenNameMetaphone':gdm, 'GivenNameSoundex':gsx, 'GivenNameInitial':givenName[0:1],
+            'Birthdate':birthdate, 'BirthYear':birthdate[0:4], 'BirthMonth':birthdate[5:7], 'Sex':sex}
+
+
+def BlockingKeys(familyName, givenName, birthdate, sex, sounds):
+    '''
+Compute the Extensive blocking keys for a record (sounds is the tuple returned by Sounds(familyName, givenName))
+A blocking key is not returned if any of its parts are missing
+    '''
+
+    parts = KeyParts(familyName, givenName, birthdate, sex, sounds)
+    keys = []
+    for blockName, blockParts in d.ExtensiveBlocking.items():
+        thisKey = blockName
+        for part in blockParts:
+            if (part in d.DefinedNearParts) or (part in d.DefinedSwapParts) or (parts[part] == ''):        # See NearBlockingKeys() and SwapBlockingKeys()
+                break
+            thisKey += '~' + parts[part]
+        else:
+            keys.append(thisKey)
+    return keys
+
+
+def SwappedBirthdate(swapPart, birthdate):
+    '''
+Return the birthdate with the last two digits of the year swapped (BirthdateYearSwap) or with the day and month swapped (BirthdateDayMonthSwap)
+Returns '' if the swapped birthdate cannot be a date or is the same as the birthdate
+    '''
+
+    (year, month, day) = birthdate.split('-')
+    if swapPart == 'BirthdateYearSwap':
+        swapped = year[0:2] + year[3:4] + year[2:3] + '-' + month + '-' + day
+    elif int(day) <= 12:
+        swapped = year + '-' + day + '-' + month
+    else:
+        return ''
+    if swapped == birthdate:
+        return ''
+    return swapped
+
+
+def SwapBlockingKeys(familyName, givenName, birthdate, sex, sounds, swapped):
+    '''
+Compute the Extensive blocking keys, that have a BirthdateYearSwap or BirthdateDayMonthSwap part, for a record (sounds is the tuple returned by Sounds(familyName, givenName))
+If swapped is True, then the swap part is the swapped birthdate (for the records being indexed), otherwise it is the birthdate (for the records looking for partners)
+So a record finds the records whose birthdate, when swapped, is its birthdate with one dictionary look up
+A blocking key is not returned if any part is missing, or if there is no swapped birthdate
+    '''
+
+    if birthdate == '':
+        return []
+    parts = KeyParts(familyName, givenName, birthdate, sex, sounds)
+    keys = []
+    for blockName, blockParts in d.ExtensiveBlocking.items():
+        thisKey = blockName
+        swapPart = None
+        for part in blockParts:
+            if part in d.DefinedNearParts:
+                break
+            if part in d.DefinedSwapParts:
+                swapPart = part
+                if swapped:
+                    value = SwappedBirthdate(part, birthdate)
+                else:
+                    value = birthdate
+            else:
+                value = parts[part]
+            if value == '':
+                break
+            thisKey += '~' + value
+        else:
+            if swapPart is not None:
+                keys.append(thisKey)
+    return keys
+
+
+def NearBlockingKeys(familyName, givenName, birthdate, sex, sounds):
+    '''
+Compute the Extensive blocking keys, that have a BirthdateNear part, for a record (sounds is the tuple returned by Sounds(familyName, givenName))
+The BirthdateNear part is not part of the key, as it matches a range of birthdates
+Returns the list of [key, BirthdateNear part]. A blocking key is not returned if the birthdate, or any other part, is missing
+    '''
+
+    if birthdate == '':
+        return []
+    parts = KeyParts(familyName, givenName, birthdate, sex, sounds)
+    keys = []
+    for blockName, blockParts in d.ExtensiveBlocking.items():
+        thisKey = blockName
+        nearPart = None
+        for part in blockParts:
+            if part in d.DefinedNearParts:
+                nearPart = part
+            elif (part in d.DefinedSwapParts) or (parts[part] == ''):
+                break
+            else:
+                thisKey += '~' + parts[part]
+        else:
+            if nearPart is not None:
+                keys.append([thisKey, nearPart])
+    return keys
+
+
+def NearRange(nearPart, birthdate):
+    '''
+Compute the range of birthdates (as day ordinals) within +/- 'n' days, months or years of a birthdate
+'n' is the parameter of the matching core data checking routine (BirthdateNearDay, BirthdateNearMonth or BirthdateNearYear)
+    '''
+
+    param = d.ExtensiveRoutines[nearPart][1]
+    (year, month, day) = birthdate.split('-')
+    year = int(year)
+    month = int(month)
+    day = int(day)
+    if nearPart == 'BirthdateNearDay':
+        ordinal = datetime.date(year, month, day).toordinal()
+        return (ordinal - param, ordinal + param)
+    if nearPart == 'BirthdateNearMonth':
+        firstMonth = year * 12 + month - 1 - param        # From the first day of the first month
+        lastMonth = year * 12 + month + param            # To the day before the month after the last month
+    else:
+        firstMonth = (year - param) * 12
+        lastMonth = (year + param + 1) * 12
+    firstMonth = max(firstMonth, 12)
+    if lastMonth >= 10000 * 12:
+        last = datetime.date.max.toordinal()
+    else:
+        last = datetime.date(lastMonth // 12, lastMonth % 12 + 1, 1).toordinal() - 1
+    return (datetime.date(firstMonth // 12, firstMonth % 12 + 1, 1).toordinal(), last)
+
+
+def NearBlock(nearKey, recNo, birthdate):
+    '''
+Add a record to the Extensive block for a blocking key with a BirthdateNear part
+    '''
+
+    if nearKey not in d.ExtensiveNearBlocks:
+        d.ExtensiveNearBlocks[nearKey] = []
+    d.ExtensiveNearBlocks[nearKey].append([Birthdate(birthdate).toordinal(), recNo])
+
+
+def NearBlocksIndex():
+    '''
+Sort each Extensive block for a blocking key with a BirthdateNear part into a sorted list of birthdate day ordinals plus the matching list of record numbers
+    '''
+
+    for nearKey, recs in d.ExtensiveNearBlocks.items():
+        recs.sort()
+        d.ExtensiveNearBlocks[nearKey] = [[rec[0] for rec in recs], [rec[1] for rec in recs]]
+
+
+def NearCandidates(nearKeys, birthdate):
+    '''
+Find the records, in the Extensive blocks for blocking keys with a BirthdateNear part (nearKeys, see NearBlockingKeys), with a birthdate within range of this record's birthdate
+Records without a birthdate (futureBirthdate) are never in these blocks
+    '''
+
+    candidates = []
+    for nearKey, nearPart in nearKeys:
+        if nearKey in d.ExtensiveNearBlocks:
+            (ordinals, recNos) = d.ExtensiveNearBlocks[nearKey]
+            (first, last) = NearRange(nearPart, birthdate)
+            nearRecNos = recNos[bisect_left(ordinals, first):bisect_right(ordinals, last)]
+            candidates += nearRecNos
+            if d.estimate:
+                EstimateBlock(nearKey, len(nearRecNos))
+    return candidates
+
+
+def CapBlocks():
+    '''
+Collect the value-frequency statistics for each blocking key, then split each Extensive block with more than d.ExtensiveMaxBlock records
+into sub-blocks, using the configured sub-block parts in turn, once all the secondary records are in their blocks
+A sub-block that is still too big, after all the sub-block parts have been used, falls back to a sorted neighbourhood (see SortedBlock)
+Blocks for blocking keys with a Birthdate swap part are never split, as the swapped partners need not share a sub-block part
+    '''
+
+    for blockKey, recNos in d.ExtensiveBlocks.items():
+        blockName = blockKey.split('~', 1)[0]
+        if blockName not in d.ExtensiveBlockStats:
+            d.ExtensiveBlockStats[blockName] = [0, 0, 0]
+        d.ExtensiveBlockStats[blockName][0] += 1
+        d.ExtensiveBlockStats[blockName][1] += len(recNos)
+        d.ExtensiveBlockStats[blockName][2] = max(d.ExtensiveBlockStats[blockName][2], len(recNos))
+    if d.ExtensiveMaxBlock == 0:
+        return
+    for blockKey in sorted(d.ExtensiveBlocks):
+        if len(d.ExtensiveBlocks[blockKey]) <= d.ExtensiveMaxBlock:
+            continue
+        blockName = blockKey.split('~', 1)[0]
+        if set(d.ExtensiveBlocking[blockName]) & set(d.DefinedSwapParts):
+            continue
+        d.ExtensiveCapped[blockKey] = [len(d.ExtensiveBlocks[blockKey]), 0, 0]
+        SplitBlock(blockKey, blockKey, 0)
+
+
+def SplitBlock(cappedKey, blockKey, level):
+    '''
+Split an Extensive block, that has more than d.ExtensiveMaxBlock records, into sub-blocks using the level(th) sub-block part
+The sub-blocks that are still too big are split using the next sub-block part, or become a sorted neighbourhood once all the sub-block parts have been used
+cappedKey is the original block, where the sub-blocks are counted for the report
+    '''
+
+    recNos = d.ExtensiveBlocks.pop(blockKey)
+    if level == len(d.ExtensiveSubBlockParts):
+        SortedBlock(cappedKey, blockKey, recNos)
+        return
+    part = d.ExtensiveSubBlockParts[level]
+    d.ExtensiveSplitBlocks[blockKey] = part
+    subBlocks = {}
+    for recNo in recNos:
+        record = d.ExtensiveSecondaryRecords[recNo]
+        parts = KeyParts(*d.ExtensiveSecondaryRecKey[recNo].split('~'), record.familyNameSounds + record.givenNameSounds)
+        subKey = blockKey + '~' + parts[part]
+        if subKey not in subBlocks:
+            subBlocks[subKey] = []
+        subBlocks[subKey].append(recNo)
+    for subKey, subRecNos in subBlocks.items():
+        d.ExtensiveBlocks[subKey] = subRecNos
+        if len(subRecNos) > d.ExtensiveMaxBlock:
+            SplitBlock(cappedKey, subKey, level + 1)
+        else:
+            d.ExtensiveCapped[cappedKey][1] += 1
+
+
+def SortedBlock(cappedKey, blockKey, recNos):
+    '''
+Turn a sub-block, that is still too big, into a sorted neighbourhood - the records sorted on FamilyName~GivenName~Birthdate
+A master record is only compared with the d.ExtensiveWindow records nearest to where it would sort (see MasterCandidates)
+    '''
+
+    sortedRecs = sorted(['~'.join(d.ExtensiveSecondaryRecKey[recNo].split('~', 3)[0:3]), recNo] for recNo in recNos)
+    d.ExtensiveSortedBlocks[blockKey] = [[sortedRec[0] for sortedRec in sortedRecs], [sortedRec[1] for sortedRec in sortedRecs]]
+    d.ExtensiveCapped[cappedKey][2] += 1
+
+
+def ReportCapped():
+    '''
+Report the value-frequency statistics for each blocking key and the Extensive blocks that were capped, as recall may be affected for the records in those blocks
+    '''
+
+    for blockName, (blocks, records, largest) in d.ExtensiveBlockStats.items():
+        d.rpt.write(f'{blocks}\tExtensive blocks for blocking key {blockName} [{records} records, the largest block has {largest} records]\n')
+    if len(d.ExtensiveCapped) == 0:
+        return
+    d.rpt.write(f'{len(d.ExtensiveCapped)}\tExtensive blocks with more than {d.ExtensiveMaxBlock} records were split on [{", ".join(d.ExtensiveSubBlockParts)}] (recall may be affected for these blocks)\n')
+    for blockKey, (records, subBlocks, sortedBlocks) in d.ExtensiveCapped.items():
+        line = f'\t[{blockKey} - {records} records split into {subBlocks} sub-blocks'
+        if sortedBlocks > 0:
+            line += f' plus {sortedBlocks} sorted neighbourhoods with a window size of {d.ExtensiveWindow}'
+        d.rpt.write(f'{line}]\n')
+
+
+def MasterCandidates(familyName, givenName, birthdate, sex, sounds):
+    '''
+Find the secondary records that share at least one Extensive block with this master record (sounds is the tuple returned by Sounds(familyName, givenName))
+If a block was split (see CapBlocks), then the master record's sub-block parts lead to its sub-block, or to the nearest records in a sorted neighbourhood
+Returns the sorted list of secondary record numbers (master records with no blocking key are counted in d.ExtensiveMasterUnblocked)
+    '''
+
+    blockKeys = BlockingKeys(familyName, givenName, birthdate, sex, sounds) + SwapBlockingKeys(familyName, givenName, birthdate, sex, sounds, False)
+    nearKeys = NearBlockingKeys(familyName, givenName, birthdate, sex, sounds)
+    if (len(blockKeys) == 0) and (len(nearKeys) == 0):
+        d.ExtensiveMasterUnblocked += 1
+        return []
+    candidates = set()
+    parts = None
+    for blockKey in blockKeys:
+        while blockKey in d.ExtensiveSplitBlocks:
+            if parts is None:
+                parts = KeyParts(familyName, givenName, birthdate, sex, sounds)
+            blockKey += '~' + parts[d.ExtensiveSplitBlocks[blockKey]]
+        if blockKey in d.ExtensiveBlocks:
+            blockRecNos = d.ExtensiveBlocks[blockKey]
+        elif blockKey in d.ExtensiveSortedBlocks:
+            (sortKeys, recNos) = d.ExtensiveSortedBlocks[blockKey]
+            i = bisect_left(sortKeys, familyName + '~' + givenName + '~' + birthdate)
+            blockRecNos = recNos[max(0, i - d.ExtensiveWindow // 2):i + (d.ExtensiveWindow + 1) // 2]
+        else:
+            continue
+        candidates.update(blockRecNos)
+        if d.estimate:
+            EstimateBlock(blockKey, len(blockRecNos))
+    candidates.update(NearCandidates(nearKeys, birthdate))
+    return sorted(candidates)
+
+
+def SortedNeighbourhood(recKeys, records):
+    '''
+Find the pairs of records to be compared using the configured sorted neighbourhood passes
+recKeys are the Extensive record keys (UR~FamilyName~GivenName~Birthdate~Sex) and records the ExtensiveRecords for each record number
+Each pass sorts the records on that pass's sorting key and pairs each record with the records that follow it in the sliding window
+Returns the neighbours of each record - Keys: record number, Values: the sorted list of larger record numbers to be compared with this record
+    '''
+
+    neighbours = {}
+    for passName, passParts in d.ExtensiveNeighbourhood.items():
+        sortKeys = {}
+        for recNo, recKey in recKeys.items():
+            if recKey == '':
+                continue
+            (familyName, givenName, birthdate, sex) = recKey.split('~')[1:]
+            parts = KeyParts(familyName, givenName, birthdate, sex, records[recNo].familyNameSounds + records[recNo].givenNameSounds)
+            sortKeys[recNo] = [parts[part] for part in passParts]
+        sortedRecs = sorted(sortKeys, key=lambda recNo, sortKeys=sortKeys: (sortKeys[recNo], recNo))
+        if d.estimate:                # Each run of records with the same sorting key is a block, and only pairs within the sliding window are compared
+            runs = {}
+            for sortKey in sortKeys.values():
+                runs['~'.join(sortKey)] = runs.get('~'.join(sortKey), 0) + 1
+            for sortKey, records in runs.items():
+                if records > 1:
+                    d.EstimateBlocks[f'{passName}~{sortKey}'] = [records, sum(min(d.ExtensiveWindow - 1, records - 1 - i) for i in range(records))]
+        for i, thisRec in enumerate(sortedRecs):
+            for otherRec in sortedRecs[i + 1:i + d.ExtensiveWindow]:
+                rec1 = min(thisRec, otherRec)
+                rec2 = max(thisRec, otherRec)
+                if rec1 not in neighbours:
+                    neighbours[rec1] = set()
+                neighbours[rec1].add(rec2)
+        logging.info('Sorted neighbourhood pass %s completed', passName)
+    for rec1, rec2s in neighbours.items():
+        neighbours[rec1] = sorted(rec2s)
+    return neighbours
+
+
+def ExtensiveTiles(weights):
+    '''
+Split the triangle of pairs of records into tiles (ranges of the sorted record numbers), each with about the same number of pairs
+weights are the number of pairs for each record. There are several tiles for each worker process, so the tiles can be handed out as workers become free
+Returns the list of [first, last] for each tile
+    '''
+
+    size = sum(weights) / (d.workers * 4)
+    tiles = []
+    first = 0
+    pairs = 0
+    for i, weight in enumerate(weights):
+        pairs += weight
+        if pairs >= size:
+            tiles.append([first, i + 1])
+            first = i + 1
+            pairs = 0
+    if first < len(weights):
+        tiles.append([first, len(weights)])
+    return tiles
+
+
+class UnionFind:
+    '''
+A union-find (disjoint set) of record numbers, with path compression, for grouping linked records into clusters
+The root of each cluster is always its lowest record number.
+    '''
+
+    def __init__(self):
+        self.parent = {}        # Keys: record number, Values: the parent record number (records not in the dictionary are their own root)
+
+    def find(self, recNo):
+        '''
+Return the root (lowest record number) of the cluster containing recNo
+        '''
+
+        root = recNo
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while recNo != root:        # Path compression - point every record on the path directly at the root
+            nextRec = self.parent[recNo]
+            self.parent[recNo] = root
+            recNo = nextRec
+        return root
+
+    def union(self, rec1, rec2):
+        '''
+Join the clusters containing rec1 and rec2
+        '''
+
+        root1 = self.find(rec1)
+        root2 = self.find(rec2)
+        if root1 < root2:
+            self.parent[root2] = root1
+        elif root2 < root1:
+            self.parent[root1] = root2
+
+
+def LinkedRecords():
+    '''
+Return a UnionFind of the records already linked at 100.0 confidence, being the possible duplicates, restored from a checkpoint, with a confidence of 100.0
+(records with identical core data are not linked, as they are never compared - they are probable duplicates)
+    '''
+
+    linked = UnionFind()
+    for (rec1, extensiveMatches) in d.ExtensiveFound:
+        for (rec2, totalConfidence, _, _) in extensiveMatches:
+            if totalConfidence == 100.0:
+                linked.union(rec1, rec2)
+    return linked
+
+
+def DuplicateClusters(duplicates):
+    '''
+Group the possible duplicates into clusters of linked records, so that each group of patients is reported once, rather than as every pair in the group
+duplicates is the list of [rec1, extensiveMatches] for each record with possible duplicates
+Returns the list of clusters, in order of their lowest record number, each being the sorted record numbers in the cluster,
+plus the best link for each record - Keys: record number, Values: [totalConfidence, linked record number, soundFamilyNameConfidence, soundGivenNameConfidence]
+(the best link is the highest confidence link, to the lowest record number if there is more than one)
+    '''
+
+    clusters = UnionFind()
+    bestLink = {}
+    for (rec1, extensiveMatches) in duplicates:
+        for (rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in extensiveMatches:
+            clusters.union(rec1, rec2)
+            for (recNo, linkedRec) in [(rec1, rec2), (rec2, rec1)]:
+                if (recNo not in bestLink) or (totalConfidence > bestLink[recNo][0]) or ((totalConfidence == bestLink[recNo][0]) and (linkedRec < bestLink[recNo][1])):
+                    bestLink[recNo] = [totalConfidence, linkedRec, soundFamilyNameConfidence, soundGivenNameConfidence]
+    members = {}
+    for recNo in sorted(bestLink):
+        root = clusters.find(recNo)
+        if root not in members:
+            members[root] = []
+        members[root].append(recNo)
+    return ([members[root] for root in sorted(members)], bestLink)
+
+
+def PrintDuplicateClusters(duplicates, fileName):
+    '''
+Save the clusters of possible duplicate master records (checkMaster.py) in the workbook fileName
+Each cluster is reported once - the first patient in the cluster, then each other patient with the patient they are most confidently linked to
+duplicates is the list of [rec1, extensiveMatches] for each record with possible duplicates
+Returns the number of clusters and the number of patients in the clusters
+    '''
+
+    openPossibleDuplicatesCheck()
+    patientCount = 0
+    (clusters, bestLink) = DuplicateClusters(duplicates)
+    for cluster in clusters:
+        patientCount += len(cluster)
+        patients = {}
+        for recNo in cluster:
+            (UR, Mf, Mg, Mdob, Msex) = d.ExtensiveMasterRecKey[recNo].split('~')[0:5]
+            if Mdob == '':
+                patients[recNo] = [UR, Mf, Mg, Mdob, Msex]
+            else:
+                patients[recNo] = [UR, Mf, Mg, d.ExtensiveMasterRecords[recNo].date, Msex]
+        line = ['Possible duplicate patients'] + patients[cluster[0]]
+        d.worksheet['pdc'].append(line)
+
+        # Then each other patient in the cluster, with the patient they are most confidently linked to
+        for rec2 in cluster[1:]:
+            (confidence, rec1, soundFamilyNameConfidence, soundGivenNameConfidence) = bestLink[rec2]
+            line = [''] + patients[rec1] + [confidence, soundFamilyNameConfidence, soundGivenNameConfidence] + patients[rec2]
+            line += OtherFieldMatches(d.ExtensiveMasterRecords[rec1], d.ExtensiveMasterRecords[rec2])
+            d.worksheet['pdc'].append(line)
+    PrintClose('pdc', 1, 4, fileName)
+    return (len(clusters), patientCount)
+
+
+def PrintPossibleDuplicates(duplicates, fileName):
+    '''
+Save the possible duplicate secondary records (checkSecondary.py) in the workbook fileName
+Each record with possible duplicates is followed by its possible duplicates, highest confidence first
+duplicates is the list of [rec1, extensiveMatches] for each record with possible duplicates
+Returns the number of records with possible duplicates
+    '''
+
+    openPossibleDuplicatesCheck()
+    possDuplicateChecks = 0
+    for (rec1, extensiveMatches) in duplicates:
+        (UR1, Sf1, Sg1, Sdob1, Ssex1) = d.ExtensiveSecondaryRecKey[rec1].split('~')[0:5]
+        record1 = d.ExtensiveSecondaryRecords[rec1]
+        possDuplicates = {}
+        for (rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in extensiveMatches:
+            (UR2, Sf2, Sg2, Sdob2, Ssex2) = d.ExtensiveSecondaryRecKey[rec2].split('~')[0:5]
+            if totalConfidence not in possDuplicates:
+                possDuplicates[totalConfidence] = []
+            if Sdob2 == '':
+                possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Sf2, Sg2, Sdob2, Ssex2])
+            else:
+                possDuplicates[totalConfidence].append([rec2, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, Sf2, Sg2, d.ExtensiveSecondaryRecords[rec2].date, Ssex2])
+        if len(possDuplicates.keys()) > 0:
+            possDuplicateChecks += 1
+            if Sdob1 == '':
+                line = ['Possible duplcate patient for', UR1, Sf1, Sg1, Sdob1, Ssex1]
+            else:
+                line = ['Possible duplcate patient for', UR1, Sf1, Sg1, record1.date, Ssex1]
+            d.worksheet['pdc'].append(line)
+            for confidence in (reversed(sorted(possDuplicates))):
+                for dup in (range(len(possDuplicates[confidence]))):
+                    line = ['', '', '', '', '', '', confidence]
+                    for field in (range(1, len(possDuplicates[confidence][dup]))):
+                        line.append(possDuplicates[confidence][dup][field])
+                    rec2 = possDuplicates[confidence][dup][0]
+                    line += OtherFieldMatches(record1, d.ExtensiveSecondaryRecords[rec2])
+                    d.worksheet['pdc'].append(line)
+    PrintClose('pdc', 1, 4, fileName)
+    return possDuplicateChecks
+
+
+def ExtensiveCheckTile(tile):
+    '''
+Check the records in one tile, each against all the records that follow it (or just its neighbours), for possible duplicates
+If d.ExtensiveLinked is not None, then pairs of records already linked at 100.0 confidence are not scored, and new 100.0 confidence links are added to it
+(a worker process only knows about the links that it has found, plus those made before the worker processes were started)
+Returns the list of [rec1, extensiveMatches] for each record with possible duplicates, plus the Extensive checking counts
+    '''
+
+    (first, last) = tile
+    (recKeys, records, table, neighbours, debugCount, recs) = d.ExtensiveCheck
+    linked = d.ExtensiveLinked
+    if d.workers > 1:                # A worker process returns the counts for just this tile
+        d.ExtensivePairsCompared = 0
+        d.ExtensivePairsLinked = 0
+        d.ExtensivePruned = {}
+        duplicates = []
+    else:                        # A single process carries on from any possible duplicates restored from a checkpoint
+        duplicates = d.ExtensiveFound
+    for i in range(first, last):
+        if (d.workers == 1) and (d.CheckpointCount > 0) and (i > first) and ((i % d.CheckpointCount) == 0):
+            CheckpointExtensive(i)
+        rec1 = recs[i]
+        if recKeys[rec1] == '':
+            continue
+        if neighbours is not None:
+            if rec1 not in neighbours:
+                continue
+            rec2s = neighbours[rec1]
+        else:
+            rec2s = recs[i + 1:]
+        record1 = records[rec1]
+        extensiveMatches = []
+        if d.Vectorised:
+            if neighbours is not None:
+                positions = table.positions(rec2s)
+            else:
+                positions = slice(table.index[rec1] + 1, None)
+            (extensiveMatches, count) = v.VectorMatches(table.array[table.index[rec1]], table, positions, True, True)
+            d.ExtensivePairsCompared += count
+        else:
+            root1 = linked.find(rec1) if linked is not None else None
+            for rec2 in rec2s:
+                if recKeys[rec2] == '':
+                    continue
+                record2 = records[rec2]
+                if (record1.familyName == record2.familyName) and (record1.givenName == record2.givenName) and (record1.birthdate == record2.birthdate) and (record1.sex == record2.sex):
+                    continue
+                if (linked is not None) and (linked.find(rec2) == root1):
+                    d.ExtensivePairsLinked += 1
+                    continue
+                d.ExtensivePairsCompared += 1
+                if d.FeatureFile is None:
+                    scores = d.ExtensiveScorer.score(record1, record2)
+                else:
+                    scores = FeatureScore(rec1, rec2, record1, record2)
+                if scores is None:
+                    continue
+                (totalConfidence, totalWeight, soundFamilyNameConfidence, soundGivenNameConfidence) = scores
+                if totalWeight == 0:
+                    continue
+                extensiveMatches.append([rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+                if (linked is not None) and (totalConfidence == 100.0):
+                    linked.union(rec1, rec2)
+                    root1 = linked.find(rec1)
+        if len(extensiveMatches) > 0:
+            duplicates.append([rec1, extensiveMatches])
+        if ((rec1 + 1) % debugCount) == 0:
+            logging.info('%d records extensively checked', rec1 + 1)
+    return (duplicates, d.ExtensivePairsCompared, d.ExtensivePairsLinked, d.ExtensivePruned)
+
+
+def ExtensiveDuplicates(recKeys, records, table, neighbours, debugCount):
+    '''
+Check every record against all the records that follow it (or just its neighbours if neighbours is not None) for possible duplicates
+recKeys are the Extensive record keys, records the ExtensiveRecords and table the vectorised Extensive table for each record number
+If there are worker processes, then the triangle of pairs is split into tiles and the tiles are handed out to the worker processes as they become free
+Returns the list of [rec1, extensiveMatches] for each record with possible duplicates, in record number order
+    '''
+
+    recs = sorted(recKeys)
+    d.ExtensiveCheck = (recKeys, records, table, neighbours, debugCount, recs)
+    if d.ExtensiveDone >= len(recs):                # Everything was checked before the last checkpoint
+        return d.ExtensiveFound
+    if d.workers == 1:
+        duplicates = ExtensiveCheckTile([d.ExtensiveDone, len(recs)])[0]
+        CheckpointExtensive(len(recs))
+        return duplicates
+
+    # Records already checked before the last checkpoint are not put in a tile
+    if neighbours is not None:
+        weights = [len(neighbours.get(rec1, [])) for rec1 in recs[d.ExtensiveDone:]]
+    else:
+        weights = list(range(len(recs) - d.ExtensiveDone - 1, -1, -1))
+    tiles = [[first + d.ExtensiveDone, last + d.ExtensiveDone] for (first, last) in ExtensiveTiles(weights)]
+    duplicates = d.ExtensiveFound
+    if d.fe is not None:
+        d.fe.flush()
+    with multiprocessing.get_context('fork').Pool(min(d.workers, len(tiles))) as pool:
+        # The tiles are returned in tile order, so the possible duplicates are in record number order
+        for tile, (tileDuplicates, pairsCompared, pairsLinked, pruned) in zip(tiles, pool.imap(ExtensiveCheckTile, tiles, 1)):
+            duplicates += tileDuplicates
+            d.ExtensivePairsCompared += pairsCompared
+            d.ExtensivePairsLinked += pairsLinked
+            for name, count in pruned.items():
+                d.ExtensivePruned[name] = d.ExtensivePruned.get(name, 0) + count
+            if d.CheckpointCount > 0:
+                CheckpointExtensive(tile[1])
+    return duplicates
+
+
+def SpellingDeletions(name):
+    '''
+Return the set of variants of a name made by deleting up to d.SpellingDistance characters (including the name itself)
+    '''
+
+    variants = {name}
+    edges = {name}
+    for _ in range(d.SpellingDistance):
+        deletions = set()
+        for variant in edges:
+            for i in range(len(variant)):
+                deletions.add(variant[:i] + variant[i + 1:])
+        edges = deletions - variants
+        variants |= edges
+    return variants
+
+
+class SpellingIndex:
+    '''
+A SymSpell style deletion neighbourhood index of a vocabulary of names
+Each distinct name is indexed under every variant made by deleting up to d.SpellingDistance characters.
+Two names within d.SpellingDistance edits of each other always share at least one variant,
+so the similar spellings of a name are found by looking up the variants of that name.
+    '''
+
+    def __init__(self):
+        self.names = set()        # The distinct names in the index
+        self.variants = {}        # Keys: deletion variant, Values: the names with that deletion variant
+
+    def add(self, name):
+        '''
+Add a name to the index
+        '''
+
+        if (name == '') or (name in self.names):
+            return
+        self.names.add(name)
+        for variant in SpellingDeletions(name):
+            if variant not in self.variants:
+                self.variants[variant] = []
+            self.variants[variant].append(name)
+
+    def near(self, name):
+        '''
+Return a dictionary of the indexed names within d.SpellingDistance edits of name - Keys: name, Values: edit distance
+(name itself is always returned with an edit distance of 0, as names are also matched exactly)
+        '''
+
+        nearNames = {name: 0}
+        if name == '':
+            return nearNames
+        checked = {name}
+        for variant in SpellingDeletions(name):
+            for otherName in self.variants.get(variant, []):
+                if otherName not in checked:
+                    checked.add(otherName)
+                    distance = levenshtein_distance(name, otherName)
+                    if distance <= d.SpellingDistance:
+                        nearNames[otherName] = distance
+        return nearNames
+
+
+def SaveStatus(secondaryRecNo, status, soundFound):
+    '''
+Assemble a concatinated list of all the Master file records numbers which have the same 'highest' status
+    '''
+
+    if secondaryRecNo in d.recStatus:
+        if d.recStatus[secondaryRecNo] > status:
+            return                            # Lower status - ignore
+
+        if d.recStatus[secondaryRecNo] < status :            # New higher status
+            d.foundRec[secondaryRecNo] = ''        # Start new list
+            d.foundSound[secondaryRecNo] = ''        # Start new list
+            d.recStatus[secondaryRecNo] = status            # Save status
+        if d.foundRec[secondaryRecNo] != '' :            # Concatentate if list already started
+            d.foundRec[secondaryRecNo] += '~' + str(d.masterRecNo)        # Append to the list
+            d.foundSound[secondaryRecNo] += '~' + soundFound        # Append to the list
+        else:
+            d.foundRec[secondaryRecNo] = str(d.masterRecNo)        # Start the list
+            d.foundSound[secondaryRecNo] = soundFound        # Start the list
+    else:
+        d.recStatus[secondaryRecNo] = status                # Save status
+        d.foundRec[secondaryRecNo] = str(d.masterRecNo)            # Start the list
+        d.foundSound[secondaryRecNo] = soundFound            # Start the list
+
+
+def MergeStatus(secondaryRecNo, status, foundRec, foundSound):
+    '''
+Merge the status and the list(s) of Master file records numbers found by a worker process, using the same rules as SaveStatus()
+(the highest status wins and the lists for the same status are concatenated)
+    '''
+
+    if d.recStatus[secondaryRecNo] > status:
+        return                            # Lower status - ignore
+
+    if d.recStatus[secondaryRecNo] < status :            # New higher status
+        d.foundRec[secondaryRecNo] = ''        # Start new list
+        d.foundSound[secondaryRecNo] = ''        # Start new list
+        d.recStatus[secondaryRecNo] = status            # Save status
+    if d.foundRec[secondaryRecNo] != '' :            # Concatentate if list already started
+        d.foundRec[secondaryRecNo] += '~' + foundRec        # Append to the list
+        d.foundSound[secondaryRecNo] += '~' + foundSound        # Append to the list
+    else:
+        d.foundRec[secondaryRecNo] = foundRec        # Start the list
+        d.foundSound[secondaryRecNo] = foundSound        # Start the list
+
+
+def FindMasterRecord():
+    '''
+Check if the current master PMI record (d.csvfields, record number d.masterRecNo) matches any secondary PMI records
+Matching keys update the status of the secondary PMI records (SaveStatus) and Extensive checking adds to d.possExtensiveFinds
+    '''
+
+    # Clean up the Master PMI family name and given name name
+    Mf = d.mc.masterCleanFamilyName()
+    Mg = d.mc.masterCleanGivenName()
+    Mdob = d.mc.masterCleanDOB()
+    Msex = d.mc.masterCleanSex()
+    thisKey = Mf + '~' + Mg + '~' + Mdob + '~' + Msex
+    if (d.masterDebugKey) and (d.masterDebugKey == thisKey):
+        logging.info('%s Test Patient:%s:%s:%s', d.masterLongName, d.mc.masterCleanPID(), d.mc.masterCleanUR(), thisKey)
+
+
+    # Check if this Master PMI file record matches any Secondary PMI records
+    sounds = Sounds(Mf, Mg)
+    (Mfny, Mfdm, Mfsx, Mgny, Mgdm, Mgsx) = sounds
+    found = False
+    if thisKey in d.fullKey:
+        found = True
+        for secRecNo in d.fullKey[thisKey]:
+            SaveStatus(secRecNo, 6, '')
+
+    # Check for a Sound match
+    if not found:
+        soundFound = ''
+        soundKeydm = Mfdm + '~' + Mgdm+ '~' + Mdob + '~' + Msex
+        if soundKeydm in d.keySdm:
+            soundFound = '1'
+        else:
+            soundFound = '0'
+        soundKeyny = Mfny + '~' + Mgny + '~' + Mdob + '~' + Msex
+        if soundKeyny in d.keySny:
+            soundFound += '1'
+        else:
+            soundFound += '0'
+        soundKeysx = Mfsx + '~' + Mgsx + '~' + Mdob + '~' + Msex
+        if soundKeysx in d.keySsx:
+            soundFound += '1'
+        else:
+            soundFound += '0'
+        if soundFound != '000':
+            found = True
+            if soundKeydm in d.keySdm:
+                for secRecNo in d.keySdm[soundKeydm]:
+                    SaveStatus(secRecNo, 5, soundFound)
+            elif soundKeyny in d.keySny:
+                for secRecNo in d.keySny[soundKeyny]:
+                    SaveStatus(secRecNo, 5, soundFound)
+            elif soundKeysx in d.keySsx:
+                for secRecNo in d.keySsx[soundKeysx]:
+                    SaveStatus(secRecNo, 5, soundFound)
+
+    # And finally the four partial keys
+    if not found:
+        thisKey = Mf + '~' + Mg + '~' + Mdob
+        if thisKey in d.key123:
+            found = True
+            for secRecNo in d.key123[thisKey]:
+                SaveStatus(secRecNo, 4, '')
+    if not found:
+        thisKey = Mf + '~' + Mg + '~' + Msex
+        if thisKey in d.key124:
+            found = True
+            for secRecNo in d.key124[thisKey]:
+                SaveStatus(secRecNo, 3, '')
+    if not found:
+        thisKey = Mf + '~' + Mdob + '~' + Msex
+        if thisKey in d.key134:
+            found = True
+            for secRecNo in d.key134[thisKey]:
+                SaveStatus(secRecNo, 2, '')
+    if not found:
+        thisKey = Mg + '~' + Mdob + '~' + Msex
+        if thisKey in d.key234:
+            found = True
+            for secRecNo in d.key234[thisKey]:
+                SaveStatus(secRecNo, 1, '')
+
+    # Then the spelling keys - similarly spelt family name and/or given name, plus matching birthdate and sex
+    # The sound match records the edit distance of the family name and given name (e.g. '10')
+    if (not found) and (d.SpellingDistance > 0):
+        nearGivenNames = d.SpellingGivenNames.near(Mg)
+        for nearFamilyName, familyDistance in d.SpellingFamilyNames.near(Mf).items():
+            for nearGivenName, givenDistance in nearGivenNames.items():
+                if (familyDistance + givenDistance) == 0:
+                    continue
+                thisKey = nearFamilyName + '~' + nearGivenName + '~' + Mdob + '~' + Msex
+                if thisKey in d.fullKey:
+                    for secRecNo in d.fullKey[thisKey]:
+                        SaveStatus(secRecNo, 0, f'{familyDistance}{givenDistance}')
+
+    # For Extensive checking we compute a confidence level that this master record matches each secondary record
+    # There can be multiple secondary records claiming to be linked to each master record
+    if not d.Extensive:
+        return
+    (masterRecord, masterRow, candidates) = MasterExtensive(Mf, Mg, Mdob, Msex, sounds)
+    d.ExtensivePairsSkipped += len(d.ExtensiveSecondaryRecKey) - len(candidates)
+    # With a time budget, the Extensive checking is done later, best first, re-reading this master record (see BudgetFind)
+    if d.TimeBudget > 0:
+        if len(candidates) > 0:
+            d.BudgetWork.append((0 if found else 1, len(candidates), d.masterRecNo, d.mc.masterCleanPID(), d.mc.masterCleanUR()))
+        return
+    FindExtensive(d.masterRecNo, masterRecord, masterRow, candidates)
+
+
+def MasterExtensive(Mf, Mg, Mdob, Msex, sounds):
+    '''
+Build the ExtensiveRecord of the current master PMI record (d.csvfields) from its cleaned family name, given name, birthdate and sex
+Returns the ExtensiveRecord, its encoded row (None if not vectorised) and the candidate secondary record numbers
+    '''
+
+    Mmn = None
+    if d.useMiddleNames:
+        Mmn = masterField('MiddleNames').upper()
+    masterRecord = ExtensiveRecord(Mf, Mg, Mdob, Msex, Mmn, ExtensiveOtherFields(masterField))
+    # Only compare this master record with secondary records that share a block (or every secondary record if there are no blocks)
+    if d.ExtensiveBlocking:
+        candidates = MasterCandidates(Mf, Mg, Mdob, Msex, sounds)
+    else:
+        candidates = d.ExtensiveSecondaryRecKey.keys()
+    masterRow = None
+    if d.Vectorised:
+        masterRow = v.VectorRow(masterRecord)
+    return (masterRecord, masterRow, candidates)
+
+
+def FindExtensive(masterRecNo, masterRecord, masterRow, candidates):
+    '''
+Extensively check a master PMI record (masterRecord, or, if vectorised, its encoded row) against each of its candidate secondary PMI records
+and save the master record against each secondary record where there is an adequate match (d.possExtensiveFinds)
+    '''
+
+    d.ExtensivePairsCompared += len(candidates)
+    extensiveMatches = []
+    if d.Vectorised:
+        if d.ExtensiveBlocking:
+            positions = d.ExtensiveSecondaryTable.positions(candidates)
+        else:
+            positions = slice(None)
+        extensiveMatches = v.VectorMatches(masterRow, d.ExtensiveSecondaryTable, positions, False, False)[0]
+    else:
+        # Compute the goodness of fit between each secondary record and the master record
+        for secRecNo in candidates:
+            if d.FeatureFile is None:
+                scores = d.ExtensiveScorer.score(masterRecord, d.ExtensiveSecondaryRecords[secRecNo])
+            else:
+                scores = FeatureScore(masterRecNo, secRecNo, masterRecord, d.ExtensiveSecondaryRecords[secRecNo])
+            if scores is not None:
+                (totalConfidence, _, soundFamilyNameConfidence, soundGivenNameConfidence) = scores
+                extensiveMatches.append([secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+        if (d.FeatureFile is not None) and (len(candidates) > 0):        # Any of these pairs could become a possible find when the pair feature cache is re-scored
+            d.FeatureMasterRecs[masterRecNo] = True
+    # And save this master data against each secondary record where we have an adequate match
+    # (and against the other secondary records with the same Extensive checking data, which were not checked)
+    # A master record can be matched to multiple secondary records, with varying degrees of confidence (multiple secondary rows with the same AltUR)
+    # A secondary record can only be matched to multiple master records if there are multiple master records with the same UR!!!
+    for (secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in extensiveMatches:
+        for memberRecNo in d.ExtensiveMembers.get(secRecNo, [secRecNo]):
+            SavePossible(d.possExtensiveFinds, memberRecNo, masterRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence)
+
+
+def BudgetFind(masterCSV, masterRecords, masterLines):
+    '''
+Extensively check the master PMI records saved by FindMasterRecord() (d.BudgetWork), best first, until the time budget runs out
+Best first is the master records that matched a secondary record on the full key, a sound key or a partial key,
+then the master records with the fewest candidate secondary records (the smallest and most specific blocks), then master record order
+Only the sort keys, record number, PID and UR of each master record are saved, so each master record is re-read from the master PMI file (see BudgetOffsets)
+The master records that were not checked before the time budget ran out are saved in d.BudgetLeft (see BudgetReport)
+    '''
+
+    if masterLines != masterRecords + 1:
+        logging.fatal('%s contains records that span lines - cannot be re-read for the time budget', masterCSV)
+        sys.exit(EX_DATAERR)
+    d.BudgetWork.sort(key=lambda work: work[0:3])
+    offsets = BudgetOffsets(masterCSV, {work[2] for work in d.BudgetWork})
+    lastRecNo = d.masterRecNo
+    with open(masterCSV, 'rb') as csvfile:
+        for i, (_, _, masterRecNo, _, _) in enumerate(d.BudgetWork):
+            if time.monotonic() >= d.BudgetEnd:
+                logging.warning('The time budget ran out after extensively checking %d of %d master PMI records', i, len(d.BudgetWork))
+                d.BudgetLeft = [work[1:5] for work in d.BudgetWork[i:]]
+                break
+            (masterRecord, masterRow, candidates) = BudgetRecord(csvfile, masterRecNo, offsets[masterRecNo])
+            FindExtensive(masterRecNo, masterRecord, masterRow, candidates)
+            d.BudgetChecked += 1
+            if (d.BudgetChecked % d.masterDebugCount) == 0:
+                logging.info('%d master PMI records extensively checked, best first', d.BudgetChecked)
+
+        # The secondary records not compared with all their candidate master records, for the coverage report
+        for (_, masterRecNo, _, _) in d.BudgetLeft:
+            if len(d.BudgetSecondaryLeft) == len(d.ExtensiveSecondaryRecKey):
+                break
+            d.BudgetSecondaryLeft.update(BudgetRecord(csvfile, masterRecNo, offsets[masterRecNo])[2])
+    d.masterRecNo = lastRecNo
+    d.BudgetWork = []
+    # Keep the possible finds in master record order, as if the master PMI records had been checked in order
+    if d.ExtensiveTopK == 0:
+        for confidences in d.possExtensiveFinds.values():
+            for masterRecNos in confidences.values():
+                masterRecNos.sort(key=lambda masterRecNo: masterRecNo[0])
+
+
+def BudgetOffsets(masterCSV, masterRecNos):
+    '''
+Find where each of the master PMI records masterRecNos starts in the master PMI file (every record is on one line)
+Returns the byte offsets - Keys: record number, Values: offset
+    '''
+
+    offsets = {}
+    with open(masterCSV, 'rb') as csvfile:
+        csvfile.readline()                    # Skip the heading
+        offset = csvfile.tell()
+        for masterRecNo, line in enumerate(csvfile, 1):
+            if masterRecNo in masterRecNos:
+                offsets[masterRecNo] = offset
+            offset += len(line)
+    return offsets
+
+
+def BudgetRecord(csvfile, masterRecNo, offset):
+    '''
+Re-read master PMI record masterRecNo, starting at offset in the master PMI file (csvfile), into d.csvfields
+Returns its ExtensiveRecord, encoded row and candidate secondary record numbers (see MasterExtensive)
+    '''
+
+    csvfile.seek(offset)
+    d.csvfields = next(csv.reader(io.TextIOWrapper(io.BytesIO(csvfile.readline())), dialect='excel'))
+    d.masterRecNo = masterRecNo
+    Mf = d.mc.masterCleanFamilyName()
+    Mg = d.mc.masterCleanGivenName()
+    Mdob = d.mc.masterCleanDOB()
+    Msex = d.mc.masterCleanSex()
+    return MasterExtensive(Mf, Mg, Mdob, Msex, Sounds(Mf, Mg))
+
+
+def BudgetReport():
+    '''
+Report the coverage of the time budgeted Extensive checking ({ShortName}_{progName}_Coverage.txt)
+- what was checked, what was not, and the master PMI records that were not checked (best first, so the next to be checked are listed first)
+    '''
+
+    left = 0
+    for (size, _, _, _) in d.BudgetLeft:
+        left += size
+    membersLeft = 0
+    for secRecNo in d.BudgetSecondaryLeft:
+        membersLeft += len(d.ExtensiveMembers.get(secRecNo, [secRecNo]))
+    openReport('Coverage')
+    heading = f'Extensive checking coverage - {d.progName}'
+    d.rpt.write(f'{heading}\n')
+    heading = re.sub('[^ ]', '_', heading)
+    d.rpt.write(f'{heading}\n')
+    d.rpt.write(f'{d.TimeBudget:g}\tMinutes of time budget\n')
+    d.rpt.write(f'{d.BudgetChecked + len(d.BudgetLeft)}\t{d.masterLongName} patients with candidate {d.secondaryLongName} patients\n')
+    d.rpt.write(f'{d.BudgetChecked}\t{d.masterLongName} patients extensively checked [{d.ExtensivePairsCompared} pairs of records compared]\n')
+    d.rpt.write(f'{len(d.BudgetLeft)}\t{d.masterLongName} patients not extensively checked before the time budget ran out [{left} pairs of records not compared]\n')
+    d.rpt.write(f'{membersLeft}\t{d.secondaryLongName} patients not compared with all their candidate {d.masterLongName} patients\n')
+    if len(d.BudgetLeft) > 0:
+        d.rpt.write(f'\nThe {d.masterLongName} patients not extensively checked (the next to be checked first)\n')
+        for (size, _, pid, ur) in d.BudgetLeft:
+            d.rpt.write(f'{size}\tPairs of records not compared - {d.masterLongName} {d.masterPIDname} {pid} ({d.masterURname} {ur})\n')
+    d.rpt.close()
+
+
+def MatchMasterRecord(ur, masterRecord):
+    '''
+Extensively check the current master PMI record (d.masterRecNo) against each secondary PMI record with an AltUR matching this master record's UR (matchAltUR.py)
+and save this master data against each secondary record where there is an adequate match (d.possExtensiveMatches)
+    '''
+
+    # For vectorised Extensive checking we score this master record against all the associated secondary records at once
+    if d.Vectorised:
+        secRecNos = [secRecNo for secRecNo in d.altUR[ur] if secRecNo in d.ExtensiveSecondaryTable.index]
+        masterRow = v.VectorRow(masterRecord)
+        extensiveMatches = v.VectorMatches(masterRow, d.ExtensiveSecondaryTable, d.ExtensiveSecondaryTable.positions(secRecNos), False, False)[0]
+    else:
+        # Compute the goodness of fit between each secondary record and the master record
+        extensiveMatches = []
+        for secRecNo in d.altUR[ur]:
+            scores = d.ExtensiveScorer.score(masterRecord, d.ExtensiveSecondaryRecords[secRecNo])
+            if scores is not None:
+                (totalConfidence, _, soundFamilyNameConfidence, soundGivenNameConfidence) = scores
+                extensiveMatches.append([secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+    # A master record can be matched to multiple secondary records, with varying degrees of confidence (multiple secondary rows with the same AltUR)
+    # A secondary record can only be matched to multiple master records if there are multiple master records with the same UR!!!
+    for (secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in extensiveMatches:
+        SavePossible(d.possExtensiveMatches, secRecNo, d.masterRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence)
+
+
+def MasterShards(masterCSV):
+    '''
+Split the master PMI file into d.workers byte ranges (shards), each starting at the start of a line
+Returns the list of [masterCSV, start, end, first record number] for each shard, skipping the heading line
+    '''
+
+    size = os.path.getsize(masterCSV)
+    shards = []
+    with open(masterCSV, 'rb') as csvfile:
+        csvfile.readline()                    # Skip the heading
+        start = csvfile.tell()
+        masterRecNo = 1
+        for worker in range(1, d.workers + 1):
+            if worker == d.workers:
+                end = size
+            else:
+                end = max(size * worker // d.workers, start)
+                if 0 < end < size:
+                    csvfile.seek(end - 1)
+                    csvfile.readline()                # Move to the start of the next line
+                    end = csvfile.tell()
+            if end > start:
+                shards.append([masterCSV, start, end, masterRecNo])
+                csvfile.seek(start)
+                masterRecNo += csvfile.read(end - start).count(b'\n')
+            start = end
+    return shards
+
+
+def FindMasterShard(shard):
+    '''
+Check every master PMI record in one shard of the master PMI file (run in a worker process)
+Returns the record count, the found status of the secondary PMI records matched, the Extensive finds (and overflow counts), the Extensive checking counts
+and the phonetic codes added to the phonetic code store for this shard
+    '''
+
+    (masterCSV, start, end, firstRecNo) = shard
+
+    # Start with no found status, so only the status found in this shard is returned
+    d.recStatus = {}
+    d.foundRec = {}
+    d.foundSound = {}
+    d.possExtensiveFinds = {}
+    d.possExtensiveOverflow = {}
+    d.ExtensivePairsCompared = 0
+    d.ExtensivePairsSkipped = 0
+    d.ExtensiveMasterUnblocked = 0
+    d.ExtensivePruned = {}
+    nameCodes = len(d.NameCodes)        # The phonetic code store is in insertion order, so the codes added by this shard follow these
+    with open(masterCSV, 'rb') as csvfile:
+        csvfile.seek(start)
+        data = csvfile.read(end - start)
+    masterPMI = csv.reader(io.TextIOWrapper(io.BytesIO(data)), dialect='excel')
+    d.masterRecNo = firstRecNo - 1
+    for d.csvfields in masterPMI :
+        d.masterRecNo += 1
+        if (d.masterRecNo % d.masterDebugCount) == 0:
+            logging.info('%d master PMI records checked', d.masterRecNo)
+        if d.masterRecNo <= d.CheckpointRecNo:        # Already checked before the last checkpoint
+            continue
+        FindMasterRecord()
+    newCodes = dict(list(d.NameCodes.items())[nameCodes:])
+    return (d.masterRecNo - firstRecNo + 1, d.recStatus, d.foundRec, d.foundSound, d.possExtensiveFinds, d.possExtensiveOverflow, d.ExtensivePairsCompared, d.ExtensivePairsSkipped, d.ExtensiveMasterUnblocked, d.ExtensivePruned, newCodes)
+
+
+def FindMasterShards(masterCSV, masterRecords, masterLines):
+    '''
+Check every master PMI record using d.workers worker processes, each checking one shard of the master PMI file against the secondary PMI keys
+The worker processes are forked, so they share the keys built from the secondary PMI file
+The results are merged in shard order, which gives the same results, in the same order, as checking the master PMI records one at a time
+    '''
+
+    if masterLines != masterRecords + 1:
+        logging.fatal('%s contains records that span lines - cannot be split for %d workers', masterCSV, d.workers)
+        sys.exit(EX_DATAERR)
+    shards = MasterShards(masterCSV)
+    d.fe.flush()
+    with multiprocessing.get_context('fork').Pool(len(shards)) as pool:
+        results = pool.map(FindMasterShard, shards, 1)
+
+    # Merge the results from each shard
+    for i, (count, recStatus, foundRec, foundSound, possExtensiveFinds, possExtensiveOverflow, pairsCompared, pairsSkipped, masterUnblocked, pruned, newCodes) in enumerate(results):
+        if i + 1 < len(shards):
+            expected = shards[i + 1][3] - shards[i][3]
+        else:
+            expected = masterRecords - shards[i][3] + 1
+        if count != expected:
+            logging.fatal('%s shard %d contained %d records - expected %d', masterCSV, i + 1, count, expected)
+            sys.exit(EX_SOFTWARE)
+        for secRecNo, status in recStatus.items():
+            MergeStatus(secRecNo, status, foundRec[secRecNo], foundSound[secRecNo])
+        if d.ExtensiveTopK == 0:
+            for secRecNo, confidences in possExtensiveFinds.items():
+                if secRecNo not in d.possExtensiveFinds:
+                    d.possExtensiveFinds[secRecNo] = {}
+                for totalConfidence, masterRecs in confidences.items():
+                    if totalConfidence not in d.possExtensiveFinds[secRecNo]:
+                        d.possExtensiveFinds[secRecNo][totalConfidence] = []
+                    d.possExtensiveFinds[secRecNo][totalConfidence] += masterRecs
+        else:
+            for secRecNo, heap in possExtensiveFinds.items():
+                for (totalConfidence, negativeMasterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence) in heap:
+                    SavePossible(d.possExtensiveFinds, secRecNo, -negativeMasterRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence)
+            for secRecNo, overflow in possExtensiveOverflow.items():
+                d.possExtensiveOverflow[secRecNo] = d.possExtensiveOverflow.get(secRecNo, 0) + overflow
+        d.ExtensivePairsCompared += pairsCompared
+        d.ExtensivePairsSkipped += pairsSkipped
+        d.ExtensiveMasterUnblocked += masterUnblocked
+        for name, count in pruned.items():
+            d.ExtensivePruned[name] = d.ExtensivePruned.get(name, 0) + count
+        for name, codes in newCodes.items():        # Keep the phonetic codes computed by the worker processes for later runs
+            if name not in d.NameCodes:
+                d.NameCodes[name] = codes
+                d.NameCodesAdded += 1
+    d.masterRecNo = masterRecords
+
+
+def FileDigest(fileName):
+    '''
+The SHA-256 digest of the contents of a file
+    '''
+
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as fileHandle:
+        for block in iter(lambda: fileHandle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def StartCheckpoints(fileName, files, options):
+    '''
+Start checkpointing to fileName - a checkpoint is only valid for the same input files, configuration and options
+So save the fingerprint (SHA-256 digest) of each of the files, plus the options, to be checked when resuming
+If resuming, then restore the d.* values saved in the last checkpoint (if there is one)
+and re-log the errors logged after checkpointing started, which were lost when the error log csv file was re-created
+    '''
+
+    d.CheckpointFile = fileName
+    d.CheckpointSignature = {'files': {}, 'options': options}
+    for thisFile in files:
+        if os.path.exists(thisFile):
+            d.CheckpointSignature['files'][thisFile] = FileDigest(thisFile)
+    d.fe.flush()
+    d.CheckpointErrors = d.fe.tell()
+    if not d.resume:
+        return
+    if not os.path.exists(fileName):
+        logging.warning('No checkpoint (%s) to resume from - starting from the beginning', fileName)
+        return
+    try:
+        with open(fileName, 'rb') as checkpointFile:
+            checkpoint = pickle.load(checkpointFile)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logging.fatal('cannot read the checkpoint %s: %s', fileName, e)
+        sys.exit(EX_IOERR)
+    if checkpoint['signature']['options'] != options:
+        logging.fatal('cannot resume from %s - it was saved with different options (%s)', fileName, checkpoint['signature']['options'])
+        sys.exit(EX_USAGE)
+    changed = []
+    for thisFile in sorted(set(checkpoint['signature']['files']) | set(d.CheckpointSignature['files'])):
+        if checkpoint['signature']['files'].get(thisFile) != d.CheckpointSignature['files'].get(thisFile):
+            changed.append(thisFile)
+    if len(changed) > 0:
+        logging.fatal('cannot resume from %s - %s changed since the checkpoint was saved', fileName, ', '.join(changed))
+        sys.exit(EX_DATAERR)
+    for name, value in checkpoint['values'].items():
+        setattr(d, name, value)
+    d.fe.write(checkpoint['errors'])
+    logging.info('Resuming from the checkpoint saved %s', checkpoint['stage'])
+
+
+def Checkpoint(stage, names):
+    '''
+Save the named d.* values, plus the errors logged since checkpointing started, so that a later run can resume from here
+The checkpoint is written to a temporary file and then renamed, so the checkpoint file always holds the last consistent checkpoint
+    '''
+
+    if (d.CheckpointFile is None) or (d.CheckpointCount == 0):
+        return
+    d.fe.flush()
+    with open(d.fe.name, 'rt', newline='') as errorFile:
+        errorFile.seek(d.CheckpointErrors)
+        errors = errorFile.read()
+    checkpoint = {'signature': d.CheckpointSignature, 'stage': stage, 'values': {}, 'errors': errors}
+    for name in names:
+        checkpoint['values'][name] = getattr(d, name)
+    try:
+        with open(d.CheckpointFile + '.tmp', 'wb') as checkpointFile:
+            pickle.dump(checkpoint, checkpointFile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(d.CheckpointFile + '.tmp', d.CheckpointFile)
+    except OSError as e:
+        logging.warning('cannot save the checkpoint in %s: %s', d.CheckpointFile, e)
+        return
+    logging.info('Checkpoint saved %s', stage)
+
+
+def CheckpointFind(stage):
+    '''
+Save a findUR.py checkpoint - the status of the secondary PMI records, the Extensive finds, the Extensive checking counts
+and the master PMI link maps, for the master PMI records checked so far
+    '''
+
+    d.CheckpointRecNo = d.masterRecNo
+    Checkpoint(f'{stage} after {d.masterRecNo} master PMI records', ['CheckpointRecNo', 'recStatus', 'foundRec', 'foundSound', 'possExtensiveFinds', 'possExtensiveOverflow',
+                                                               'ExtensivePairsCompared', 'ExtensivePairsSkipped', 'ExtensiveMasterUnblocked', 'ExtensivePruned',
+                                                               'URrec', 'URdup', 'PIDrec', 'PIDdup', 'aCount', 'mCount', 'masterPrimRec', 'masterLinkRec', 'masterNewRec'])
+
+
+def CheckpointExtensive(done):
+    '''
+Save a checkMaster.py checkpoint - the possible duplicates found, and the Extensive checking counts, for the first 'done' records checked
+    '''
+
+    d.ExtensiveDone = done
+    Checkpoint(f'after {done} records extensively checked', ['ExtensiveDone', 'ExtensiveFound', 'ExtensivePairsCompared', 'ExtensivePairsLinked', 'ExtensivePruned'])
+
+
+def EndCheckpoints():
+    '''
+Remove the checkpoint file at the end of a successful run, as there is nothing left to resume
+    '''
+
+    if (d.CheckpointFile is None) or (not os.path.exists(d.CheckpointFile)):
+        return
+    try:
+        os.remove(d.CheckpointFile)
+    except OSError as e:
+        logging.warning('cannot remove the checkpoint %s: %s', d.CheckpointFile, e)
+
+
+def PeakMemory():
+    '''
+The peak memory (in MB) used by this process so far, or None if the operating system cannot report it
+    '''
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':        # macOS reports bytes, rather than kilobytes
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def SizeOf(thing):
+    '''
+The bytes of memory used by thing, including the lists, tuples, sets and dictionaries (and their contents) that it holds
+    '''
+
+    size = sys.getsizeof(thing)
+    if isinstance(thing, dict):
+        for key, value in thing.items():
+            size += SizeOf(key) + SizeOf(value)
+    elif isinstance(thing, (list, tuple, set)):
+        for item in thing:
+            size += SizeOf(item)
+    return size
+
+
+def EstimateBlock(block, pairs):
+    '''
+Count one more record, and its pairs of records, for a block when estimating the cost of the Extensive checking
+    '''
+
+    if block not in d.EstimateBlocks:
+        d.EstimateBlocks[block] = [0, 0]
+    d.EstimateBlocks[block][0] += 1
+    d.EstimateBlocks[block][1] += pairs
+
+
+def EstimatePossibles(possibles):
+    '''
+Save the count, and the memory used, of the possible Extensive matches found in the timed sample (d.possExtensiveFinds or d.possExtensiveMatches - see SavePossible)
+    '''
+
+    d.EstimatePossibles = 0
+    for possible in possibles.values():
+        if isinstance(possible, dict):
+            for masterRecs in possible.values():
+                d.EstimatePossibles += len(masterRecs)
+        else:
+            d.EstimatePossibles += len(possible)
+    d.EstimateSize = SizeOf(possibles)
+
+
+def EstimateFind(masterCSV):
+    '''
+Estimate the cost of the Extensive checking in findUR.py
+Count the candidate pairs for every master PMI record and time the checking (FindMasterRecord) of an evenly spaced sample of the master PMI records
+    '''
+
+    with open(masterCSV, 'rt') as csvfile:
+        d.EstimateRecords = sum(1 for row in csv.reader(csvfile, dialect='excel')) - 1
+    stride = max(1, d.EstimateRecords // d.EstimateSampleSize)
+    with open(masterCSV, 'rt') as csvfile:
+        masterPMI = csv.reader(csvfile, dialect='excel')
+        d.masterRecNo = 0
+        heading = True
+        for d.csvfields in masterPMI:
+            if heading:
+                heading = False
+                continue
+
+            # Report progress
+            d.masterRecNo += 1
+            if (d.masterRecNo % d.masterDebugCount) == 0:
+                logging.info('%d master PMI records estimated', d.masterRecNo)
+
+            if (d.masterRecNo % stride) == 0:
+                pairsCompared = d.ExtensivePairsCompared
+                start = time.perf_counter()
+                FindMasterRecord()
+                d.EstimateTime += time.perf_counter() - start
+                d.EstimateSampled += 1
+                d.EstimatePairs += d.ExtensivePairsCompared - pairsCompared
+            elif d.ExtensiveBlocking:
+                Mf = d.mc.masterCleanFamilyName()
+                Mg = d.mc.masterCleanGivenName()
+                d.EstimatePairs += len(MasterCandidates(Mf, Mg, d.mc.masterCleanDOB(), d.mc.masterCleanSex(), Sounds(Mf, Mg)))
+            else:
+                d.EstimatePairs += len(d.ExtensiveSecondaryRecKey)
+    EstimatePossibles(d.possExtensiveFinds)
+
+
+def EstimateMatch(masterCSV):
+    '''
+Estimate the cost of the Extensive checking in matchAltUR.py
+Count the pairs of records for every master PMI record with a UR that is a secondary PMI AltUR, and time the checking (MatchMasterRecord) of an evenly spaced sample of them
+    '''
+
+    with open(masterCSV, 'rt') as csvfile:
+        masterPMI = csv.reader(csvfile, dialect='excel')
+        heading = True
+        for d.csvfields in masterPMI:
+            if heading:
+                heading = False
+                continue
+            ur = d.mc.masterCleanUR()
+            if ur in d.altUR:
+                d.EstimateRecords += 1
+                d.EstimatePairs += len(d.altUR[ur])
+                EstimateBlock(f'{d.secondaryAltURname} {ur}', len(d.altUR[ur]))
+    stride = max(1, d.EstimateRecords // d.EstimateSampleSize)
+    with open(masterCSV, 'rt') as csvfile:
+        masterPMI = csv.reader(csvfile, dialect='excel')
+        d.masterRecNo = 0
+        wanted = 0
+        heading = True
+        for d.csvfields in masterPMI:
+            if heading:
+                heading = False
+                continue
+            d.masterRecNo += 1
+            ur = d.mc.masterCleanUR()
+            if ur not in d.altUR:
+                continue
+            wanted += 1
+            if (wanted % stride) != 0:
+                continue
+            start = time.perf_counter()
+            Mf = d.mc.masterCleanFamilyName()
+            Mg = d.mc.masterCleanGivenName()
+            Mdob = d.mc.masterCleanDOB()
+            Msex = d.mc.masterCleanSex()
+            Mmn = None
+            if d.useMiddleNames:
+                Mmn = masterField('MiddleNames').upper()
+            MatchMasterRecord(ur, ExtensiveRecord(Mf, Mg, Mdob, Msex, Mmn, ExtensiveOtherFields(masterField)))
+            d.EstimateTime += time.perf_counter() - start
+            d.EstimateSampled += 1
+    EstimatePossibles(d.possExtensiveMatches)
+
+
+def EstimateDuplicates(recKeys, records, table, neighbours):
+    '''
+Estimate the cost of the Extensive checking for possible duplicates in checkMaster.py and checkSecondary.py
+Count the pairs of records and time the checking (ExtensiveCheckTile) of an evenly spaced sample of the records, each against all the records that follow it (or just its neighbours)
+    '''
+
+    recs = sorted(recKeys)
+    d.ExtensiveCheck = (recKeys, records, table, neighbours, len(recs) + 1, recs)        # No progress messages for the sample
+    d.EstimateRecords = len(recs)
+    if neighbours is not None:
+        d.EstimatePairs = sum(len(rec2s) for rec2s in neighbours.values())
+    else:
+        checked = sum(1 for recKey in recKeys.values() if recKey != '')
+        d.EstimatePairs = checked * (checked - 1) // 2
+    stride = max(1, len(recs) // d.EstimateSampleSize)
+    workers = d.workers
+    d.workers = 1                # The sample is checked by this process
+    for i in range(0, len(recs), stride):
+        start = time.perf_counter()
+        ExtensiveCheckTile([i, i + 1])
+        d.EstimateTime += time.perf_counter() - start
+        d.EstimateSampled += 1
+    d.workers = workers
+    d.EstimatePossibles = sum(len(extensiveMatches) for (rec1, extensiveMatches) in d.ExtensiveFound)
+    d.EstimateSize = SizeOf(d.ExtensiveFound)
+
+
+def EstimateReport(pairsTitle, blocksTitle, recordsTitle):
+    '''
+Report the estimated cost of the Extensive checking ({ShortName}_{progName}_Estimate.txt)
+The expected time and possible matches are scaled up from the timed sample, which is evenly spread across the records to be checked
+    '''
+
+    openReport('Estimate')
+    heading = f'Extensive checking estimate - {d.progName}'
+    d.rpt.write(f'{heading}\n')
+    heading = re.sub('[^ ]', '_', heading)
+    d.rpt.write(f'{heading}\n')
+    d.rpt.write(f'{d.EstimateRecords}\tRecords to be extensively checked\n')
+    d.rpt.write(f'{d.EstimatePairs}\t{pairsTitle}\n')
+    scale = 0.0
+    if d.EstimateSampled > 0:
+        scale = d.EstimateRecords / d.EstimateSampled
+        seconds = int(d.EstimateTime * scale / d.workers)
+        d.rpt.write(f'{d.EstimateSampled}\tRecords in the timed sample (extensively checked in {d.EstimateTime:.2f} seconds)\n')
+        d.rpt.write(f'{seconds}\tSeconds expected for the Extensive checking [{datetime.timedelta(seconds=seconds)} with {d.workers} worker process(es)]\n')
+        d.rpt.write(f'{int(d.EstimatePossibles * scale)}\tPossible matches expected\n')
+    peak = PeakMemory()
+    if peak is None:
+        d.rpt.write('The peak memory cannot be estimated on this operating system\n')
+    else:
+        possibles = d.EstimateSize * scale / (1024 * 1024)
+        d.rpt.write(f'{peak:.0f}\tMB of memory used reading the records and building the keys and blocks\n')
+        d.rpt.write(f'{peak + possibles:.0f}\tMB peak memory expected [plus {possibles:.1f} MB for the possible matches expected]\n')
+    ReportCapped()
+    if len(d.EstimateBlocks) > 0:
+        d.rpt.write(f'\nThe {d.EstimateLargestBlocks} largest {blocksTitle}\n')
+        for block, (records, pairs) in sorted(d.EstimateBlocks.items(), key=lambda item: (-item[1][1], -item[1][0], item[0]))[:d.EstimateLargestBlocks]:
+            d.rpt.write(f'{pairs}\tPairs of records [{records} {recordsTitle}] - {block}\n')
+    d.rpt.close()
+
+
+def SampleRecords(recNos):
+    '''
+Return a random sample of d.sample of the record numbers (or all of them if there are no more than d.sample), in record number order
+The same sample is chosen every time for the same d.sampleSeed
+    '''
+
+    recNos = sorted(recNos)
+    if len(recNos) <= d.sample:
+        return recNos
+    return sorted(random.Random(d.sampleSeed).sample(recNos, d.sample))
+
+
+def SampleScore(record, row, records, candidates, table, positions, skipIdentical):
+    '''
+Score one ExtensiveRecord (or, if vectorised, its encoded row against the table at positions) against each candidate record for the sampled tuning mode
+No pair is abandoned, so that every confidence score is known for the confidence histogram
+Returns the list of [recNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence] for every candidate where a checking routine returned a weight
+    '''
+
+    checkConfidence = d.ExtensiveConfidence
+    d.ExtensiveConfidence = 0.0
+    if d.Vectorised:
+        matches = v.VectorMatches(row, table, positions, skipIdentical, True)[0]
+    else:
+        matches = []
+        for recNo in candidates:
+            other = records[recNo]
+            if skipIdentical and (record.familyName == other.familyName) and (record.givenName == other.givenName) and (record.birthdate == other.birthdate) and (record.sex == other.sex):
+                continue
+            (totalConfidence, totalWeight, soundFamilyNameConfidence, soundGivenNameConfidence) = d.ExtensiveScorer.score(record, other)
+            if totalWeight > 0:
+                matches.append([recNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+    d.ExtensiveConfidence = checkConfidence
+    return matches
+
+
+def SampleTally(matches):
+    '''
+Add the confidence of each scored pair to the confidence histogram (d.SampleHistogram), which has a bin for every d.SampleBinWidth points of confidence
+Returns the matches at or above the Check Confidence Value, highest confidence first
+    '''
+
+    bins = int(100 // d.SampleBinWidth)
+    if len(d.SampleHistogram) == 0:
+        d.SampleHistogram = [0] * bins
+    wanted = []
+    for match in matches:
+        d.SampleHistogram[min(int(match[1] // d.SampleBinWidth), bins - 1)] += 1
+        if match[1] >= d.ExtensiveConfidence:
+            wanted.append(match)
+    d.SamplePairs += len(matches)
+    return sorted(wanted, key=lambda match: (-match[1], match[0]))
+
+
+def SampleDuplicates(recKeys, records, table, distinctKeys, fileName):
+    '''
+The sampled tuning mode of checkMaster.py and checkSecondary.py
+Check a random sample of the distinct records, each against every other record, and save the possible duplicates of the sampled records in the workbook fileName
+(the same layout as PossibleDuplicates.xlsx, with the possible duplicates of each sampled record, highest confidence first)
+    '''
+
+    candidates = sorted(recNo for (recNo, recKey) in distinctKeys.items() if recKey != '')
+    d.SampleRecs = SampleRecords(candidates)
+    positions = None
+    if d.Vectorised:
+        positions = table.positions(candidates)
+    openPossibleDuplicatesCheck()
+    for rec1 in d.SampleRecs:
+        record1 = records[rec1]
+        row = None
+        if d.Vectorised:
+            row = table.array[table.index[rec1]]
+        matches = []
+        for (rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in SampleScore(record1, row, records, candidates, table, positions, True):
+            for memberRecNo in d.ExtensiveMembers.get(rec2, [rec2]):
+                matches.append([memberRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+        matches = SampleTally(matches)
+        if len(matches) == 0:
+            continue
+        d.SampleFound[rec1] = len(matches)
+        (UR1, f1, g1, dob1, sex1) = recKeys[rec1].split('~')[0:5]
+        if dob1 == '':
+            d.worksheet['pdc'].append(['Possible duplicate patient for', UR1, f1, g1, dob1, sex1])
+        else:
+            d.worksheet['pdc'].append(['Possible duplicate patient for', UR1, f1, g1, record1.date, sex1])
+        for (rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in matches:
+            (UR2, f2, g2, dob2, sex2) = recKeys[rec2].split('~')[0:5]
+            record2 = records[rec2]
+            if dob2 == '':
+                line = ['', '', '', '', '', '', totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, f2, g2, dob2, sex2]
+            else:
+                line = ['', '', '', '', '', '', totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence, UR2, f2, g2, record2.date, sex2]
+            line += OtherFieldMatches(record1, record2)
+            d.worksheet['pdc'].append(line)
+    PrintClose('pdc', 1, 4, fileName)
+
+
+def OtherFieldMatches(record1, record2):
+    '''
+Return the 'match' (or '') columns of the 'other fields' for a pair of ExtensiveRecords
+    '''
+
+    line = []
+    for field1, field2 in zip(record1.otherFields, record2.otherFields):
+        if (field1 != 0) and (field2 != 0) and (field1 == field2):
+            line.append('match')
+        else:
+            line.append('')
+    return line
+
+
+def SampleFind(masterCSV, fileName):
+    '''
+The sampled tuning mode of findUR.py
+Check a random sample of the secondary PMI records against every master PMI record (or, if there are [ExtensiveBlocking] keys, the master PMI records that share a block)
+and save the possible finds of the sampled secondary records in the workbook fileName, highest confidence first
+    '''
+
+    d.SampleRecs = SampleRecords(d.ExtensiveSecondaryRecKey.keys())
+    sampled = set(d.SampleRecs)
+    possibles = {}
+    samplePositions = None
+    if d.Vectorised:
+        samplePositions = d.ExtensiveSecondaryTable.positions(d.SampleRecs)
+    with open(masterCSV, 'rt') as csvfile:
+        masterPMI = csv.reader(csvfile, dialect='excel')
+        d.masterRecNo = 0
+        heading = True
+        for d.csvfields in masterPMI:
+            if heading:
+                heading = False
+                continue
+
+            # Report progress
+            d.masterRecNo += 1
+            if (d.masterRecNo % d.masterDebugCount) == 0:
+                logging.info('%d master PMI records sampled', d.masterRecNo)
+
+            Mf = d.mc.masterCleanFamilyName()
+            Mg = d.mc.masterCleanGivenName()
+            Mdob = d.mc.masterCleanDOB()
+            Msex = d.mc.masterCleanSex()
+            Mmn = None
+            if d.useMiddleNames:
+                Mmn = masterField('MiddleNames').upper()
+            if d.ExtensiveBlocking:
+                candidates = [secRecNo for secRecNo in MasterCandidates(Mf, Mg, Mdob, Msex, Sounds(Mf, Mg)) if secRecNo in sampled]
+                if len(candidates) == 0:
+                    continue
+                positions = None
+                if d.Vectorised:
+                    positions = d.ExtensiveSecondaryTable.positions(candidates)
+            else:
+                candidates = d.SampleRecs
+                positions = samplePositions
+            masterRecord = ExtensiveRecord(Mf, Mg, Mdob, Msex, Mmn, ExtensiveOtherFields(masterField))
+            masterRow = None
+            if d.Vectorised:
+                masterRow = v.VectorRow(masterRecord)
+            for (secRecNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in SampleTally(SampleScore(masterRecord, masterRow, d.ExtensiveSecondaryRecords, candidates, d.ExtensiveSecondaryTable, positions, False)):
+                if secRecNo not in possibles:
+                    possibles[secRecNo] = []
+                if Mdob == '':
+                    possibles[secRecNo].append([totalConfidence, d.masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence, d.mc.masterCleanUR(), Mf, Mg, Mdob, Msex, masterRecord])
+                else:
+                    possibles[secRecNo].append([totalConfidence, d.masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence, d.mc.masterCleanUR(), Mf, Mg, masterRecord.date, Msex, masterRecord])
+
+    # Save the possible finds of each sampled secondary record, highest confidence first
+    d.workbook['smp'] = Workbook()
+    d.worksheet['smp'] = d.workbook['smp'].active
+    heading = ['', d.secondaryPIDname, 'Family Name', 'Given Name', 'Birthdate', 'Sex', 'Confidence', 'FN Sound', 'GN Sound', d.masterURname, 'Family Name', 'Given Name', 'Birthdate', 'Sex']
+    for field in (sorted(d.ExtensiveFields.keys())):
+        heading.append(field)
+    d.worksheet['smp'].append(heading)
+    for secRecNo in d.SampleRecs:
+        if secRecNo not in possibles:
+            continue
+        d.SampleFound[secRecNo] = len(possibles[secRecNo])
+        record1 = d.ExtensiveSecondaryRecords[secRecNo]
+        (Sf, Sg, Sdob, Ssex) = d.ExtensiveSecondaryRecKey[secRecNo].split('~')[0:4]
+        if Sdob == '':
+            d.worksheet['smp'].append(['Possible finds for', d.SamplePID[secRecNo], Sf, Sg, Sdob, Ssex])
+        else:
+            d.worksheet['smp'].append(['Possible finds for', d.SamplePID[secRecNo], Sf, Sg, record1.date, Ssex])
+        for (totalConfidence, _, soundFamilyNameConfidence, soundGivenNameConfidence, ur, Mf, Mg, Mdob, Msex, masterRecord) in sorted(possibles[secRecNo], key=lambda possible: (-possible[0], possible[1])):
+            line = ['', '', '', '', '', '', totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence, ur, Mf, Mg, Mdob, Msex]
+            line += OtherFieldMatches(record1, masterRecord)
+            d.worksheet['smp'].append(line)
+    PrintClose('smp', 1, -1, fileName)
+
+
+def SampleReport(recordsTitle, pairsTitle, fileName):
+    '''
+Report the sampled tuning run ({ShortName}_{progName}_Sample.txt) - the sampled records, the pairs scored and the confidence histogram
+The histogram counts every pair of records scored, so it shows how many possible matches each Check Confidence Value would report
+    '''
+
+    openReport('Sample')
+    heading = f'Extensive checking sample - {d.progName}'
+    d.rpt.write(f'{heading}\n')
+    heading = re.sub('[^ ]', '_', heading)
+    d.rpt.write(f'{heading}\n')
+    if d.sampleSeed is None:
+        d.rpt.write(f'{len(d.SampleRecs)}\t{recordsTitle} in the random sample\n')
+    else:
+        d.rpt.write(f'{len(d.SampleRecs)}\t{recordsTitle} in the random sample [seed {d.sampleSeed}]\n')
+    d.rpt.write(f'{d.SamplePairs}\t{pairsTitle}\n')
+    d.rpt.write(f'{len(d.SampleFound)}\t{recordsTitle} with a confidence at or above the Check Confidence Value ({d.ExtensiveConfidence}) [{sum(d.SampleFound.values())} pairs] (file {fileName})\n')
+    ReportHistogram()
+    d.rpt.close()
+
+
+def ReportHistogram():
+    '''
+Report the confidence histogram (d.SampleHistogram), highest confidence first, marking the bin holding the Check Confidence Value
+    '''
+
+    if len(d.SampleHistogram) == 0:
+        return
+    d.rpt.write('\nConfidence histogram\n')
+    atOrAbove = 0
+    for i in range(len(d.SampleHistogram) - 1, -1, -1):
+        low = i * d.SampleBinWidth
+        high = low + d.SampleBinWidth
+        atOrAbove += d.SampleHistogram[i]
+        rptLine = f'{d.SampleHistogram[i]}\tPairs with a confidence from {low:g} to {high:g} [{atOrAbove} at or above {low:g}]'
+        if low <= d.ExtensiveConfidence < high:
+            rptLine += ' <- Check Confidence Value'
+        d.rpt.write(f'{rptLine}\n')
+
+
+def FeatureOpen(fileName):
+    '''
+Create the pair feature cache (fileName), which saves the raw features of every pair of records compared, so that the pairs can be re-scored
+with new weights and a new Check Confidence Value (-U) without reading the PMI files or computing the sound confidences again
+The feature of each configured routine and 'other field' is its confidence, plus whether it applied (returned a weight)
+The file is FeatureMagic and the offset of the trailer, then one fixed size (little-endian) record for each pair -
+the two record numbers, the family name and given name sound confidences, the confidence of each feature and the applicable flag of each feature
+The trailer (FeatureClose) is the pickled list of features, their parameters and the d.* values needed to regenerate the workbooks
+    '''
+
+    features = len(d.ExtensiveScorer.names)
+    d.FeatureStruct = struct.Struct(f'<II{features + 2}d{features}B')
+    d.FeaturePairs = 0
+    try:
+        d.FeatureFile = open(fileName, 'wb')
+        d.FeatureFile.write(d.FeatureMagic + struct.pack('<Q', 0))
+    except OSError as e:
+        logging.fatal('cannot create the pair feature cache %s: %s', fileName, e)
+        sys.exit(EX_CANTCREAT)
+
+
+def FeatureCheckSize(pairs, advice):
+    '''
+Refuse to save the pair feature cache if every pair of records is compared and there are more than d.FeatureMaxPairs pairs of records,
+as the cache then grows with the square of the number of records (advice is how to compare fewer pairs of records)
+    '''
+
+    if pairs <= d.FeatureMaxPairs:
+        return
+    size = pairs * (24 + 9 * len(d.ExtensiveScorer.names)) / (1024 * 1024 * 1024)
+    logging.fatal('Saving the pair feature cache would save %d pairs of records (%.1f GB), as every pair of records is compared, which is more than the limit of %d pairs - %s',
+                  pairs, size, d.FeatureMaxPairs, advice)
+    sys.exit(EX_USAGE)
+
+
+def FeatureScore(recNo1, recNo2, record1, record2):
+    '''
+Score a pair of ExtensiveRecords, as per ExtensiveScorer.score(), and save the features of the pair in the pair feature cache
+The pair is never abandoned, as every feature is saved
+    '''
+
+    (results, soundFamilyNameConfidence, soundGivenNameConfidence) = d.ExtensiveScorer.features(record1, record2)
+    d.FeatureFile.write(d.FeatureStruct.pack(recNo1, recNo2, soundFamilyNameConfidence, soundGivenNameConfidence,
+                                             *[confidence for (confidence, weight) in results], *[1 if weight > 0 else 0 for (confidence, weight) in results]))
+    d.FeaturePairs += 1
+    (totalConfidence, totalWeight) = d.ExtensiveScorer.total(results)
+    if totalConfidence < d.ExtensiveConfidence:
+        return None
+    return (totalConfidence, totalWeight, soundFamilyNameConfidence, soundGivenNameConfidence)
+
+
+def FeatureClose(names, recordsName):
+    '''
+Finish the pair feature cache - append the trailer, being the features (in saved order), the parameter of each core data checking routine,
+the 'other fields' and the named d.* values (the records, and their details, needed to regenerate the workbooks), then save the offset of the trailer
+recordsName is the name of the d.* dictionary of ExtensiveRecords, if any, whose 'other fields' are reported in the workbooks
+    '''
+
+    routines = {}
+    for name in d.ExtensiveScorer.names:
+        if name in d.ExtensiveRoutines:
+            routines[name] = d.ExtensiveRoutines[name][1]
+    trailer = {'program': d.progName, 'features': d.ExtensiveScorer.names, 'routines': routines, 'fields': sorted(d.ExtensiveFields.keys()), 'pairs': d.FeaturePairs, 'records': recordsName, 'values': {}}
+    for name in names:
+        trailer['values'][name] = getattr(d, name)
+    try:
+        offset = d.FeatureFile.tell()
+        pickle.dump(trailer, d.FeatureFile, protocol=pickle.HIGHEST_PROTOCOL)
+        d.FeatureFile.seek(len(d.FeatureMagic))
+        d.FeatureFile.write(struct.pack('<Q', offset))
+        d.FeatureFile.close()
+    except OSError as e:
+        logging.fatal('cannot save the pair feature cache %s: %s', d.FeatureFile.name, e)
+        sys.exit(EX_IOERR)
+    logging.info('%d pairs of records saved in the pair feature cache %s', d.FeaturePairs, d.FeatureFile.name)
+    d.FeatureFile = None
+
+
+def FeatureRead(fileName):
+    '''
+Read the pair feature cache (fileName) and restore the d.* values saved in its trailer
+The current configuration must only use features that were saved, with the same parameters (any feature no longer configured gets a weight of 0)
+The current weight of each saved feature is saved in d.FeatureWeights
+Returns the pairs (see vectors.FeatureArray)
+    '''
+
+    try:
+        with open(fileName, 'rb') as featureFile:
+            magic = featureFile.read(len(d.FeatureMagic) + 8)
+            if magic[0:len(d.FeatureMagic)] != d.FeatureMagic:
+                logging.fatal('%s is not a pair feature cache', fileName)
+                sys.exit(EX_DATAERR)
+            offset = struct.unpack('<Q', magic[len(d.FeatureMagic):])[0]
+            if offset == 0:
+                logging.fatal('the pair feature cache %s is incomplete', fileName)
+                sys.exit(EX_DATAERR)
+            featureFile.seek(offset)
+            trailer = pickle.load(featureFile)
+    except (OSError, EOFError, pickle.UnpicklingError, struct.error) as e:
+        logging.fatal('cannot read the pair feature cache %s: %s', fileName, e)
+        sys.exit(EX_NOINPUT)
+    if trailer['program'] != d.progName:
+        logging.fatal('the pair feature cache %s was saved by %s, not %s', fileName, trailer['program'], d.progName)
+        sys.exit(EX_DATAERR)
+    for coreRoutine, (_, param) in d.ExtensiveRoutines.items():
+        if ('Middle' in coreRoutine) and not d.useMiddleNames:
+            continue
+        if coreRoutine not in trailer['routines']:
+            logging.fatal('Extensive checking routine "%s" is configured, but was not saved in the pair feature cache %s - save the cache again (-F)', coreRoutine, fileName)
+            sys.exit(EX_CONFIG)
+        if param != trailer['routines'][coreRoutine]:
+            logging.fatal('Extensive checking routine "%s" is configured with a parameter of %s, but was saved in the pair feature cache %s with a parameter of %s - save the cache again (-F)',
+                          coreRoutine, param, fileName, trailer['routines'][coreRoutine])
+            sys.exit(EX_CONFIG)
+    for field in d.ExtensiveFields:
+        if field not in trailer['fields']:
+            logging.fatal('Extensive checking "other field" (%s) is configured, but was not saved in the pair feature cache %s - save the cache again (-F)', field, fileName)
+            sys.exit(EX_CONFIG)
+    d.FeatureNames = trailer['features']
+    d.FeatureWeights = []
+    for name in d.FeatureNames:
+        if name in trailer['routines']:
+            d.FeatureWeights.append(d.ExtensiveRoutines.get(name, (0.0, None))[0])
+        else:
+            d.FeatureWeights.append(d.ExtensiveFields.get(name, 0.0))
+    for name, value in trailer['values'].items():
+        setattr(d, name, value)
+
+    # The workbooks only report the 'other fields' that are still configured
+    if trailer['records'] is not None:
+        keep = [i for i, field in enumerate(trailer['fields']) if field in d.ExtensiveFields]
+        for record in getattr(d, trailer['records']).values():
+            record.otherFields = tuple(record.otherFields[i] for i in keep)
+    d.FeaturePairs = trailer['pairs']
+    return v.FeatureArray(fileName, d.FeaturePairs, len(d.FeatureNames))
+
+
+def FeatureMatches(pairs, skipNoWeight):
+    '''
+Re-score the pairs in the pair feature cache with the current weights (d.FeatureWeights), d.FeatureBlock pairs at a time, with vectorised arithmetic
+Every pair where a feature applied is counted in the confidence histogram (d.SampleHistogram)
+skipNoWeight skips pairs where no feature applied (as per the standard Extensive checking routines when checking for possible duplicates)
+Returns the list of [recNo1, recNo2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence] for the pairs at or above the Check Confidence Value, in saved order
+    '''
+
+    bins = int(100 // d.SampleBinWidth)
+    d.SampleHistogram = [0] * bins
+    matches = []
+    for first in range(0, len(pairs), d.FeatureBlock):
+        block = pairs[first:first + d.FeatureBlock]
+        (totalConfidence, totalWeight, histogram) = v.FeatureRescore(block, d.FeatureWeights, bins)
+        d.SampleHistogram = [count + binCount for (count, binCount) in zip(d.SampleHistogram, histogram)]
+        wanted = totalConfidence >= d.ExtensiveConfidence
+        if skipNoWeight:
+            wanted &= totalWeight > 0
+        for match in zip(block['rec1'][wanted].tolist(), block['rec2'][wanted].tolist(), totalConfidence[wanted].tolist(), block['fnSound'][wanted].tolist(), block['gnSound'][wanted].tolist()):
+            matches.append(list(match))
+    d.FeatureFound = len(matches)
+    return matches
+
+
+def FeatureDuplicates(matches):
+    '''
+Group the re-scored possible duplicates (FeatureMatches) by their first record, in saved order, as per ExtensiveDuplicates()
+Returns the list of [rec1, extensiveMatches] for each record with possible duplicates
+    '''
+
+    duplicates = []
+    for (rec1, rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence) in matches:
+        if (len(duplicates) == 0) or (duplicates[-1][0] != rec1):
+            duplicates.append([rec1, []])
+        duplicates[-1][1].append([rec2, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence])
+    return duplicates
+
+
+def FeatureReport(foundLines):
+    '''
+Report the re-scoring of the pair feature cache ({ShortName}_{progName}_Rescore.txt) - the pairs re-scored, the weight of each feature,
+the possible matches/duplicates found (foundLines) and the confidence histogram
+    '''
+
+    openReport('Rescore')
+    heading = f'Extensive checking re-score - {d.progName}'
+    d.rpt.write(f'{heading}\n')
+    heading = re.sub('[^ ]', '_', heading)
+    d.rpt.write(f'{heading}\n')
+    d.rpt.write(f'{d.FeaturePairs}\tPairs of records re-scored from the pair feature cache\n')
+    for name, weight in zip(d.FeatureNames, d.FeatureWeights):
+        d.rpt.write(f'\t[{name} weight {weight:g}]\n')
+    d.rpt.write(f'{d.FeatureFound}\tPairs of records with a confidence at or above the Check Confidence Value ({d.ExtensiveConfidence})\n')
+    for foundLine in foundLines:
+        d.rpt.write(f'{foundLine}\n')
+    ReportHistogram()
+    d.rpt.close()
+
+
+def CheckIfFound():
+    '''
+Check if this secondary record (PID) is in found.xlsx
+    '''
+
+    pid = d.sc.secondaryCleanPID()
+    if pid in d.foundUR:
+        return True
+    else:
+        return False
+
+
+
+def PrintHeading(thisFile, fileType, message1, message2):
+    '''
+Open a workbook and print the heading
+message1 and message2 get prepended to the heading, if presents
+fileType defines the number of UR/altUR fields to prepend to the heading
+    1 - prepend a heading column of master PMI PID and UR
+    2 - prepend heading columns for secondary PID, secondary UR and altUR
+    3 - prepend heading columns for both of the above
+    4 - prepend heading columns for both of the above and the extensive match confidence levels
+    '''
+
+    heading = []
+    if message1 != '':
+        heading.append(message1)
+    if message2 != '':
+        heading.append(message2)
+    if fileType == 1:
+        heading.append(f'{d.masterShortName} {d.masterPIDname}' )
+        heading.append(f'{d.masterShortName} {d.masterURname}')
+    elif fileType == 2:
+        heading.append(f'{d.secondaryShortName} {d.secondaryPIDname}')
+        heading.append(f'{d.secondaryShortName} {d.secondaryURname}')
         heading.append(f'{d.secondaryShortName} {d.secondaryAltURname}')
     elif fileType == 3:
         heading.append(f'{d.secondaryShortName} {d.secondaryPIDname}')
@@ -2099,7 +4527,10 @@ Print out the Possible matches
                 thisFile = 'pm'
                 d.probablematch += 1
 
-        PrintSecondary(False, '', 4, thisFile, '', confidence)
+        message = ''
+        if confidence == max(d.possExtensiveMatches[d.secondaryRecNo]):
+            message = OverflowMessage(d.secondaryRecNo)
+        PrintSecondary(False, '', 4, thisFile, message, confidence)
         for i in range(len(d.possExtensiveMatches[d.secondaryRecNo][confidence])):
             masterRecNo = d.possExtensiveMatches[d.secondaryRecNo][confidence][i][0]
             PrintMaster(False, '', 4, masterRecNo, thisFile, extensiveMessage, confidence, i)
@@ -2142,6 +4573,8 @@ Print out Duplicate found master records for this secondary PMI record
             d.dpfoundtd += 1
         if message == 'Sound':
             duplicateMessage = 'Duplicate Similar sounding patients'
+        elif message == 'Spelling':
+            duplicateMessage = 'Duplicate Similarly spelt patients'
         else:
             duplicateMessage = 'Duplicate Similar patients - different ' + message
 
@@ -2176,6 +4609,8 @@ Print out Similar found master records for this secondary PMI record
         thisFile += 'td'
     if message == 'Sound':
         duplicateMessage = 'Similar sounding patient'
+    elif message == 'Spelling':
+        duplicateMessage = 'Similarly spelt patient'
     else:
         duplicateMessage = 'Similar patient - different ' + message
     PrintSecondary(True, check, 3, thisFile, duplicateMessage, 0)
@@ -2228,8 +4663,6 @@ def PrintExtensiveFinds():
 Print out the Possible matches
     '''
 
-    masterRecNo = d.foundRec[d.secondaryRecNo]
-
     # We need to print out the extensive matches for the secondaryRecNo record in the secondary PMI
     thisFile = ''
     for confidence in (reversed(sorted(d.possExtensiveFinds[d.secondaryRecNo]))):
@@ -2243,7 +4676,10 @@ Print out the Possible matches
                 thisFile = 'pf'
                 d.probablefound += 1
 
-        PrintSecondary(False, '', 4, thisFile, extensiveMessage, confidence)
+        message = extensiveMessage
+        if (confidence == max(d.possExtensiveFinds[d.secondaryRecNo])) and (d.secondaryRecNo in d.possExtensiveOverflow):
+            message += ' ' + OverflowMessage(d.secondaryRecNo)
+        PrintSecondary(False, '', 4, thisFile, message, confidence)
         for i in range(len(d.possExtensiveFinds[d.secondaryRecNo][confidence])):
             masterRecNo = d.possExtensiveFinds[d.secondaryRecNo][confidence][i][0]
             PrintMaster(False, '', 4, masterRecNo, thisFile, '', confidence, i)
@@ -8,10 +8,10 @@ Then check that the matching master PMI file record (same UR number) is a good m
 SYNOPSIS
 $ python matchAltUR.py masterDirectory [-e masterExtractDirectory|--masterExtractDir=masterExtractDirectory]
                     secondaryDirectory [-f secondaryExtractDirectory|--secondaryExtractDir=secondaryExtractDirectory]
-                    [-E|--Extensive] [-S|--SkipMatched]
+                    [-E|--Extensive] [-V|--Vectorised] [-S|--SkipMatched] [-C soundCacheSize|--soundCacheSize=soundCacheSize]
                     [-m masterDebugKey|--masterDebugKey=masterDebugKey] [-n masterDebugCount|--masterDebugCount=masterDebugCount]
                     [-s secondaryDebugKey|--secondaryDebugKey=secondaryDebugKey] [-t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount]
-                    [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
+                    [-x|--estimate] [-v loggingLevel|--verbose=loggingLeve] [-o logfile|--logfile=logfile]
 
 
 OPTIONS
@@ -31,10 +31,20 @@ The optional extract sub-directory, of the secondary directory, containing the e
 Invoke extensive checking for possible duplicates. Extensive checking can invoke various function on the core data elements (FamilyName, GivenName, Birthdate, Sex)
 plus simple checks of equality for any other field in the master and secondary PMI files.
 
+-V|--Vectorised
+Use the vectorised (NumPy) Extensive checking engine, which scores each master record against all the secondary records with a matching AltUR at once (implies -E)
+The vectorised engine computes the same confidences as the standard Extensive checking routines. Requires NumPy.
+If Numba is installed, then the birthdate and exact match checks are run as compiled loops over the integer encoded columns (giving the same confidences).
+
 -S|--SkipMatched
 Don't recheck things marked an matches (in matched.xlsx) or non-matches (in notMatched.xlsx)
 This will suppress the creation of '_Done' files
 
+-C soundCacheSize|--soundCacheSize=soundCacheSize
+The number of pairs of names for which the family name and given name sound confidences are remembered. Default is 100000
+The least recently used pair of names is forgotten when the cache is full. A soundCacheSize of 0 turns off the cache.
+The number of sound confidences found in the cache and the number computed are reported.
+
 -m masterDebugKey|--masterDebugKey=masterDebugKey
 The key for triggering logging of information about a specific master record. Default is None
 
@@ -47,6 +57,12 @@ The key for triggering logging of information about a specific secondary record.
 -t secondaryDebugCount|--secondaryDebugCount=secondaryDebugCount
 A counter to trigger progress logging; a progress message is created every secondaryDebugCount(th) secondary record. Default is 50000
 
+-x|--estimate
+Estimate the cost of the Extensive checking, then exit without checking all the master PMI records or producing any workbooks (requires -E or -V)
+The secondary PMI file is read in and the pairs of records (master PMI patients with secondary PMI patients with a matching AltUR) are counted.
+An evenly spaced sample of the master PMI records with a UR that is an AltUR is checked, and timed, to estimate the Extensive checking time, the possible matches and the peak memory.
+The estimate, and the AltURs with the most pairs of records, are reported in {secondaryShortName}_matchAltUR_Estimate.txt
+
 -v loggingLevel|--verbose=loggingLevel
 Set the level of logging that you want.
 
@@ -56,6 +72,7 @@ The name of a log file where you want all messages captured.
 
 THE MAIN CODE
 Start by parsing the command line arguements and setting up logging.
+The phonetic codes (NYSIIS, Double Metaphone and Soundex) of each distinct name are saved in phoneticCodes.csv, next to master.csv, and reused by later runs.
 
 Then read in the Secondary PMI file and create a "key" for each patient that has a alternate UR number.
 (If the secondary PMI file contains deleted, merged or alias patients, then we ignore them)
@@ -68,6 +85,7 @@ Then we check to see how well the other fields match. To do this we check the "k
 If not, we break the "keys" down into their component part and see how many of those components match.
 If family name or given name aren't a perfect match, compute the sound confidence of a match
 If the Extensive checking option is invoked, then compute and report an overall confidence score for best match based upon the "key".
+If an estimate is requested, then the pairs are counted and a timed sample of the master PMI records is checked, before reporting the estimate and exiting.
 
 The Master PMI file can contains aliases and merged patients. Look for both full and partial matches against aliases and
 report the match against the alias as the alias and the primary patient are assumed to be a perfect match.
@@ -90,6 +108,7 @@ from importlib.util import spec_from_loader, module_from_spec
 from openpyxl.styles import NamedStyle
 import data as d
 import functions as f
+import vectors as v
 
 
 # This next section is plagurised from /usr/include/sysexits.h
@@ -133,11 +152,14 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     parser.add_argument ('-e', '--masterExtractDir', dest='masterExtractDir', metavar='masterExtractDirectory', help='The name of the master directory sub-directory that contains the extract master CSV file and configuration specific to the extract')
     parser.add_argument ('-f', '--secondaryExtractDir', dest='secondaryExtractDir', metavar='secondaryExtractDirectory', help='The name of the secondary directory sub-directory that contains the extract secondary CSV file and configuration specific to the extract')
     parser.add_argument ('-E', '--Extensive', dest='Extensive', action='store_true', help='Invoke Extensive checking to look for possible matches')
+    parser.add_argument ('-V', '--Vectorised', dest='Vectorised', action='store_true', help='Use the vectorised (NumPy) Extensive checking engine (implies -E)')
     parser.add_argument ('-S', '--SkipMatched', dest='skipMatched', action='store_true', help='Skip testing matches/non-matches (suppress _Done files)')
+    parser.add_argument ('-C', '--soundCacheSize', dest='soundCacheSize', metavar='soundCacheSize', type=int, default=100000, help='The number of pairs of names for which sound confidences are remembered (0 for no cache)')
     parser.add_argument ('-m', '--masterDebugKey', dest='masterDebugKey', metavar='masterDebugKey', help='The key for triggering logging of information about a specific master record')
     parser.add_argument ('-n', '--masterDebugCount', dest='masterDebugCount', metavar='masterDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every masterDebugCount(th) master record')
     parser.add_argument ('-s', '--secondaryDebugKey', dest='secondaryDebugKey', metavar='secondaryDebugKey', help='The key for triggering logging of information about a specific secondary record')
     parser.add_argument ('-t', '--secondaryDebugCount', dest='secondaryDebugCount', metavar='secondaryDebugCount', type=int, default=50000, help='A counter to trigger progress logging; a message every secondaryDebugCount(th) secondary record')
+    parser.add_argument ('-x', '--estimate', dest='estimate', action='store_true', help='Estimate the cost of the Extensive checking, then exit')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-o', '--logfile', dest='logfile', metavar='logfile', help='The name of a logging file')
     args = parser.parse_args()
@@ -161,12 +183,26 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     d.secondaryDir = args.secondaryDir
     d.masterExtractDir = args.masterExtractDir
     d.secondaryExtractDir = args.secondaryExtractDir
-    d.Extensive = args.Extensive
+    d.Extensive = args.Extensive or args.Vectorised
+    d.Vectorised = args.Vectorised
+    if d.Vectorised and not v.Available():
+        logging.fatal('Vectorised Extensive checking invoked, but NumPy is not installed')
+        sys.exit(EX_UNAVAILABLE)
+    if d.Vectorised:
+        v.SelectKernels()
     skipMatched = args.skipMatched
+    if args.soundCacheSize < 0:
+        logging.fatal('The sound cache size cannot be negative')
+        sys.exit(EX_USAGE)
+    f.SoundCheckCache(args.soundCacheSize)
     d.masterDebugKey = args.masterDebugKey
     d.masterDebugCount = args.masterDebugCount
     d.secondaryDebugKey = args.secondaryDebugKey
     d.secondaryDebugCount = args.secondaryDebugCount
+    d.estimate = args.estimate
+    if d.estimate and not d.Extensive:
+        logging.fatal('Estimating the cost of the Extensive checking requires the -E or -V option')
+        sys.exit(EX_USAGE)
 
 
     # Read in the extract configuration file if required
@@ -270,6 +306,15 @@ Check the quality of the match and remember the master PMI data. Then re-read th
     # Read in the Not Matched PIDs - confirmed non-matches - further checking requried
     f.getNotMatched()
 
+    # Load the phonetic codes saved by earlier runs
+    if d.masterExtractDir:
+        f.LoadNameCodes(f'{d.masterDir}/{d.masterExtractDir}')
+    else:
+        f.LoadNameCodes(d.masterDir)
+
+    # Create the table for vectorised Extensive checking
+    if d.Vectorised:
+        d.ExtensiveSecondaryTable = v.ExtensiveTable()
 
     # Pass 1 - pick out the keys from the secondary PMI file for records that can be matched [those with an AltUR which isn't know to be bad]
     # Open the cleaned up CSV secondary PMI file
@@ -340,21 +385,16 @@ Check the quality of the match and remember the master PMI data. Then re-read th
             d.extras[d.secondaryRecNo] = ''
 
             if d.Extensive and pid not in d.foundSecondaryRec :        # Collect and pack Extensive checking data (if required)
-                d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = f.Sounds(Sf, Sg)
-                if Sdob == '':
-                    d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = d.futureBirthdate
-                else:
-                    d.ExtensiveSecondaryBirthdate[d.secondaryRecNo] = f.Birthdate(Sdob)
+                d.ExtensiveSecondaryRecKey[d.secondaryRecNo] = f.NameCodes(Sf) + f.NameCodes(Sg)
+                Smn = None
                 if d.useMiddleNames:
-                    d.ExtensiveSecondaryMiddleNames[d.secondaryRecNo] = f.secondaryField('MiddleNames').upper()
-                thisHash = {}
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    fieldData =  f.secondaryField(field)
-                    if fieldData == '':
-                        thisHash[field] = None
-                    else:
-                        thisHash[field] = hash(fieldData)
-                d.ExtensiveOtherSecondaryFields[d.secondaryRecNo] = thisHash
+                    Smn = f.secondaryField('MiddleNames').upper()
+                d.ExtensiveSecondaryRecords[d.secondaryRecNo] = f.ExtensiveRecord(Sf, Sg, Sdob, Ssex, Smn, f.ExtensiveOtherFields(f.secondaryField))
+                if d.Vectorised:
+                    d.ExtensiveSecondaryTable.append(d.secondaryRecNo, v.VectorRow(d.ExtensiveSecondaryRecords[d.secondaryRecNo]))
+    if d.Vectorised:
+        d.ExtensiveSecondaryTable.finish()
+    f.BuildNameGraph()
     logging.info('End of Pass 1')
 
 
@@ -368,6 +408,15 @@ Check the quality of the match and remember the master PMI data. Then re-read th
         masterCSV = f'./{d.masterDir}/{d.masterExtractDir}/master.csv'
     else:
         masterCSV = f'./{d.masterDir}/master.csv'
+
+    # If estimating, then report the estimated cost of the Extensive checking and exit
+    if d.estimate:
+        f.EstimateMatch(masterCSV)
+        f.EstimateReport(f'Pairs of records [{d.masterLongName} patients with the {d.secondaryLongName} patients with a matching {d.secondaryAltURname}]', f'{d.secondaryAltURname}s', f'{d.masterLongName} patients')
+        f.SaveNameCodes()
+        d.fe.close()
+        sys.exit(EX_OK)
+
     with open(masterCSV, 'rt') as csvfile:
         masterPMI = csv.reader(csvfile, dialect='excel')
         d.masterRecNo = 0
@@ -422,24 +471,18 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                 continue
 
             # Collect Extensive checking data if required
-            Mfny = Mfdm =  Mfsx = Mgny = Mgdm = Mgsx = My = Mm = Md = masterBirthdate = Mmn = None
-            masterOtherFields = {}
+            Mfny = Mfdm =  Mfsx = Mgny = Mgdm = Mgsx = Mmn = masterRecord = None
             if d.Extensive:
-                sounds = f.Sounds(Mf, Mg)
-                (Mfny, Mfdm, Mfsx, Mgny, Mgdm, Mgsx) = sounds.split('~')
-                if Mdob == '':
-                    masterBirthdate = d.futureBirthdate
-                else:
-                    masterBirthdate = f.Birthdate(Mdob)
+                (Mfny, Mfdm, Mfsx) = f.NameCodes(Mf)
+                (Mgny, Mgdm, Mgsx) = f.NameCodes(Mg)
                 if d.useMiddleNames:
                     Mmn = f.masterField('MiddleNames').upper()
-                masterOtherFields = {}
-                for field in (sorted(d.ExtensiveFields.keys())):
-                    fieldData = f.masterField(field)
-                    if fieldData == '':
-                        masterOtherFields[field] = None
-                    else:
-                        masterOtherFields[field] = hash(fieldData)
+                masterRecord = f.ExtensiveRecord(Mf, Mg, Mdob, Msex, Mmn, f.ExtensiveOtherFields(f.masterField))
+
+            # For Extensive checking we compute a confidence level that this master record matches each of the associated secondary record
+            # There can be multiple secondary records claiming to be linked to each master record
+            if d.Extensive:
+                f.MatchMasterRecord(ur, masterRecord)
 
             # Check this Master PMI file record against each secondary PMI record which has an altUR matching this UR
             bestMatch = -1
@@ -451,86 +494,9 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                 (Sf, Sg, Sdob, Ssex) = d.fullKey[secRecNo].split('~')
                 Sfny = Sfdm =  Sfsx = Sgny = Sgdm = Sgsx = None
 
-                # For Extensive checking we compute a confidence level that this master record matches each of the associated secondary record
-                # There can be multiple secondary records claiming to be linked to each master record
+                # Unpack the secondary PMI items for this secondary PMI record (if collected for Extensive checking)
                 if d.Extensive:
-                    # Unpack the secondary PMI items for this secondary PMI record
-                    (Sfny, Sfdm, Sfsx, Sgny, Sgdm, Sgsx) = d.ExtensiveSecondaryRecKey[secRecNo].split('~')
-                    secondaryBirthdate = d.ExtensiveSecondaryBirthdate[secRecNo]
-                    Smn = None
-                    if d.useMiddleNames:
-                        Smn = d.ExtensiveSecondaryMiddleNames[secRecNo]
-                    secondaryOtherFields = d.ExtensiveOtherSecondaryFields[secRecNo]
-                    weight = 1.0
-                    if Mf == Sf:
-                        soundFamilyNameConfidence = 100.0
-                    else:
-                        (soundFamilyNameConfidence, weight) = f.FamilyNameSoundCheck(Mf, Mfny, Mfdm, Mfsx, Sf, Sfny, Sfdm, Sfsx, 1.0)
-                    if Mg == Sg:
-                        soundGivenNameConfidence = 100.0
-                    else:
-                        (soundGivenNameConfidence, weight) = f.GivenNameSoundCheck(Mg, Mgny, Mgdm, Mgsx, Sg, Sgny, Sgdm, Sgsx, 1.0)
-
-                    # Compute the goodness of fit between this secondary record and the master record
-                    totalConfidence = 0
-                    totalWeight = 0
-                    # Start with the things that require algorithms
-                    for coreRoutine, (thisWeight, thisParam) in d.ExtensiveRoutines.items():
-                        weight = 0.0
-                        confidence = 0.0
-                        if coreRoutine == 'FamilyName':
-                            (confidence, weight) = f.FamilyNameCheck(Mf, Sf, thisWeight)
-                        elif coreRoutine == 'FamilyNameSound':
-                            (confidence, weight) = f.FamilyNameSoundCheck(Mf, Mfny, Mfdm, Mfsx, Sf, Sfny, Sfdm, Sfsx, thisWeight)
-                        elif coreRoutine == 'GivenName':
-                            (confidence, weight) = f.GivenNameCheck(Mg, Sg, thisWeight)
-                        elif coreRoutine == 'GivenNameSound':
-                            (confidence, weight) = f.GivenNameSoundCheck(Mg, Mgny, Mgdm, Mgsx, Sg, Sgny, Sgdm, Sgsx, thisWeight)
-                        elif coreRoutine == 'MiddleNames':
-                            if d.useMiddleNames:
-                                (confidence, weight) = f.MiddleNamesCheck(Mmn, Smn, thisWeight)
-                        elif coreRoutine == 'MiddleNamesInitial':
-                            if d.useMiddleNames:
-                                (confidence, weight) = f.MiddleNamesInitialCheck(Mmn, Smn, thisWeight)
-                        elif coreRoutine == 'Sex':
-                            (confidence, weight) = f.SexCheck(Msex, Ssex, thisWeight)
-                        elif coreRoutine == 'Birthdate':
-                            (confidence, weight) = f.BirthdateCheck(Mdob, Sdob, thisWeight)
-                        elif coreRoutine == 'BirthdateNearYear':
-                            (confidence, weight) = f.BirthdateNearYearCheck(Mdob, Sdob, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateNearMonth':
-                            (confidence, weight) = f.BirthdateNearMonthCheck(Mdob, Sdob, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateNearDay':
-                            (confidence, weight) = f.BirthdateNearDayCheck(masterBirthdate, secondaryBirthdate, thisParam, thisWeight)
-                        elif coreRoutine == 'BirthdateYearSwap':
-                            (confidence, weight) = f.BirthdateYearSwapCheck(Mdob, Sdob, thisWeight)
-                        elif coreRoutine == 'BirthdateDayMonthSwap':
-                            (confidence, weight) = f.BirthdateDayMonthSwapCheck(Mdob, Sdob, thisWeight)
-                        if weight > 0:
-                            totalConfidence += confidence * weight
-                            totalWeight += weight
-                    # Then the things that just need matching (best done on hash values)
-                    for field, weight in d.ExtensiveFields.items():
-                        if weight > 0:
-                            if masterOtherFields[field] and secondaryOtherFields[field]:
-                                if masterOtherFields[field] == secondaryOtherFields[field]:
-                                    totalConfidence += 100.0 * weight
-                                    totalWeight += weight
-                                else:
-                                    totalConfidence += 0.0 * weight
-                                    totalWeight += weight
-                    # Compute the total weight
-                    if totalWeight > 0:
-                        totalConfidence = totalConfidence / totalWeight
-                    # And save this master data against this secondary record if we have an adequate match
-                    # A master record can be matched to multiple secondary records, with varying degrees of confidence (multiple secondary rows with the same AltUR)
-                    # A secondary record can only be matched to multiple master records if there are multiple master records with the same UR!!!
-                    if totalConfidence >= d.ExtensiveConfidence:
-                        if secRecNo not in d.possExtensiveMatches:
-                            d.possExtensiveMatches[secRecNo] = {}
-                        if totalConfidence not in (d.possExtensiveMatches[secRecNo]):
-                            d.possExtensiveMatches[secRecNo][totalConfidence] = []
-                        d.possExtensiveMatches[secRecNo][totalConfidence].append([d.masterRecNo, soundFamilyNameConfidence, soundGivenNameConfidence])
+                    (Sfny, Sfdm, Sfsx, Sgny, Sgdm, Sgsx) = d.ExtensiveSecondaryRecKey[secRecNo]
 
 
                 # If forced, or a perfect match has already been found, for the secondary PMI file record then don't do any further checking
@@ -625,6 +591,9 @@ Check the quality of the match and remember the master PMI data. Then re-read th
                 if d.recStatus[secRecNo] > bestMatch:
                     d.altURrec[ur] = secRecNo
                     bestMatch = d.recStatus[secRecNo]
+
+    # Turn the kept possible Extensive matches back into lists of master records by confidence
+    f.PossiblesTopK(d.possExtensiveMatches)
     logging.info('End of Pass 2')
 
 
@@ -968,10 +937,16 @@ Check the quality of the match and remember the master PMI data. Then re-read th
             f.PrintClose('em', 1, 9, f'{d.secondaryDir}/{d.secondaryShortName}_Extensive_Matches.xlsx')
             d.rpt.write(f'{d.probablematch}\tRecords probably matched, using extensive matching, to patients in {d.masterLongName} ({d.secondaryDir}/{d.secondaryShortName}_Probable_Matches.xlsx)\n')
             f.PrintClose('pm', 1, 9, f'{d.secondaryDir}/{d.secondaryShortName}_Probable_Matches.xlsx')
+        f.ReportPruned()
+        f.ReportOverflow()
+    f.ReportSoundCache()
 
 
     d.rpt.close()
 
+    # Save any new phonetic codes for later runs
+    f.SaveNameCodes()
+
     # Close the error log csv file and exit
     d.fe.close()
     sys.exit(EX_OK)
@@ -0,0 +1,456 @@
+'''The vectorised (NumPy) Extensive checking engine'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import logging
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+import data as d
+
+# The columns of an Extensive table (the 'other fields' follow, in sorted order)
+FN = 0            # Family Name code
+GN = 1            # Given Name code
+SEX = 2            # Sex code
+MN = 3            # Middle Names code
+MI = 4            # Middle Names initial code
+YEAR = 5        # Birthdate year (0 if no Birthdate)
+MONTH = 6        # Birthdate month (0 if no Birthdate)
+DAY = 7            # Birthdate day (0 if no Birthdate)
+DOB = 8            # Birthdate as YYYYMMDD (0 if no Birthdate)
+ORDINAL = 9        # Birthdate as a day ordinal (futureBirthdate if no Birthdate)
+FNID = 10        # Family Name id in the name graph (d.NameGraph)
+GNID = 11        # Given Name id in the name graph (d.NameGraph)
+OTHER = 12        # The first 'other field' code
+
+
+def Available():
+    '''
+Check that NumPy is installed
+    '''
+
+    return np is not None
+
+
+def VectorRow(record):
+    '''
+Encode the Extensive checking data for one record (an ExtensiveRecord) as a row of integers
+    '''
+
+    if record.birthdate == '':
+        dob = 0
+    else:
+        dob = record.year * 10000 + record.month * 100 + record.day
+    row = [record.familyName, record.givenName, record.sex, record.middleNames, record.middleInitial, record.year, record.month, record.day, dob, record.date.toordinal(),
+           record.familyNameId, record.givenNameId]
+    row += record.otherFields
+    return row
+
+
+class ExtensiveTable:
+    '''
+The Extensive checking data for a set of records, held as columns of integers
+    '''
+
+    def __init__(self):
+        self.rows = []            # The encoded rows, until the table is finished
+        self.index = {}            # Keys: record number, Values: row number
+        self.recNos = None        # The record number for each row
+        self.array = None        # The encoded rows as a 2D array
+
+    def append(self, recNo, row):
+        '''
+Add the encoded row for record recNo to the table
+        '''
+
+        self.index[recNo] = len(self.rows)
+        self.rows.append(row)
+
+    def finish(self):
+        '''
+Convert the encoded rows to arrays
+        '''
+
+        self.recNos = np.array(list(self.index), dtype=np.int64)
+        self.array = np.array(self.rows, dtype=np.int64).reshape(len(self.rows), OTHER + len(d.ExtensiveFields))
+        self.rows = []
+
+    def positions(self, recNos):
+        '''
+Return the row numbers for a list of record numbers
+        '''
+
+        return np.fromiter((self.index[recNo] for recNo in recNos), dtype=np.intp, count=len(recNos))
+
+
+def SoundColumn(code, nameId, codes, nameIds):
+    '''
+Compute the sound confidence of one name against a column of names, from the name graph (d.NameGraph), which only links names that share a sound code
+Identical or missing names have a sound confidence of 0.0 (as per functions.ScoreFamilyNameSound and functions.ScoreGivenNameSound)
+    '''
+
+    sound = np.zeros(len(codes))
+    if code == 0:
+        return sound
+    valid = (codes != code) & (codes != 0)
+    if valid.any():
+        (unique, inverse) = np.unique(nameIds[valid], return_inverse=True)
+        values = np.array([d.NameGraph.similarity(nameId, otherId) for otherId in unique.tolist()])
+        sound[valid] = values[inverse]
+    return sound
+
+
+def EqualColumn(code, codes, weight):
+    '''
+Compute the confidence and weight of an exact match of one value against a column of values
+    '''
+
+    if d.VectorKernels:
+        return EqualKernel(code, codes, weight)
+    if code == 0:
+        return (np.zeros(len(codes)), np.zeros(len(codes)))
+    return (np.where(codes == code, 100.0, 0.0), np.where(codes != 0, weight, 0.0))
+
+
+def NearYearColumn(row, cols, datesDiffer, param, weight):
+    '''
+Compute the confidence and weight of BirthdateNearYear for one birthdate against a column of birthdates (as per functions.ScoreBirthdateNearYear)
+    '''
+
+    (y1, m1, d1) = (row[YEAR], row[MONTH], row[DAY])
+    (y2, m2, d2) = (cols[:, YEAR], cols[:, MONTH], cols[:, DAY])
+    if d.VectorKernels:
+        return NearYearKernel(y1, m1, d1, y2, m2, d2, datesDiffer, param, weight)
+    later = y1 > y2
+    bump = np.where(later, (m1 > m2) | ((m1 == m2) & (d1 > d2)), (m2 > m1) | ((m2 == m1) & (d2 > d1)))
+    near = datesDiffer & (np.abs(y1 - y2) + bump <= param)
+    return (np.where(near, 100.0, 0.0), np.where(near, weight, 0.0))
+
+
+def NearMonthColumn(row, cols, datesDiffer, param, weight):
+    '''
+Compute the confidence and weight of BirthdateNearMonth for one birthdate against a column of birthdates (as per functions.ScoreBirthdateNearMonth)
+    '''
+
+    (y1, m1, d1) = (row[YEAR], row[MONTH], row[DAY])
+    (y2, m2, d2) = (cols[:, YEAR], cols[:, MONTH], cols[:, DAY])
+    if d.VectorKernels:
+        return NearMonthKernel(y1, m1, d1, y2, m2, d2, datesDiffer, param, weight)
+    later = y1 > y2
+    monthDiff = np.where(later, (y1 - y2) * 12 + m1 - m2 + ((m1 == m2) & (d1 > d2)), (y2 - y1) * 12 + m2 - m1 + ((m2 == m1) & (d2 > d1)))
+    near = datesDiffer & (monthDiff <= param)
+    return (np.where(near, 100.0, 0.0), np.where(near, weight, 0.0))
+
+
+def YearSwapColumn(row, cols, datesDiffer, weight):
+    '''
+Compute the confidence and weight of BirthdateYearSwap for one birthdate against a column of birthdates (as per functions.ScoreBirthdateYearSwap)
+    '''
+
+    (y1, m1, d1) = (row[YEAR], row[MONTH], row[DAY])
+    (y2, m2, d2) = (cols[:, YEAR], cols[:, MONTH], cols[:, DAY])
+    if d.VectorKernels:
+        return YearSwapKernel(y1, m1, d1, y2, m2, d2, datesDiffer, weight)
+    swapped = (y1 // 100 == y2 // 100) & (y1 % 100 == (y2 % 10) * 10 + (y2 // 10) % 10) & (m1 == m2) & (d1 == d2)
+    return (np.where(datesDiffer & swapped, 100.0, 0.0), np.where(datesDiffer, weight, 0.0))
+
+
+def DayMonthSwapColumn(row, cols, datesDiffer, weight):
+    '''
+Compute the confidence and weight of BirthdateDayMonthSwap for one birthdate against a column of birthdates (as per functions.ScoreBirthdateDayMonthSwap)
+    '''
+
+    (y1, m1, d1) = (row[YEAR], row[MONTH], row[DAY])
+    (y2, m2, d2) = (cols[:, YEAR], cols[:, MONTH], cols[:, DAY])
+    if d.VectorKernels:
+        return DayMonthSwapKernel(y1, m1, d1, y2, m2, d2, datesDiffer, weight)
+    sameYear = y1 == y2
+    swapped = (m1 == d2) & (m2 == d1)
+    return (np.where(datesDiffer & sameYear & swapped, 100.0, 0.0), np.where(datesDiffer & (swapped | ~sameYear), weight, 0.0))
+
+
+# The compiled (Numba) kernels - the same rules as the NumPy expressions above, as one loop over the column (compiled and used if Numba is installed, see SelectKernels)
+def EqualKernel(code, codes, weight):
+    '''
+The compiled EqualColumn
+    '''
+
+    confidence = np.zeros(len(codes))
+    weights = np.zeros(len(codes))
+    if code == 0:
+        return (confidence, weights)
+    for i, thisCode in enumerate(codes):
+        if thisCode == code:
+            confidence[i] = 100.0
+        if thisCode != 0:
+            weights[i] = weight
+    return (confidence, weights)
+
+
+def NearYearKernel(y1, m1, d1, y2, m2, d2, datesDiffer, param, weight):
+    '''
+The compiled NearYearColumn
+    '''
+
+    confidence = np.zeros(len(y2))
+    weights = np.zeros(len(y2))
+    for i, year2 in enumerate(y2):
+        if not datesDiffer[i]:
+            continue
+        if y1 > year2:
+            bump = (m1 > m2[i]) or ((m1 == m2[i]) and (d1 > d2[i]))
+        else:
+            bump = (m2[i] > m1) or ((m2[i] == m1) and (d2[i] > d1))
+        if abs(y1 - year2) + bump <= param:
+            confidence[i] = 100.0
+            weights[i] = weight
+    return (confidence, weights)
+
+
+def NearMonthKernel(y1, m1, d1, y2, m2, d2, datesDiffer, param, weight):
+    '''
+The compiled NearMonthColumn
+    '''
+
+    confidence = np.zeros(len(y2))
+    weights = np.zeros(len(y2))
+    for i, year2 in enumerate(y2):
+        if not datesDiffer[i]:
+            continue
+        if y1 > year2:
+            monthDiff = (y1 - year2) * 12 + m1 - m2[i] + ((m1 == m2[i]) and (d1 > d2[i]))
+        else:
+            monthDiff = (year2 - y1) * 12 + m2[i] - m1 + ((m2[i] == m1) and (d2[i] > d1))
+        if monthDiff <= param:
+            confidence[i] = 100.0
+            weights[i] = weight
+    return (confidence, weights)
+
+
+def YearSwapKernel(y1, m1, d1, y2, m2, d2, datesDiffer, weight):
+    '''
+The compiled YearSwapColumn
+    '''
+
+    confidence = np.zeros(len(y2))
+    weights = np.zeros(len(y2))
+    for i, year2 in enumerate(y2):
+        if not datesDiffer[i]:
+            continue
+        weights[i] = weight
+        if (y1 // 100 == year2 // 100) and (y1 % 100 == (year2 % 10) * 10 + (year2 // 10) % 10) and (m1 == m2[i]) and (d1 == d2[i]):
+            confidence[i] = 100.0
+    return (confidence, weights)
+
+
+def DayMonthSwapKernel(y1, m1, d1, y2, m2, d2, datesDiffer, weight):
+    '''
+The compiled DayMonthSwapColumn
+    '''
+
+    confidence = np.zeros(len(y2))
+    weights = np.zeros(len(y2))
+    for i, year2 in enumerate(y2):
+        if not datesDiffer[i]:
+            continue
+        swapped = (m1 == d2[i]) and (m2[i] == d1)
+        if y1 != year2:
+            weights[i] = weight
+        elif swapped:
+            confidence[i] = 100.0
+            weights[i] = weight
+    return (confidence, weights)
+
+
+if njit is not None:
+    EqualKernel = njit(EqualKernel)
+    NearYearKernel = njit(NearYearKernel)
+    NearMonthKernel = njit(NearMonthKernel)
+    YearSwapKernel = njit(YearSwapKernel)
+    DayMonthSwapKernel = njit(DayMonthSwapKernel)
+
+
+# Edge case birthdates for checking that the compiled kernels agree with the NumPy expressions - no birthdate, 29 February,
+# the ends of months and years, swapped years, swapped days and months and birthdates that are equal to each other
+KernelBirthdates = ['', '2000-02-29', '2004-02-29', '1999-02-28', '2000-03-01', '2001-02-28', '2001-03-01', '1999-12-31', '2000-01-01', '2000-12-31',
+                    '1982-11-12', '1982-12-11', '1928-11-12', '1982-11-15', '1928-11-15', '1981-11-12', '1984-08-09', '1981-08-09', '1982-01-01', '1982-01-01']
+
+
+def KernelsAgree():
+    '''
+Check that each compiled (Numba) kernel gives exactly the same confidences and weights as the NumPy expressions that it replaces,
+for every pair of the edge case birthdates (KernelBirthdates), with a range of parameters
+Returns the names of the kernels that disagree
+    '''
+
+    cols = np.zeros((len(KernelBirthdates), OTHER), dtype=np.int64)
+    for i, birthdate in enumerate(KernelBirthdates):
+        if birthdate != '':
+            (year, month, day) = (int(part) for part in birthdate.split('-'))
+            cols[i, YEAR:DOB + 1] = (year, month, day, year * 10000 + month * 100 + day)
+    codes = np.arange(len(KernelBirthdates), dtype=np.int64) % 4
+    disagree = set()
+    for row in cols:
+        if row[DOB] == 0:
+            datesDiffer = np.zeros(len(cols), dtype=bool)
+        else:
+            datesDiffer = (cols[:, DOB] != 0) & (cols[:, DOB] != row[DOB])
+        checks = [('EqualKernel', EqualColumn, (code, codes, 5.0)) for code in range(4)]
+        checks += [('NearYearKernel', NearYearColumn, (row, cols, datesDiffer, param, 2.0)) for param in range(4)]
+        checks += [('NearMonthKernel', NearMonthColumn, (row, cols, datesDiffer, param, 3.0)) for param in range(14)]
+        checks += [('YearSwapKernel', YearSwapColumn, (row, cols, datesDiffer, 2.0)), ('DayMonthSwapKernel', DayMonthSwapColumn, (row, cols, datesDiffer, 5.0))]
+        for (kernel, column, args) in checks:
+            d.VectorKernels = False
+            (confidence, weight) = column(*args)
+            d.VectorKernels = True
+            (kernelConfidence, kernelWeight) = column(*args)
+            if not (np.array_equal(confidence, kernelConfidence) and np.array_equal(weight, kernelWeight)):
+                disagree.add(kernel)
+    d.VectorKernels = False
+    return sorted(disagree)
+
+
+def SelectKernels():
+    '''
+Use the compiled (Numba) kernels if Numba is installed and the kernels agree exactly with the NumPy expressions (see KernelsAgree)
+    '''
+
+    d.VectorKernels = False
+    if njit is None:
+        return
+    disagree = KernelsAgree()
+    if len(disagree) > 0:
+        logging.warning('The compiled (Numba) kernels %s do not agree with the NumPy expressions - using the NumPy expressions', ', '.join(disagree))
+        return
+    d.VectorKernels = True
+    logging.info('Using the compiled (Numba) kernels')
+
+
+def VectorMatches(row, table, positions, skipIdentical, skipNoWeight):
+    '''
+Score one encoded record (row) against the records in the table at positions (a slice or an array of row numbers)
+The routines are applied in the same order, with the same rules, as the compiled Extensive checking routines in functions.py (ExtensiveScorer)
+skipIdentical skips records with an identical family name, given name, birthdate and sex
+skipNoWeight skips records where no checking routine returned a weight
+Returns the list of [recNo, totalConfidence, soundFamilyNameConfidence, soundGivenNameConfidence] for records at or above ExtensiveConfidence, plus the count of records compared
+    '''
+
+    cols = table.array[positions]
+    recNos = table.recNos[positions]
+    if skipIdentical:
+        different = (cols[:, FN] != row[FN]) | (cols[:, GN] != row[GN]) | (cols[:, DOB] != row[DOB]) | (cols[:, SEX] != row[SEX])
+        cols = cols[different]
+        recNos = recNos[different]
+    count = len(recNos)
+    if count == 0:
+        return ([], 0)
+
+    fnSound = SoundColumn(row[FN], row[FNID], cols[:, FN], cols[:, FNID])
+    gnSound = SoundColumn(row[GN], row[GNID], cols[:, GN], cols[:, GNID])
+    if row[DOB] == 0:
+        datesDiffer = np.zeros(count, dtype=bool)
+    else:
+        datesDiffer = (cols[:, DOB] != 0) & (cols[:, DOB] != row[DOB])
+
+    totalConfidence = np.zeros(count)
+    totalWeight = np.zeros(count)
+    for coreRoutine, (thisWeight, thisParam) in d.ExtensiveRoutines.items():
+        if coreRoutine == 'FamilyName':
+            (confidence, weight) = EqualColumn(row[FN], cols[:, FN], thisWeight)
+        elif coreRoutine == 'FamilyNameSound':
+            confidence = fnSound
+            weight = np.where((cols[:, FN] != row[FN]) & (cols[:, FN] != 0) & (row[FN] != 0), thisWeight, 0.0)
+        elif coreRoutine == 'GivenName':
+            (confidence, weight) = EqualColumn(row[GN], cols[:, GN], thisWeight)
+        elif coreRoutine == 'GivenNameSound':
+            confidence = gnSound
+            weight = np.where((cols[:, GN] != row[GN]) & (cols[:, GN] != 0) & (row[GN] != 0), thisWeight, 0.0)
+        elif coreRoutine == 'MiddleNames':
+            if not d.useMiddleNames:
+                continue
+            (confidence, weight) = EqualColumn(row[MN], cols[:, MN], thisWeight)
+        elif coreRoutine == 'MiddleNamesInitial':
+            if not d.useMiddleNames:
+                continue
+            (confidence, weight) = EqualColumn(row[MI], cols[:, MI], thisWeight)
+        elif coreRoutine == 'Sex':
+            (confidence, weight) = EqualColumn(row[SEX], cols[:, SEX], thisWeight)
+        elif coreRoutine == 'Birthdate':
+            (confidence, weight) = EqualColumn(row[DOB], cols[:, DOB], thisWeight)
+        elif coreRoutine == 'BirthdateNearYear':
+            (confidence, weight) = NearYearColumn(row, cols, datesDiffer, thisParam, thisWeight)
+        elif coreRoutine == 'BirthdateNearMonth':
+            (confidence, weight) = NearMonthColumn(row, cols, datesDiffer, thisParam, thisWeight)
+        elif coreRoutine == 'BirthdateNearDay':
+            future = d.futureBirthdate.toordinal()
+            valid = (cols[:, ORDINAL] != future) & (cols[:, ORDINAL] != row[ORDINAL]) & (row[ORDINAL] != future)
+            confidence = np.where(valid & (np.abs(cols[:, ORDINAL] - row[ORDINAL]) < thisParam), 100.0, 0.0)
+            weight = np.where(valid, thisWeight, 0.0)
+        elif coreRoutine == 'BirthdateYearSwap':
+            (confidence, weight) = YearSwapColumn(row, cols, datesDiffer, thisWeight)
+        elif coreRoutine == 'BirthdateDayMonthSwap':
+            (confidence, weight) = DayMonthSwapColumn(row, cols, datesDiffer, thisWeight)
+        else:
+            continue
+        totalConfidence += np.where(weight > 0, confidence * weight, 0.0)
+        totalWeight += np.where(weight > 0, weight, 0.0)
+
+    # Then the things that just need matching
+    for i, field in enumerate(sorted(d.ExtensiveFields.keys())):
+        thisWeight = d.ExtensiveFields[field]
+        if thisWeight > 0:
+            col = OTHER + i
+            if row[col] != 0:
+                valid = cols[:, col] != 0
+                totalConfidence += np.where(valid, np.where(cols[:, col] == row[col], 100.0, 0.0) * thisWeight, 0.0)
+                totalWeight += np.where(valid, thisWeight, 0.0)
+
+    # Compute the total confidence
+    weighted = totalWeight > 0
+    totalConfidence = np.where(weighted, totalConfidence / np.where(weighted, totalWeight, 1.0), totalConfidence)
+    wanted = totalConfidence >= d.ExtensiveConfidence
+    if skipNoWeight:
+        wanted &= weighted
+    fnSound = np.where(cols[:, FN] == row[FN], 100.0, fnSound)
+    gnSound = np.where(cols[:, GN] == row[GN], 100.0, gnSound)
+    matches = []
+    for recNo, confidence, fnConfidence, gnConfidence in zip(recNos[wanted].tolist(), totalConfidence[wanted].tolist(), fnSound[wanted].tolist(), gnSound[wanted].tolist()):
+        matches.append([recNo, confidence, fnConfidence, gnConfidence])
+    return (matches, count)
+
+
+def FeatureArray(fileName, pairs, features):
+    '''
+Map the pairs saved in a pair feature cache (see functions.FeatureOpen) as a structured array, which is read from disk as it is used
+    '''
+
+    dtype = np.dtype([('rec1', '<u4'), ('rec2', '<u4'), ('fnSound', '<f8'), ('gnSound', '<f8'), ('confidence', '<f8', (features,)), ('applicable', 'u1', (features,))])
+    if pairs == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fileName, dtype=dtype, mode='r', offset=len(d.FeatureMagic) + 8, shape=(pairs,))
+
+
+def FeatureRescore(block, weights, bins):
+    '''
+Re-score a block of pairs from a pair feature cache with new weights (one for each saved feature)
+The features are summed in saved order, with the same rules as the compiled Extensive checking routines (functions.ExtensiveScorer),
+so re-scoring with the weights that the cache was saved with gives the same confidences
+Returns the total confidence and the total weight of each pair, plus the number of pairs with a weight in each of the 'bins' bins of the confidence histogram
+    '''
+
+    totalConfidence = np.zeros(len(block))
+    totalWeight = np.zeros(len(block))
+    for i, weight in enumerate(weights):
+        if weight > 0:
+            applies = block['applicable'][:, i] != 0
+            totalConfidence += np.where(applies, block['confidence'][:, i] * weight, 0.0)
+            totalWeight += np.where(applies, weight, 0.0)
+    weighted = totalWeight > 0
+    totalConfidence = np.where(weighted, totalConfidence / np.where(weighted, totalWeight, 1.0), totalConfidence)
+    histogram = np.bincount(np.minimum((totalConfidence[weighted] // d.SampleBinWidth).astype(np.int64), bins - 1), minlength=bins)
+    return (totalConfidence, totalWeight, histogram.tolist())